@@ -18,6 +18,7 @@ from datetime import datetime
 from argparse import ArgumentParser, Action
 import pkg_resources
 from . import *
+from . import _util
 from ._util import (
     provision_run_dir,
     write_values_json,
@@ -321,6 +322,78 @@ def fill_run_subparser(subparsers):
         action="store_true",
         help="increase logging detail & stream tasks' stderr",
     )
+    run_parser.add_argument(
+        "--warm-containers",
+        metavar="N",
+        type=int,
+        default=0,
+        help="run task commands in a pool of up to N warm containers per docker image, instead of a new container for each task; speeds up many short tasks, but doesn't enforce runtime.cpu or runtime.memory",
+    )
+    run_parser.add_argument(
+        "--warm-container-uses",
+        metavar="K",
+        type=int,
+        default=100,
+        help="with --warm-containers, recycle each container after running K tasks (default 100)",
+    )
+    run_parser.add_argument(
+        "--task-pack",
+        metavar="K",
+        type=int,
+        default=1,
+        help="pack up to K ready calls of the same task (e.g. scatter shards) into one container, with matching docker image & runtime resources; each keeps its own working directory, standard output/error, and exit status (tasks specifying runtime.maxRetries aren't packed)",
+    )
+    run_parser.add_argument(
+        "--task-pack-parallel",
+        action="store_true",
+        help="with --task-pack, run the packed commands concurrently within their container (reserving the sum of their runtime.cpu and runtime.memory)",
+    )
+    run_parser.add_argument(
+        "--hash-outputs",
+        action="store_true",
+        help="compute SHA-256 digests of each task's output files, recorded in outputs.manifest.json alongside its outputs.json",
+    )
+    run_parser.add_argument(
+        "--max-retries",
+        metavar="N",
+        type=int,
+        default=0,
+        help="retry each failed task command up to N times (except if it ran out of memory), unless the task specifies runtime.maxRetries (default 0)",
+    )
+    run_parser.add_argument(
+        "--transient-retries",
+        metavar="N",
+        type=int,
+        default=0,
+        help="additionally retry tasks up to N times after transient container infrastructure failures, such as docker API timeouts (default 0)",
+    )
+    run_parser.add_argument(
+        "--no-value-provenance",
+        dest="value_provenance",
+        action="store_false",
+        help="don't record the originating WDL expression of each runtime value (reduces memory use in large workflows, but some error messages are less specific)",
+    )
+    run_parser.add_argument(
+        "--no-expression-compiler",
+        dest="compiled_eval",
+        action="store_false",
+        help="evaluate WDL expressions by interpreting their syntax trees, instead of compiling each into a Python closure on first use (slower; for troubleshooting)",
+    )
+    run_parser.add_argument(
+        "--compact-json",
+        action="store_true",
+        help="write the inputs.json and outputs.json files of the run and of each call without indentation or whitespace",
+    )
+    run_parser.add_argument(
+        "--compact-file-arrays",
+        action="store_true",
+        help="store large arrays of File paths compactly, sharing their directory prefixes (reduces memory use in workflows processing many files)",
+    )
+    run_parser.add_argument(
+        "--profile-expressions",
+        action="store_true",
+        help="profile the evaluation of WDL expressions & function calls, logging the most time-consuming at the end of the run and of each call, with full reports in profile.json in their run directories",
+    )
     # TODO:
     # way to specify None for an optional value (that has a default)
     return run_parser
@@ -336,8 +409,22 @@ def runner(
     task=None,
     rundir=None,
     path=None,
+    warm_containers=0,
+    warm_container_uses=100,
+    task_pack=1,
+    task_pack_parallel=False,
+    hash_outputs=False,
+    max_retries=0,
+    transient_retries=0,
+    value_provenance=True,
+    compiled_eval=True,
+    compact_json=False,
+    compact_file_arrays=False,
+    profile_expressions=False,
     **kwargs,
 ):
+    Value.compact_file_arrays = compact_file_arrays
+
     # load WDL document
     doc = load(uri, path or [], check_quant=check_quant, read_source=read_source)
 
@@ -351,6 +438,12 @@ def runner(
     if rundir and os.path.isfile(rundir):
         die("--dir must be an existing directory or one that can be created")
 
+    if task_pack > 1 and (max_retries or transient_retries or warm_containers):
+        die(
+            "--task-pack can't be combined with --max-retries, --transient-retries, or"
+            " --warm-containers (packed tasks aren't retried, nor run in warm containers)"
+        )
+
     level = NOTICE_LEVEL
     if kwargs["verbose"]:
         level = VERBOSE_LEVEL
@@ -364,17 +457,50 @@ def runner(
         logger.debug(pkg_resources.get_distribution("miniwdl"))
     except pkg_resources.DistributionNotFound as exc:
         logger.debug("miniwdl version unknown ({}: {})".format(type(exc).__name__, exc))
-    for pkg in ["docker", "lark-parser", "argcomplete", "pygtail"]:
+    for pkg in ["docker", "lark-parser", "argcomplete"]:
         logger.debug(pkg_resources.get_distribution(pkg))
     logger.debug("dockerd: " + str(docker.from_env().version()))
 
     ensure_swarm(logger)
 
-    try:
-        entrypoint = (
-            runtime.run_local_task if isinstance(target, Task) else runtime.run_local_workflow
+    retry_policy = runtime.task.RetryPolicy(max_retries, transient_retries)
+    Expr.value_provenance = value_provenance
+    Expr.compiled_eval = compiled_eval
+    Expr.profiler = Expr.Profiler() if profile_expressions else None
+    _util.values_json_compact = compact_json
+    container_pool = None
+    if warm_containers > 0:
+        # keep the pool's scratch directory on the run directory's filesystem, so that input files
+        # can be hard-linked into it and task working directories moved out of it
+        pool_parent = os.path.abspath(rundir or os.getcwd())
+        while not os.path.isdir(pool_parent):
+            pool_parent = os.path.dirname(pool_parent)
+        container_pool = runtime.task.ContainerPool(
+            warm_containers,
+            warm_container_uses,
+            scratch_dir=tempfile.mkdtemp(prefix=".miniwdl_pool_", dir=pool_parent),
         )
-        rundir, output_env = entrypoint(target, input_env, run_dir=rundir)
+    try:
+        if isinstance(target, Task):
+            rundir, output_env = runtime.run_local_task(
+                target,
+                input_env,
+                run_dir=rundir,
+                container_pool=container_pool,
+                hash_outputs=hash_outputs,
+                retry_policy=retry_policy,
+            )
+        else:
+            rundir, output_env = runtime.run_local_workflow(
+                target,
+                input_env,
+                run_dir=rundir,
+                container_pool=container_pool,
+                task_pack=task_pack,
+                task_pack_parallel=task_pack_parallel,
+                hash_outputs=hash_outputs,
+                retry_policy=retry_policy,
+            )
     except Exception as exn:
         if isinstance(exn, runtime.task.TaskFailure):
             exn = exn.__cause__ or exn
@@ -399,6 +525,9 @@ def runner(
         if kwargs["debug"]:
             raise
         sys.exit(2)
+    finally:
+        if container_pool:
+            container_pool.close()
 
     # link output files
     outputs_json = values_to_json(output_env, namespace=target.name)
@@ -482,8 +611,8 @@ def runner_input(doc, inputs, input_file, empty, task=None):
     # first load input JSON file if any
     if input_file:
         with open(input_file) as infile:
-            input_env = values_from_json(
-                json.loads(infile.read()),
+            input_env = values_from_json_file(
+                infile,
                 available_inputs,
                 namespace=(target.name if isinstance(target, Workflow) else ""),
             )
@@ -585,16 +714,7 @@ def is_constant_expr(expr):
     """
     Decide if the expression is "constant" for the above purposes
     """
-    if isinstance(expr, (Expr.Int, Expr.Float, Expr.Boolean)):
-        return True
-    if isinstance(expr, Expr.String) and (
-        len(expr.parts) == 2 or (len(expr.parts) == 3 and isinstance(expr.parts[1], str))
-    ):
-        return True
-    if isinstance(expr, Expr.Array):
-        return not [item for item in expr.items if not is_constant_expr(item)]
-    # TODO: Pair, Map, Struct???
-    return False
+    return expr.constant is not None
 
 
 def runner_input_value(s_value, ty):
@@ -645,7 +765,10 @@ def runner_organize_outputs(target, outputs_json, rundir):
     outputs_json["dir"] = rundir
     print(json.dumps(outputs_json, indent=2))
     with open(os.path.join(rundir, "outputs.json"), "w") as outfile:
-        print(json.dumps(outputs_json, indent=2), file=outfile)
+        if _util.values_json_compact:
+            print(json.dumps(outputs_json, separators=(",", ":")), file=outfile)
+        else:
+            print(json.dumps(outputs_json, indent=2), file=outfile)
 
     os.makedirs(os.path.join(rundir, "output_links"), exist_ok=False)
 
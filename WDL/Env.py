@@ -2,7 +2,7 @@
 """
 Environments, for identifier resolution during WDL typechecking and evaluation.
 """
-from typing import Optional, TypeVar, Generic, Any, Callable, Union, Set, Iterator
+from typing import Optional, TypeVar, Generic, Any, Callable, Union, Set, Iterator, Tuple, List
 
 T = TypeVar("T")
 S = TypeVar("S")
@@ -54,6 +54,140 @@ class _EmptyNamespace:
         self.namespace = namespace
 
 
+class _HAMTNode:
+    # interior node of a hash array mapped trie: a bitmap of occupied slots (one per 5-bit chunk
+    # of the key hash at this depth) & a dense tuple of the corresponding entries, each either a
+    # (key, value) leaf tuple, or a child _HAMTNode or _HAMTCollision
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap: int, entries: Tuple[Any, ...]) -> None:
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _HAMTCollision:
+    # leaves whose keys have identical (full) hashes
+    __slots__ = ("hash", "entries")
+
+    def __init__(self, hash: int, entries: Tuple[Tuple[str, Any], ...]) -> None:
+        self.hash = hash
+        self.entries = entries
+
+
+_HAMT_BITS = 5
+_HAMT_MASK = (1 << _HAMT_BITS) - 1
+_HAMT_HASH_MASK = (1 << 64) - 1
+
+
+def _hamt_hash(key: str) -> int:
+    return hash(key) & _HAMT_HASH_MASK
+
+
+def _popcount(x: int) -> int:
+    return bin(x).count("1")
+
+
+class _HAMT(Generic[T]):
+    # Persistent (immutable) hash array mapped trie from str keys to values, which Bindings uses
+    # to index names & namespaces. set() returns a new trie, sharing all but the O(log n) nodes
+    # along the path to the new entry.
+    __slots__ = ("_root", "_size")
+
+    _root: _HAMTNode
+    _size: int
+
+    def __init__(self, root: Optional[_HAMTNode] = None, size: int = 0) -> None:
+        self._root = root if root is not None else _HAMTNode(0, ())
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get(self, key: str, default: Optional[T] = None) -> Optional[T]:
+        h = _hamt_hash(key)
+        node: Any = self._root
+        shift = 0
+        while True:
+            if node.__class__ is _HAMTCollision:
+                for k, v in node.entries:
+                    if k == key:
+                        return v
+                return default
+            bit = 1 << ((h >> shift) & _HAMT_MASK)
+            if not node.bitmap & bit:
+                return default
+            entry = node.entries[_popcount(node.bitmap & (bit - 1))]
+            if entry.__class__ is tuple:
+                return entry[1] if entry[0] == key else default
+            node = entry
+            shift += _HAMT_BITS
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def set(self, key: str, value: T) -> "_HAMT[T]":
+        assert value is not None
+        root, added = _hamt_assoc(self._root, 0, _hamt_hash(key), key, value)
+        if root is self._root:
+            return self
+        return _HAMT(root, self._size + 1 if added else self._size)
+
+    def keys(self) -> Iterator[str]:
+        stack: List[Any] = [self._root]
+        while stack:
+            node = stack.pop()
+            for entry in node.entries:
+                if entry.__class__ is tuple:
+                    yield entry[0]
+                else:
+                    stack.append(entry)
+
+
+def _hamt_assoc(node: Any, shift: int, h: int, key: str, value: Any) -> Tuple[Any, bool]:
+    # return node with key set to value (possibly node itself, if unchanged), and whether the key
+    # is new
+    if node.__class__ is _HAMTCollision:
+        if h != node.hash:
+            # split: push the collision down alongside the new leaf
+            return _hamt_pair(shift, node, node.hash, (key, value), h), True
+        entries = tuple(e for e in node.entries if e[0] != key)
+        return (
+            _HAMTCollision(h, entries + ((key, value),)),
+            len(entries) == len(node.entries),
+        )
+    bit = 1 << ((h >> shift) & _HAMT_MASK)
+    idx = _popcount(node.bitmap & (bit - 1))
+    entries = node.entries
+    if not node.bitmap & bit:
+        return _HAMTNode(node.bitmap | bit, entries[:idx] + ((key, value),) + entries[idx:]), True
+    entry = entries[idx]
+    if entry.__class__ is tuple:
+        if entry[0] == key:
+            if entry[1] is value:
+                return node, False
+            new, added = (key, value), False
+        else:
+            new = _hamt_pair(shift + _HAMT_BITS, entry, _hamt_hash(entry[0]), (key, value), h)
+            added = True
+    else:
+        new, added = _hamt_assoc(entry, shift + _HAMT_BITS, h, key, value)
+        if new is entry:
+            return node, False
+    return _HAMTNode(node.bitmap, entries[:idx] + (new,) + entries[idx + 1 :]), added
+
+
+def _hamt_pair(shift: int, entry1: Any, h1: int, entry2: Tuple[str, Any], h2: int) -> Any:
+    # make a node holding entry1 (a leaf or collision) & the leaf entry2, given their hashes
+    if h1 == h2:
+        assert entry1.__class__ is tuple
+        return _HAMTCollision(h1, (entry1, entry2))
+    i1 = (h1 >> shift) & _HAMT_MASK
+    i2 = (h2 >> shift) & _HAMT_MASK
+    if i1 == i2:
+        return _HAMTNode(1 << i1, (_hamt_pair(shift + _HAMT_BITS, entry1, h1, entry2, h2),))
+    return _HAMTNode((1 << i1) | (1 << i2), (entry1, entry2) if i1 < i2 else (entry2, entry1))
+
+
 class Bindings(Generic[T]):
     """WDL.Env.Bindings(binding: Optional[WDL.Env.Binding[T]] = None, next: Optional[WDL.Env.Bindings[T]] = None)
 
@@ -66,11 +200,18 @@ class Bindings(Generic[T]):
         print(env["x"])                             # 1
         print(",".join(str(b.value) for b in env))  # 1,42
 
+    Names and namespaces are indexed by a persistent hash trie, built upon first lookup and shared
+    among environments extending one another, so ``resolve``, ``in``, ``len`` and
+    ``has_namespace`` are O(log n), and ``enter_namespace`` is proportional to the size of the
+    namespace rather than of the whole environment.
     """
 
     _binding: Union[None, Binding[T], _EmptyNamespace]
     _next: "Optional[Bindings[T]]"
-    _namespaces: Optional[Set[str]] = None
+    # name => unshadowed binding, and namespace => chain of the bindings in it (newest first, as
+    # nested (binding, rest) tuples ending with ()), built upon first use
+    _index: "Optional[_HAMT[Binding[T]]]" = None
+    _namespace_index: "Optional[_HAMT[Tuple[Any, ...]]]" = None
 
     def __init__(
         self,
@@ -82,6 +223,8 @@ class Bindings(Generic[T]):
         self._next = next
 
     def __bool__(self) -> bool:
+        if self._index is not None:
+            return len(self._index) > 0
         return next(self.__iter__(), None) is not None
 
     def __iter__(self) -> Iterator[Binding[T]]:
@@ -101,8 +244,36 @@ class Bindings(Generic[T]):
                 yield pos._binding.namespace
             pos = pos._next
 
+    def _build_index(self) -> None:
+        # extend the indices of the nearest already-indexed node down the list with the bindings
+        # in front of it, caching the intermediate indices on each node along the way
+        pending = []
+        pos = self
+        while pos is not None and pos._index is None:
+            pending.append(pos)
+            pos = pos._next
+        index = pos._index if pos is not None else _HAMT()
+        namespaces = pos._namespace_index if pos is not None else _HAMT()
+        assert index is not None and namespaces is not None
+        for node in reversed(pending):
+            b = node._binding
+            if isinstance(b, Binding):
+                index = index.set(b.name, b)
+                dot = b.name.find(".")
+                while dot >= 0:
+                    ns = b.name[: dot + 1]
+                    namespaces = namespaces.set(ns, (b, namespaces.get(ns, ())))
+                    dot = b.name.find(".", dot + 1)
+            elif isinstance(b, _EmptyNamespace) and b.namespace not in namespaces:
+                namespaces = namespaces.set(b.namespace, ())
+            node._index = index
+            node._namespace_index = namespaces
+
     def __len__(self) -> int:
-        return sum(1 for _ in self)
+        if self._index is None:
+            self._build_index()
+        assert self._index is not None
+        return len(self._index)
 
     def bind(self, name: str, value: T, info: Any = None) -> "Bindings[T]":  # pyre-ignore
         """
@@ -118,10 +289,13 @@ class Bindings(Generic[T]):
 
         :raise KeyError: no such binding
         """
-        for b in self:
-            if b.name == name:
-                return b
-        raise KeyError()
+        if self._index is None:
+            self._build_index()
+        assert self._index is not None
+        ans = self._index.get(name)
+        if ans is None:
+            raise KeyError(name)
+        return ans
 
     def resolve(self, name: str) -> T:
         """
@@ -138,11 +312,10 @@ class Bindings(Generic[T]):
         """
         Determine existence of a binding for the name. Equivalently, ``name in env``
         """
-        try:
-            self.resolve(name)
-            return True
-        except KeyError:
-            return False
+        if self._index is None:
+            self._build_index()
+        assert self._index is not None
+        return name in self._index
 
     def __contains__(self, name: str) -> bool:
         if isinstance(name, str):
@@ -154,28 +327,15 @@ class Bindings(Generic[T]):
         Copy the environment with each binding transformed by the given function. If the function
         returns ``None`` then the binding is excluded.
         """
-        ans = Bindings()
-        for b in self:
-            fb = f(b)
-            if isinstance(fb, Binding):
-                ans = Bindings(fb, ans)
-        return _rev(ans)
+        return _build([fb for fb in (f(b) for b in self) if isinstance(fb, Binding)])
 
     def filter(self, pred: Callable[[Binding[T]], bool]) -> "Bindings[T]":
         "Copy the environment with only those bindings for which ``pred`` returns True"
-        return self.map(lambda b: b if pred(b) else None)
+        return _build([b for b in self if pred(b)])
 
     def subtract(self, rhs: "Bindings[S]") -> "Bindings[T]":
         "Copy the environment excluding any binding for which ``rhs`` has a binding with the same name"
-
-        def flt(b: Binding[T]) -> bool:
-            try:
-                rhs.resolve(b.name)
-                return False
-            except KeyError:
-                return True
-
-        return self.filter(flt)
+        return self.filter(lambda b: not rhs.has_binding(b.name))
 
     @property
     def namespaces(self) -> Set[str]:
@@ -184,24 +344,20 @@ class Bindings(Generic[T]):
         Return the environment's namespaces, all the distinct dot-separated prefixes of the binding
         names. Each element ends with a dot.
         """
-        if self._namespaces is None:
-            self._namespaces = self._next.namespaces if self._next is not None else set()
-            if isinstance(self._binding, _EmptyNamespace):
-                self._namespaces.add(self._binding.namespace)
-            if isinstance(self._binding, Binding):
-                names = self._binding.name.split(".")
-                if len(names) > 1:
-                    for i in range(len(names) - 1):
-                        ns = ".".join(names[: i + 1]) + "."
-                        self._namespaces.add(ns)
-        return self._namespaces.copy()
+        if self._namespace_index is None:
+            self._build_index()
+        assert self._namespace_index is not None
+        return set(self._namespace_index.keys())
 
     def has_namespace(self, namespace: str) -> bool:
         "Determine existence of a namespace in the environment"
         assert namespace
         if not namespace.endswith("."):
             namespace += "."
-        return namespace in (self._namespaces if self._namespaces else self.namespaces)
+        if self._namespace_index is None:
+            self._build_index()
+        assert self._namespace_index is not None
+        return namespace in self._namespace_index
 
     def enter_namespace(self, namespace: str) -> "Bindings[T]":
         """
@@ -211,31 +367,36 @@ class Bindings(Generic[T]):
         assert namespace
         if not namespace.endswith("."):
             namespace += "."
-
-        def enter(b: Binding[T]) -> Optional[Binding[T]]:
-            if b.name.startswith(namespace):
-                return Binding(b.name[len(namespace) :], b.value, b.info)
-            return None
-
-        return self.map(enter)
+        if self._namespace_index is None:
+            self._build_index()
+        assert self._namespace_index is not None
+        chain = self._namespace_index.get(namespace, ())
+        items = []
+        mask = set()
+        n = len(namespace)
+        while chain:
+            b, chain = chain
+            if b.name not in mask:
+                mask.add(b.name)
+                items.append(Binding(b.name[n:], b.value, b.info))
+        return _build(items)
 
     def wrap_namespace(self, namespace: str) -> "Bindings[T]":
         "Copy the environment with the given namespace prefixed to each binding name"
         assert namespace
         if not namespace.endswith("."):
             namespace += "."
-        ans = Bindings()
+        items: List[Union[Binding[T], _EmptyNamespace]] = []
         pos = self
         while pos is not None:
             if isinstance(pos._binding, Binding):
-                ans = Bindings(
-                    Binding(namespace + pos._binding.name, pos._binding.value, pos._binding.info),
-                    ans,
+                items.append(
+                    Binding(namespace + pos._binding.name, pos._binding.value, pos._binding.info)
                 )
             if isinstance(pos._binding, _EmptyNamespace):
-                ans = Bindings(_EmptyNamespace(namespace + pos._binding.namespace), ans)
+                items.append(_EmptyNamespace(namespace + pos._binding.namespace))
             pos = pos._next
-        return _rev(ans.with_empty_namespace(namespace))
+        return _build(items, Bindings().with_empty_namespace(namespace))
 
     def with_empty_namespace(self, namespace: str) -> "Bindings[T]":
         """
@@ -254,13 +415,13 @@ class Bindings(Generic[T]):
         return ans
 
 
-def _rev(env: Bindings[T]) -> Bindings[T]:
-    ans = Bindings()
-    pos = env
-    while pos is not None:
-        if pos._binding:
-            ans = Bindings(pos._binding, ans)
-        pos = pos._next
+def _build(
+    items: List[Union[Binding[T], _EmptyNamespace]], tail: Optional[Bindings[T]] = None
+) -> Bindings[T]:
+    # make an environment from the given bindings (newest first) prepended onto tail, in one pass
+    ans = tail if tail is not None else Bindings()
+    for item in reversed(items):
+        ans = Bindings(item, ans)
     return ans
 
 
@@ -269,17 +430,14 @@ def merge(*args: Bindings[T]) -> Bindings[T]:
     Merge several ``Bindings[T]`` environments into one. For efficiency, the largest environment
     should be supplied as the last argument.
     """
-    ans = [args[-1] if args else Bindings()]
+    # The last environment is shared as-is, including its index (if built already), which the
+    # merged environment's index extends.
+    ans = args[-1] if args else Bindings()
     empty_namespaces = set()
-
-    def visit(b: Binding[T]) -> None:
-        ans[0] = Bindings(b, ans[0])
-
     for env in reversed(args[:-1]):
         assert isinstance(env, Bindings)
-        for b in _rev(env):
-            visit(b)
+        ans = _build(list(env), ans)
         empty_namespaces |= set(env._empty_namespaces)
     for ns in empty_namespaces:
-        ans[0] = Bindings(_EmptyNamespace(ns), ans[0])
-    return ans[0]
+        ans = Bindings(_EmptyNamespace(ns), ans)
+    return ans
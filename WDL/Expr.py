@@ -11,11 +11,171 @@ given a suitable ``WDL.Env.Bindings[Value.Base]``.
 
 .. inheritance-diagram:: WDL.Expr
 """
+import time
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Tuple, Union, Iterable
+from typing import List, Optional, Dict, Tuple, Union, Iterable, Callable, Any
 from .Error import SourcePosition, SourceNode
 from . import Type, Value, Env, Error, StdLib
 
+value_provenance: bool = True
+"""
+Whether ``eval()`` records on each value it produces the expression that generated it
+(``WDL.Value.Base.expr``), used for more-specific runtime error messages. May be set to ``False``
+to skip that, so that values held at runtime don't keep expression trees reachable.
+"""
+
+compiled_eval: bool = True
+"""
+Whether ``eval()`` runs each expression through the closure compiled from it on first use (see
+:meth:`Base.compile`), instead of interpreting its syntax tree. The two evaluate identically; set to
+``False`` to use the interpreter.
+"""
+
+constant_folding: bool = True
+"""
+Whether ``infer_type()`` evaluates each constant expression once, for ``eval()`` to return the
+resulting value (see :attr:`Base.constant`). Affects expressions typechecked subsequently.
+"""
+
+constant_folding_limit: int = 10000
+"""
+Constant expressions whose values would comprise more than this many scalar values aren't folded
+(but evaluated as usual), bounding the time & memory typechecking spends on them.
+"""
+
+profiler: "Optional[Profiler]" = None
+"""
+When set to a :class:`Profiler`, ``eval()`` records in it the time taken & size of the result of
+each expression evaluation (not separately for each subexpression), and of each function
+application within (excluding the function applications nested in its arguments). For diagnosing
+slow expressions; evaluation itself is slower meanwhile.
+"""
+
+
+class Profiler:
+    """
+    Evaluation statistics aggregated by source position: for each expression evaluated and each
+    function application, the number of evaluations, their cumulative time, and the cumulative size
+    of their results (the number of scalar values within). A function application's time excludes
+    that of any other function applications nested within it, e.g. in its arguments.
+    """
+
+    entries: "Dict[Tuple[SourcePosition, str], ProfilerEntry]"
+    """
+    :type: Dict[Tuple[WDL.Error.SourcePosition,str],ProfilerEntry]
+
+    entry for each expression (keyed by its position and ``""``) and each function application
+    (keyed by its position and the function name)
+    """
+
+    _busy: bool
+    _nested: float  # seconds spent in applications nested within the one being timed
+
+    def __init__(self) -> None:
+        self.entries = {}
+        self._busy = False
+        self._nested = 0.0
+
+    def record(self, expr: "Base", function_name: str, seconds: float, value: Value.Base) -> None:
+        """
+        Record an evaluation of the expression, or the application of the named function in it
+        """
+        key = (expr.pos, function_name)
+        entry = self.entries.get(key, None)
+        if entry is None:
+            entry = self.entries[key] = ProfilerEntry(
+                function_name + "()" if function_name else str(expr), expr.pos
+            )
+        entry.count += 1
+        entry.seconds += seconds
+        entry.size += _value_size(value)
+
+    def _apply(self, expr: "Apply", f: Callable[..., Value.Base], *args: Any) -> Value.Base:
+        # record the function application f(*args), excluding the time of the nested ones
+        outer = self._nested
+        self._nested = 0.0
+        t0 = time.perf_counter()
+        try:
+            ans = f(*args)
+        finally:
+            seconds = time.perf_counter() - t0
+            nested = self._nested
+            self._nested = outer + seconds
+        self.record(expr, expr.function_name, seconds - nested, ans)
+        return ans
+
+    def merge(self, other: "Profiler") -> None:
+        """
+        Add the statistics recorded by another profiler
+        """
+        for key, other_entry in other.entries.items():
+            entry = self.entries.get(key, None)
+            if entry is None:
+                entry = self.entries[key] = ProfilerEntry(other_entry.label, other_entry.pos)
+            entry.count += other_entry.count
+            entry.seconds += other_entry.seconds
+            entry.size += other_entry.size
+
+    @property
+    def report(self) -> "List[ProfilerEntry]":
+        """
+        :type: List[ProfilerEntry]
+
+        the entries in decreasing order of cumulative time
+        """
+        return sorted(self.entries.values(), key=lambda entry: (-entry.seconds, entry.label))
+
+
+class ProfilerEntry:
+    """
+    :class:`Profiler` statistics for one expression or function application
+    """
+
+    label: str
+    """
+    :type: str
+
+    the expression's source text, or the function's name followed by ``()``
+    """
+
+    pos: SourcePosition
+    count: int
+    seconds: float
+    size: int
+
+    def __init__(self, label: str, pos: SourcePosition) -> None:
+        self.label = label
+        self.pos = pos
+        self.count = 0
+        self.seconds = 0.0
+        self.size = 0
+
+    @property
+    def json(self) -> Dict[str, Any]:
+        """
+        :type: Dict[str,Any]
+
+        the entry as a JSON-serializable dict
+        """
+        return {
+            "label": self.label,
+            "uri": self.pos.uri,
+            "line": self.pos.line,
+            "column": self.pos.column,
+            "count": self.count,
+            "seconds": round(self.seconds, 6),
+            "size": self.size,
+        }
+
+
+def _value_size(v: Value.Base) -> int:
+    # number of scalar values within v
+    if isinstance(v, Value.Array) and isinstance(v.value, Value.PackedItems):
+        return len(v.value)
+    if isinstance(v, (Value.Array, Value.Map, Value.Pair, Value.Struct)):
+        return sum(_value_size(ch) for ch in v.children)
+    return 1
+
 
 class Base(SourceNode, ABC):
     """Superclass of all expression AST nodes"""
@@ -23,6 +183,8 @@ class Base(SourceNode, ABC):
     _type: Optional[Type.Base] = None
     _check_quant: bool = True
     _stdlib: "Optional[StdLib.Base]" = None
+    _compiled: Optional[Callable[..., Value.Base]] = None
+    _constant: Optional[Value.Base] = None
 
     @property
     def type(self) -> Type.Base:
@@ -37,6 +199,17 @@ class Base(SourceNode, ABC):
         assert self._type is not None
         return self._type
 
+    @property
+    def constant(self) -> Optional[Value.Base]:
+        """
+        :type: Optional[WDL.Value.Base]
+
+        If the expression is constant (composed only of literals and pure functions of them), its
+        value, computed once by ``infer_type``; otherwise ``None``. ``eval()`` then returns this
+        same value instead of re-evaluating the expression.
+        """
+        return self._constant
+
     @abstractmethod
     def _infer_type(self, type_env: Env.Bindings[Type.Base]) -> Type.Base:
         # Abstract protected method called by infer_type(): return the inferred
@@ -72,10 +245,30 @@ class Base(SourceNode, ABC):
         self._check_quant = check_quant
         self._stdlib = stdlib
         self._type = self._infer_type(type_env)
-        self._stdlib = None
         assert self._type and isinstance(self.type, Type.Base)
+        if constant_folding and self._foldable():
+            self._fold()
+        self._stdlib = None
         return self
 
+    def _foldable(self) -> bool:
+        # may be overridden by subclasses: whether the (typechecked) expression is constant given
+        # that its children are
+        return all(isinstance(ch, Base) and ch._constant is not None for ch in self.children)
+
+    def _fold(self) -> None:
+        # evaluate the constant expression once, with the stdlib it was typechecked against. If
+        # that fails, leave it to fail (with the same error) on each evaluation, as before.
+        try:
+            ans = self._eval(Env.Bindings(), self._stdlib)
+        except Exception:
+            return
+        if _value_size(ans) > constant_folding_limit:
+            return
+        if value_provenance:
+            ans.expr = self
+        self._constant = ans
+
     def typecheck(self, expected: Type.Base) -> "Base":
         """typecheck(self, expected : Type.Base) -> WDL.Expr.Base
 
@@ -105,15 +298,78 @@ class Base(SourceNode, ABC):
 
         :param stdlib: a context-specific standard function library implementation
         """
+        if self._constant is not None:
+            return self._constant
+        p = profiler
+        if p is not None and not p._busy:
+            # time the evaluation as a whole (not recording subexpression evaluations separately)
+            p._busy = True
+            t0 = time.perf_counter()
+            try:
+                ans = self.eval(env, stdlib)
+            finally:
+                p._busy = False
+            p.record(self, "", time.perf_counter() - t0, ans)
+            return ans
+        if compiled_eval:
+            return self.compile()(env, stdlib)
         try:
             ans = self._eval(env, stdlib)
-            ans.expr = self
+            if value_provenance:
+                ans.expr = self
             return ans
         except Error.RuntimeError:
             raise
         except Exception as exn:
             raise Error.EvalError(self, str(exn)) from exn
 
+    def compile(self) -> Callable[..., Value.Base]:
+        """
+        Compile the (typechecked) expression into a Python closure ``f(env, stdlib=None)``
+        equivalent to ``self.eval(env, stdlib)``, in which the dispatch on node & function types,
+        the decoding of literals, and the operand type computations are done once instead of on
+        each evaluation. The closure is memoized on the expression.
+        """
+        ans = self._compiled
+        if ans is None:
+            constant = self._constant
+            if constant is not None:
+                ans = self._compiled = lambda env, stdlib=None: constant
+            else:
+                ans = self._compiled = _compiled_node(self, self._compile())
+        return ans
+
+    def _compile(self) -> Callable[..., Value.Base]:
+        # may be overridden by subclasses: return a function f(env, stdlib) computing _eval(env,
+        # stdlib) in terms of the compiled child expressions. compile() adds the exception handling
+        # and provenance recording of eval(). By default, interpret the subtree.
+        return self._eval
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # omit the compiled closure (unpicklable; recompiled on demand)
+        state = dict(self.__dict__)
+        state.pop("_compiled", None)
+        return state
+
+
+def _compiled_node(expr: Base, body: Callable[..., Value.Base]) -> Callable[..., Value.Base]:
+    # wrap the compiled body of an expression with the exception handling & provenance recording
+    # of Base.eval()
+    def compiled(
+        env: Env.Bindings[Value.Base], stdlib: "Optional[StdLib.Base]" = None
+    ) -> Value.Base:
+        try:
+            ans = body(env, stdlib)
+            if value_provenance:
+                ans.expr = expr
+            return ans
+        except Error.RuntimeError:
+            raise
+        except Exception as exn:
+            raise Error.EvalError(expr, str(exn)) from exn
+
+    return compiled
+
 
 class Boolean(Base):
     """
@@ -143,6 +399,10 @@ class Boolean(Base):
         ""
         return Value.Boolean(self.value)
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        value = self.value
+        return lambda env, stdlib: Value.Boolean(value)
+
 
 class Int(Base):
     """
@@ -172,6 +432,10 @@ class Int(Base):
         ""
         return Value.Int(self.value)
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        value = self.value
+        return lambda env, stdlib: Value.Int(value)
+
 
 # Float literal
 
@@ -204,6 +468,10 @@ class Float(Base):
         ""
         return Value.Float(self.value)
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        value = self.value
+        return lambda env, stdlib: Value.Float(value)
+
 
 class Placeholder(Base):
     """Holds an expression interpolated within a string or command"""
@@ -289,23 +557,49 @@ class Placeholder(Base):
     ) -> Value.String:
         ""
         # override the + operator with the within-interpolation version which evaluates to None
-        # if either operand is None
+        # if either operand is None (unless the caller already did)
         stdlib = stdlib or StdLib.Base()
-        setattr(stdlib, "_add", StdLib.InterpolationAddOperator())
-        v = self.expr.eval(env, stdlib)
+        if not isinstance(getattr(stdlib, "_add", None), StdLib.InterpolationAddOperator):
+            setattr(stdlib, "_add", StdLib.InterpolationAddOperator())
+        return Value.String(self.format(self.expr.eval(env, stdlib)))
+
+    def _compile(self) -> Callable[..., Value.Base]:
+        inner = self.expr.compile()
+        format_value = self.format
+
+        def placeholder(
+            env: Env.Bindings[Value.Base], stdlib: "Optional[StdLib.Base]"
+        ) -> Value.Base:
+            # as in _eval, but sharing one default stdlib with the interpolation + operator
+            if stdlib is None:
+                stdlib = _interpolation_stdlib()
+            elif not isinstance(getattr(stdlib, "_add", None), StdLib.InterpolationAddOperator):
+                setattr(stdlib, "_add", StdLib.InterpolationAddOperator())
+            return Value.String(format_value(inner(env, stdlib)))
+
+        return placeholder
+
+    def format(self, v: Value.Base) -> str:
+        """
+        Stringify the value of the placeholder expression for interpolation, applying the
+        placeholder options
+        """
         if isinstance(v, Value.Null):
             if "default" in self.options:
-                return Value.String(self.options["default"])
-            return Value.String("")
+                return self.options["default"]
+            return ""
         if isinstance(v, Value.String):
-            return v
+            return v.value
         if isinstance(v, Value.Array):
-            return Value.String(self.options["sep"].join(str(item.value) for item in v.value))
-        if v == Value.Boolean(True) and "true" in self.options:
-            return Value.String(self.options["true"])
-        if v == Value.Boolean(False) and "false" in self.options:
-            return Value.String(self.options["false"])
-        return Value.String(str(v))
+            if isinstance(v.value, Value.PackedItems):
+                return self.options["sep"].join(str(x) for x in v.value.data)
+            return self.options["sep"].join(str(item.value) for item in v.value)
+        if isinstance(v, Value.Boolean):
+            if v.value and "true" in self.options:
+                return self.options["true"]
+            if not v.value and "false" in self.options:
+                return self.options["false"]
+        return str(v)
 
 
 class String(Base):
@@ -330,12 +624,16 @@ class String(Base):
     through for shell interpretation.
     """
 
+    _literals: Optional[List[Optional[str]]]
+    # literal parts with escape sequences decoded (None for placeholders), computed on first eval
+
     def __init__(
         self, pos: SourcePosition, parts: List[Union[str, Placeholder]], command: bool = False
     ) -> None:
         super().__init__(pos)
         self.parts = parts
         self.command = command
+        self._literals = None
 
     def __str__(self):
         parts = []
@@ -363,22 +661,58 @@ class String(Base):
         self, env: Env.Bindings[Value.Base], stdlib: "Optional[StdLib.Base]" = None
     ) -> Value.String:
         ""
+        literals = self._decode_literals()
+        if stdlib is None and len(literals) > 1:
+            # share one stdlib among the placeholders
+            stdlib = StdLib.Base()
         ans = []
-        for part in self.parts:
-            if isinstance(part, Placeholder):
+        for part, literal in zip(self.parts, literals):
+            if literal is None:
                 # evaluate interpolated expression & stringify
+                assert isinstance(part, Placeholder)
                 ans.append(part.eval(env, stdlib).value)
-            elif isinstance(part, str):
-                if self.command:
-                    ans.append(part)
-                else:
-                    # use python builtins to decode escape sequences
-                    ans.append(str.encode(part).decode("unicode_escape"))
             else:
-                assert False
+                ans.append(literal)
         # concatenate the stringified parts and trim the surrounding quotes
         return Value.String("".join(ans)[1:-1])
 
+    def _decode_literals(self) -> List[Optional[str]]:
+        literals = self._literals
+        if literals is None:
+            literals = []
+            for part in self.parts:
+                if isinstance(part, Placeholder):
+                    literals.append(None)
+                elif isinstance(part, str):
+                    # use python builtins to decode escape sequences (unless command)
+                    literals.append(
+                        part if self.command else str.encode(part).decode("unicode_escape")
+                    )
+                else:
+                    assert False
+            self._literals = literals
+        return literals
+
+    def _compile(self) -> Callable[..., Value.Base]:
+        parts = []
+        for part, literal in zip(self.parts, self._decode_literals()):
+            if literal is None:
+                assert isinstance(part, Placeholder)
+                parts.append(part.compile())
+            else:
+                parts.append(literal)
+        if not any(callable(part) for part in parts):
+            text = "".join(parts)[1:-1]  # pyre-ignore
+            return lambda env, stdlib: Value.String(text)
+
+        def string(env: Env.Bindings[Value.Base], stdlib: "Optional[StdLib.Base]") -> Value.Base:
+            ans = []
+            for part in parts:
+                ans.append(part if part.__class__ is str else part(env, stdlib).value)
+            return Value.String("".join(ans)[1:-1])
+
+        return string
+
 
 class Array(Base):
     """
@@ -466,6 +800,14 @@ class Array(Base):
             [item.eval(env, stdlib).coerce(self.type.item_type) for item in self.items],
         )
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        assert isinstance(self.type, Type.Array)
+        item_type = self.type.item_type
+        items = [item.compile() for item in self.items]
+        return lambda env, stdlib: Value.Array(
+            item_type, [item(env, stdlib).coerce(item_type) for item in items]
+        )
+
 
 class Pair(Base):
     """
@@ -510,6 +852,13 @@ class Pair(Base):
         rv = self.right.eval(env, stdlib)
         return Value.Pair(self.left.type, self.right.type, (lv, rv))
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        left_type, right_type = self.left.type, self.right.type
+        left, right = self.left.compile(), self.right.compile()
+        return lambda env, stdlib: Value.Pair(
+            left_type, right_type, (left(env, stdlib), right(env, stdlib))
+        )
+
 
 class Map(Base):
     """
@@ -584,8 +933,22 @@ class Map(Base):
         eitems = []
         for k, v in self.items:
             eitems.append((k.eval(env, stdlib), v.eval(env, stdlib)))
-        # TODO: complain of duplicate keys
-        return Value.Map(self.type.item_type, eitems)
+        return self._check_keys(Value.Map(self.type.item_type, eitems))
+
+    def _check_keys(self, ans: Value.Map) -> Value.Map:
+        index = ans.index
+        if index is not None and len(index) < len(ans.value):
+            raise Error.EvalError(self, "duplicate keys in Map literal")
+        return ans
+
+    def _compile(self) -> Callable[..., Value.Base]:
+        assert isinstance(self.type, Type.Map)
+        item_type = self.type.item_type
+        items = [(k.compile(), v.compile()) for k, v in self.items]
+        check_keys = self._check_keys
+        return lambda env, stdlib: check_keys(
+            Value.Map(item_type, [(k(env, stdlib), v(env, stdlib)) for k, v in items])
+        )
 
 
 class Struct(Base):
@@ -635,6 +998,14 @@ class Struct(Base):
         assert isinstance(self.type, Type.Object)
         return Value.Struct(self.type, ans)
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        assert isinstance(self.type, Type.Object)
+        object_type = self.type
+        members = [(k, v.compile()) for k, v in self.members.items()]
+        return lambda env, stdlib: Value.Struct(
+            object_type, dict((k, v(env, stdlib)) for k, v in members)
+        )
+
 
 class IfThenElse(Base):
     """
@@ -728,6 +1099,17 @@ class IfThenElse(Base):
             ans = self.alternative.eval(env, stdlib)
         return ans
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        condition = self.condition.compile()
+        consequent = self.consequent.compile()
+        alternative = self.alternative.compile()
+        boolean = Type.Boolean()
+        return lambda env, stdlib: (
+            consequent(env, stdlib)
+            if condition(env, stdlib).expect(boolean).value
+            else alternative(env, stdlib)
+        )
+
 
 class Ident(Base):
     """
@@ -786,6 +1168,13 @@ class Ident(Base):
         ""
         return env[self.name]
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        name = self.name
+        return lambda env, stdlib: env.resolve_binding(name).value
+
+    def _foldable(self) -> bool:
+        return False
+
     @property
     def _ident(self) -> str:
         return self.name
@@ -818,6 +1207,9 @@ class _LeftName(Base):
     ) -> Value.Base:
         raise NotImplementedError()
 
+    def _foldable(self) -> bool:
+        return False
+
     @property
     def _ident(self) -> str:
         return self.name
@@ -947,6 +1339,23 @@ class Get(Base):
             return innard_value.value[self.member]
         raise NotImplementedError()
 
+    def _compile(self) -> Callable[..., Value.Base]:
+        inner = self.expr.compile()
+        member = self.member
+        if not member:
+            return inner
+
+        def get(env: Env.Bindings[Value.Base], stdlib: "Optional[StdLib.Base]") -> Value.Base:
+            innard_value = inner(env, stdlib)
+            if isinstance(innard_value, Value.Pair):
+                assert member in ["left", "right"]
+                return innard_value.value[0 if member == "left" else 1]
+            if isinstance(innard_value, Value.Struct):
+                return innard_value.value[member]
+            raise NotImplementedError()
+
+        return get
+
     @property
     def _ident(self) -> str:
         # helper for the resolution logic above -- get the partial identifier
@@ -957,6 +1366,16 @@ class Get(Base):
 
 
 _base_stdlib = None  # memorized instance of the default WDL.StdLib.Base()
+_base_interpolation_stdlib = None  # memorized instance with the interpolation + operator
+
+
+def _interpolation_stdlib() -> "StdLib.Base":
+    global _base_interpolation_stdlib
+    if not _base_interpolation_stdlib:
+        stdlib = StdLib.Base()
+        setattr(stdlib, "_add", StdLib.InterpolationAddOperator())
+        _base_interpolation_stdlib = stdlib
+    return _base_interpolation_stdlib
 
 
 def _add_parentheses(arguments, parent_operator):
@@ -1031,9 +1450,9 @@ class Apply(Base):
             return "{} && {}".format(arguments[0], arguments[1])
         elif isinstance(func, StdLib._Or):
             return "{} || {}".format(arguments[0], arguments[1])
-        elif func.name == "_rem":
+        elif self.function_name == "_rem":
             return "{} % {}".format(arguments[0], arguments[1])
-        elif func.name == "_negate":
+        elif self.function_name == "_negate":
             return "!{}".format(arguments[0])
         else:
             return "{}({})".format(self.function_name, ",".join(arguments))
@@ -1065,4 +1484,46 @@ class Apply(Base):
         stdlib = stdlib or _base_stdlib
         f = getattr(stdlib, self.function_name, None)
         assert isinstance(f, StdLib.Function)
+        p = profiler
+        if p is not None:
+            return p._apply(self, f, self, env, stdlib)
         return f(self, env, stdlib)
+
+    def _foldable(self) -> bool:
+        # only functions of their arguments alone, not e.g. read_* or size(); and not range() or
+        # cross() yielding more than constant_folding_limit values, to avoid computing them at all
+        if not (self.function_name in StdLib.pure_functions and super()._foldable()):
+            return False
+        args = [arg._constant for arg in self.arguments]
+        if self.function_name == "range":
+            assert isinstance(args[0], Value.Int)
+            return args[0].value <= constant_folding_limit
+        if self.function_name == "cross":
+            assert isinstance(args[0], Value.Array) and isinstance(args[1], Value.Array)
+            return len(args[0].value) * len(args[1].value) <= constant_folding_limit
+        return True
+
+    def _compile(self) -> Callable[..., Value.Base]:
+        global _base_stdlib
+        if not _base_stdlib:
+            _base_stdlib = StdLib.Base()
+        function_name = self.function_name
+        arguments = [arg.compile() for arg in self.arguments]
+        # the function is looked up in the stdlib on each evaluation (since the stdlib can differ
+        # between evaluations, e.g. per task), and its compiled invocation cached by class, which
+        # the different stdlib instances mostly share
+        cache: Dict[type, Callable[..., Value.Base]] = {}
+
+        def apply(env: Env.Bindings[Value.Base], stdlib: "Optional[StdLib.Base]") -> Value.Base:
+            stdlib = stdlib or _base_stdlib
+            f = getattr(stdlib, function_name, None)
+            call = cache.get(f.__class__, None)
+            if call is None:
+                assert isinstance(f, StdLib.Function)
+                call = cache[f.__class__] = f.compile(self, arguments)
+            p = profiler
+            if p is not None:
+                return p._apply(self, call, f, env, stdlib)
+            return call(f, env, stdlib)
+
+        return apply
@@ -4,7 +4,7 @@ import os
 import re
 import json
 import tempfile
-from typing import List, Tuple, Callable, BinaryIO
+from typing import List, Tuple, Callable, BinaryIO, Any
 from abc import ABC, abstractmethod
 from . import Type, Value, Expr, Env, Error
 
@@ -190,6 +190,47 @@ class Base:
         setattr(sf, "F", f)
 
 
+pure_functions = frozenset(
+    [
+        "_at",
+        "_land",
+        "_lor",
+        "_negate",
+        "_add",
+        "_sub",
+        "_mul",
+        "_div",
+        "_rem",
+        "_eqeq",
+        "_neq",
+        "_lt",
+        "_lte",
+        "_gt",
+        "_gte",
+        "floor",
+        "ceil",
+        "round",
+        "length",
+        "sub",
+        "basename",
+        "defined",
+        "range",
+        "prefix",
+        "select_first",
+        "select_all",
+        "zip",
+        "cross",
+        "flatten",
+        "transpose",
+    ]
+)
+"""
+Names of the standard library functions whose result depends only on their argument values, and
+not on the filesystem or other context; ``WDL.Expr`` evaluates applications of these to constant
+arguments just once, during typechecking. ``Base`` subclasses shouldn't override them.
+"""
+
+
 class Function(ABC):
     # Abstract interface to a standard library function implementation
 
@@ -207,6 +248,16 @@ class Function(ABC):
         # Invoke the function, evaluating the arguments as needed
         pass
 
+    def compile(
+        self, expr: "Expr.Apply", arguments: List[Callable[..., Value.Base]]
+    ) -> Callable[["Function", Env.Bindings[Value.Base], Base], Value.Base]:
+        # Return a function f(function, env, stdlib) invoking the given function (an instance of
+        # this class) for the Apply expression, given its argument expressions compiled (see
+        # WDL.Expr.Base.compile); subclasses may override to do once what doesn't vary between
+        # invocations. The result is reused for other instances of the class (e.g. from per-task
+        # stdlibs), so it mustn't capture self or its attributes.
+        return lambda function, env, stdlib: function(expr, env, stdlib)
+
 
 class EagerFunction(Function):
     # Function helper providing boilerplate for eager argument evaluation.
@@ -222,6 +273,19 @@ class EagerFunction(Function):
     ) -> Value.Base:
         return self._call_eager(expr, [arg.eval(env, stdlib=stdlib) for arg in expr.arguments])
 
+    def _compile_eager(
+        self, expr: "Expr.Apply"
+    ) -> Callable[["EagerFunction", List[Value.Base]], Value.Base]:
+        # Return a function f(function, arguments) equivalent to
+        # function._call_eager(expr, arguments), subject to the same caveat as compile()
+        return lambda function, arguments: function._call_eager(expr, arguments)
+
+    def compile(
+        self, expr: "Expr.Apply", arguments: List[Callable[..., Value.Base]]
+    ) -> Callable[[Function, Env.Bindings[Value.Base], Base], Value.Base]:
+        call = self._compile_eager(expr)
+        return lambda function, env, stdlib: call(function, [arg(env, stdlib) for arg in arguments])
+
 
 class StaticFunction(EagerFunction):
     # Function helper for static argument and return types.
@@ -291,8 +355,8 @@ class TaskOutputs(Base):
 def _parse_lines(s: str) -> Value.Array:
     ans = []
     if s:
-        ans = [Value.String(line) for line in (s[:-1] if s.endswith("\n") else s).split("\n")]
-    return Value.Array(Type.String(), ans)
+        ans = (s[:-1] if s.endswith("\n") else s).split("\n")
+    return Value.packed_array(Type.String(), ans)
 
 
 def _parse_boolean(s: str) -> Value.Boolean:
@@ -306,28 +370,31 @@ def _parse_boolean(s: str) -> Value.Boolean:
 
 def _parse_tsv(s: str) -> Value.Array:
     # TODO: should a blank line parse as [] or ['']?
+    lines = _parse_lines(s).value
+    assert isinstance(lines, Value.PackedItems)
     ans = [
-        Value.Array(
-            Type.Array(Type.String()), [Value.String(field) for field in line.value.split("\t")]
-        )
-        for line in _parse_lines(s).value
+        Value.Array(Type.Array(Type.String()), Value.PackedItems(Value.String, line.split("\t")))
+        for line in lines.data
     ]
     # pyre-ignore
     return Value.Array(Type.Array(Type.String()), ans)
 
 
 def _parse_map(s: str) -> Value.Map:
-    keys = set()
-    ans = []
-    for line in _parse_tsv(s).value:
-        assert isinstance(line, Value.Array)
-        if len(line.value) != 2:
+    lines = _parse_lines(s).value
+    assert isinstance(lines, Value.PackedItems)
+    items = []
+    for line in lines.data:
+        fields = line.split("\t")
+        if len(fields) != 2:
             raise Error.InputError("read_map(): each line must have two fields")
-        if line.value[0].value in keys:
-            raise Error.InputError("read_map(): duplicate key")
-        keys.add(line.value[0].value)
-        ans.append((line.value[0], line.value[1]))
-    return Value.Map((Type.String(), Type.String()), ans)
+        items.append((Value.String(fields[0]), Value.String(fields[1])))
+    ans = Value.Map((Type.String(), Type.String()), items)
+    index = ans.index
+    assert index is not None
+    if len(index) < len(items):
+        raise Error.InputError("read_map(): duplicate key")
+    return ans
 
 
 def _parse_json(s: str) -> Value.Base:
@@ -352,6 +419,13 @@ def _parse_json(s: str) -> Value.Base:
 
 
 def _serialize_lines(array: Value.Array, outfile: BinaryIO) -> None:
+    if isinstance(array.value, Value.PackedItems):
+        strings = array.value.coerce(Type.String())
+        assert strings is not None
+        for line in strings.data:
+            outfile.write(line.encode("utf-8"))
+            outfile.write(b"\n")
+        return
     for item in array.value:
         outfile.write(item.coerce(Type.String()).value.encode("utf-8"))
         outfile.write(b"\n")
@@ -422,11 +496,7 @@ class _At(EagerFunction):
         if isinstance(lhs, Value.Map):
             mty = expr.arguments[0].type
             assert isinstance(mty, Type.Map)
-            key = rhs.coerce(mty.item_type[0])
-            ans = None
-            for k, v in lhs.value:
-                if rhs == k:
-                    ans = v
+            ans = lhs.get(rhs.coerce(mty.item_type[0]))
             if ans is None:
                 raise Error.OutOfBounds(expr.arguments[1])  # TODO: KeyNotFound
             return ans
@@ -457,6 +527,17 @@ class _And(Function):
             return Value.Boolean(False)
         return expr.arguments[1].eval(env, stdlib=stdlib).expect(Type.Boolean())
 
+    def compile(
+        self, expr: "Expr.Apply", arguments: List[Callable[..., Value.Base]]
+    ) -> Callable[[Function, Env.Bindings[Value.Base], Base], Value.Base]:
+        lhs, rhs = arguments
+        boolean = Type.Boolean()
+        return lambda function, env, stdlib: (
+            Value.Boolean(False)
+            if not lhs(env, stdlib).expect(boolean).value
+            else rhs(env, stdlib).expect(boolean)
+        )
+
 
 class _Or(Function):
     # logical || with short-circuit evaluation
@@ -477,6 +558,17 @@ class _Or(Function):
             return Value.Boolean(True)
         return expr.arguments[1].eval(env, stdlib=stdlib).expect(Type.Boolean())
 
+    def compile(
+        self, expr: "Expr.Apply", arguments: List[Callable[..., Value.Base]]
+    ) -> Callable[[Function, Env.Bindings[Value.Base], Base], Value.Base]:
+        lhs, rhs = arguments
+        boolean = Type.Boolean()
+        return lambda function, env, stdlib: (
+            Value.Boolean(True)
+            if lhs(env, stdlib).expect(boolean).value
+            else rhs(env, stdlib).expect(boolean)
+        )
+
 
 class _ArithmeticOperator(EagerFunction):
     # arithmetic infix operators
@@ -514,6 +606,20 @@ class _ArithmeticOperator(EagerFunction):
         assert isinstance(ans, float)
         return Value.Float(ans)
 
+    def _compile_eager(
+        self, expr: "Expr.Apply"
+    ) -> Callable[[EagerFunction, List[Value.Base]], Value.Base]:
+        # infer the result type once, instead of on each evaluation
+        ans_type = self.infer_type(expr)
+        box = Value.Int if ans_type == Type.Int() else Value.Float
+
+        def operand(v: Value.Base) -> Any:
+            return v.value if v.__class__ is box else v.coerce(ans_type).value
+
+        return lambda function, arguments: box(
+            function.op(operand(arguments[0]), operand(arguments[1]))  # pyre-ignore
+        )
+
 
 class _AddOperator(_ArithmeticOperator):
     # + operator can also serve as concatenation for String.
@@ -550,6 +656,18 @@ class _AddOperator(_ArithmeticOperator):
         assert isinstance(ans, str)
         return Value.String(ans)
 
+    def _compile_eager(
+        self, expr: "Expr.Apply"
+    ) -> Callable[[EagerFunction, List[Value.Base]], Value.Base]:
+        if not isinstance(self.infer_type(expr), Type.String):
+            return super()._compile_eager(expr)
+        string = Type.String()
+        return lambda function, arguments: Value.String(
+            function.op(  # pyre-ignore
+                str(arguments[0].coerce(string).value), str(arguments[1].coerce(string).value)
+            )
+        )
+
 
 class InterpolationAddOperator(_AddOperator):
     # + operator within an interpolation; accepts String? operands, evaluating to None if either
@@ -572,6 +690,16 @@ class InterpolationAddOperator(_AddOperator):
             return Value.Null()
         return super()._call_eager(expr, arguments)
 
+    def _compile_eager(
+        self, expr: "Expr.Apply"
+    ) -> Callable[[EagerFunction, List[Value.Base]], Value.Base]:
+        call = super()._compile_eager(expr)
+        return lambda function, arguments: (
+            Value.Null()
+            if any(isinstance(arg, Value.Null) for arg in arguments)
+            else call(function, arguments)
+        )
+
 
 class _ComparisonOperator(EagerFunction):
     # Comparison operators can compare any two operands of the same type.
@@ -729,6 +857,9 @@ class _SelectAll(EagerFunction):
         assert isinstance(arr, Value.Array)
         arrty = arr.type
         assert isinstance(arrty, Type.Array)
+        if isinstance(arr.value, Value.PackedItems):
+            # no nulls
+            return Value.Array(arrty.item_type, arr.value)
         return Value.Array(
             arrty.item_type, [arg for arg in arr.value if not isinstance(arg, Value.Null)]
         )
@@ -819,8 +950,13 @@ class _Flatten(EagerFunction):
     def _call_eager(self, expr: "Expr.Apply", arguments: List[Value.Base]) -> Value.Base:
         ty = self.infer_type(expr)
         assert isinstance(ty, Type.Array)
+        rows = arguments[0].coerce(Type.Array(ty)).value
+        if rows and all(isinstance(row.value, Value.PackedItems) for row in rows):
+            packed = Value.PackedItems.concat([row.value for row in rows])
+            if packed is not None:
+                return Value.Array(ty.item_type, packed)
         ans = []
-        for row in arguments[0].coerce(Type.Array(ty)).value:
+        for row in rows:
             ans.extend(row.value)
         return Value.Array(ty.item_type, ans)
 
@@ -888,7 +1024,7 @@ class _Range(EagerFunction):
         assert isinstance(arg0, Value.Int)
         if arg0.value < 0:
             raise Error.EvalError(expr, "range() got negative argument")
-        return Value.Array(Type.Int(), [Value.Int(x) for x in range(arg0.value)])
+        return Value.packed_array(Type.Int(), range(arg0.value))
 
 
 class _Prefix(EagerFunction):
@@ -907,6 +1043,10 @@ class _Prefix(EagerFunction):
 
     def _call_eager(self, expr: "Expr.Apply", arguments: List[Value.Base]) -> Value.Base:
         pfx = arguments[0].coerce(Type.String()).value
+        if isinstance(arguments[1].value, Value.PackedItems):
+            strings = arguments[1].value.coerce(Type.String())
+            if strings is not None:
+                return Value.packed_array(Type.String(), [pfx + s for s in strings.data])
         return Value.Array(
             Type.String(),
             [Value.String(pfx + s.coerce(Type.String()).value) for s in arguments[1].value],
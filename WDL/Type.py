@@ -39,6 +39,7 @@ also enables coercion of ``T`` to ``Array[T]+`` (an array of length 1).
    :top-classes: WDL.Type.Base
 """
 import copy
+import sys
 from abc import ABC
 from typing import Optional, Tuple, Dict, Iterable, Set
 
@@ -51,7 +52,9 @@ class Base(ABC):
         assert issubclass(WDL.Type.Int, WDL.Type.Base)
         assert isinstance(WDL.Type.Array(WDL.Type.Int()), WDL.Type.Base)
 
-    All instances are immutable.
+    All instances are immutable. Types are hashable, and (except those involving struct types)
+    compare by their interned canonical string, so that equality and ``coerces`` (which is
+    memoized) are O(1) after first use.
     """
 
     _optional: bool = False  # immutable!!!
@@ -60,16 +63,46 @@ class Base(ABC):
     # objects are instantiated in other ways (e.g. Value describing itself), so will not have pos.
     pos: "Optional[WDL.Error.SourcePosition]" = None
 
+    # interned str(self) computed on first use, or "" if the type involves struct types, whose
+    # strings change upon resolution of their members (so can't be cached)
+    _canonical_str: Optional[str] = None
+
+    def _canonical(self) -> str:
+        ans = self._canonical_str
+        if ans is None:
+            ans = self._canonical_str = self._make_canonical()
+        return ans
+
+    def _make_canonical(self) -> str:
+        # overridden by parametric types, which first canonicalize their parameters (so that
+        # str(self) uses their cached strings)
+        return sys.intern(str(self))
+
     def coerces(self, rhs: "Base", check_quant: bool = True) -> bool:
         """
         True if this is the same type as, or can be coerced to, ``rhs``.
 
         :param check_quant: when ``False``, disables static enforcement of the optional (?) type quantifier
         """
+        k1 = self._canonical()
+        k2 = k1 and rhs._canonical()
+        if not k2:
+            return self._coerces(rhs, check_quant)
+        key = (k1, k2, check_quant)
+        ans = _coerces_memo.get(key)
+        if ans is None:
+            ans = self._coerces(rhs, check_quant)
+            if len(_coerces_memo) >= _COERCES_MEMO_MAX:
+                _coerces_memo.clear()
+            _coerces_memo[key] = ans
+        return ans
+
+    def _coerces(self, rhs: "Base", check_quant: bool) -> bool:
+        # coercion rules, which subclasses extend (coerces() memoizes the result)
         if not check_quant and isinstance(rhs, Array) and self.coerces(rhs.item_type, check_quant):
             # coerce T to Array[T]
             return True
-        return (type(rhs).__name__ in [type(self).__name__, "Any"]) and self._check_optional(
+        return (rhs.__class__ is self.__class__ or isinstance(rhs, Any)) and self._check_optional(
             rhs, check_quant
         )
 
@@ -101,16 +134,45 @@ class Base(ABC):
         Create a copy of the type, possibly with a different setting of the
         ``optional`` quantifier.
         """
+        if optional is None or optional == self._optional:
+            return self  # immutable
+        ans = self._copy()
+        ans._optional = optional
+        return ans
+
+    def _copy(self) -> "Base":
         ans: Base = copy.copy(self)
-        if optional is not None:
-            ans._optional = optional
+        ans._canonical_str = None
         return ans
 
     def __str__(self) -> str:
         return type(self).__name__ + ("?" if self.optional else "")
 
     def __eq__(self, rhs: "Base") -> bool:
-        return isinstance(rhs, Base) and str(self) == str(rhs)
+        if rhs is self:
+            return True
+        if not isinstance(rhs, Base):
+            return False
+        # compare interned canonical strings once both sides have them (e.g. from hashing or
+        # coerces()); canonicalizing a one-off type here would cost more than the comparison.
+        k1 = self._canonical_str
+        k2 = rhs._canonical_str
+        if k1 and k2:
+            return k1 is k2
+        return str(self) == str(rhs)
+
+    def __hash__(self) -> int:
+        return hash(self._canonical() or str(self))
+
+    def __getstate__(self) -> Dict[str, object]:
+        # omit the canonical string, which wouldn't be interned upon unpickling
+        state = dict(self.__dict__)
+        state.pop("_canonical_str", None)
+        return state
+
+
+_coerces_memo: Dict[Tuple[str, str, bool], bool] = {}
+_COERCES_MEMO_MAX = 65536
 
 
 class Any(Base):
@@ -121,7 +183,7 @@ class Any(Base):
     def __init__(self, optional: bool = False) -> None:
         self._optional = optional
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         return self._check_optional(rhs, check_quant)
 
 
@@ -129,55 +191,55 @@ class Boolean(Base):
     def __init__(self, optional: bool = False) -> None:
         self._optional = optional
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, String):
             return True
-        return super().coerces(rhs, check_quant)
+        return super()._coerces(rhs, check_quant)
 
 
 class Float(Base):
     def __init__(self, optional: bool = False) -> None:
         self._optional = optional
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, String):
             return True
-        return super().coerces(rhs, check_quant)
+        return super()._coerces(rhs, check_quant)
 
 
 class Int(Base):
     def __init__(self, optional: bool = False) -> None:
         self._optional = optional
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, (Float, String)):
             return True
-        return super().coerces(rhs, check_quant)
+        return super()._coerces(rhs, check_quant)
 
 
 class File(Base):
     def __init__(self, optional: bool = False) -> None:
         self._optional = optional
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, String):
             return True
-        return super().coerces(rhs, check_quant)
+        return super()._coerces(rhs, check_quant)
 
 
 class String(Base):
     def __init__(self, optional: bool = False) -> None:
         self._optional = optional
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, (File, Int, Float)):
             return self._check_optional(rhs, check_quant)
-        return super().coerces(rhs, check_quant)
+        return super()._coerces(rhs, check_quant)
 
 
 class Array(Base):
@@ -201,6 +263,8 @@ class Array(Base):
         self._nonempty = nonempty
 
     def __str__(self) -> str:
+        if self._canonical_str:
+            return self._canonical_str
         ans = (
             "Array["
             + str(self.item_type)
@@ -210,6 +274,9 @@ class Array(Base):
         )
         return ans
 
+    def _make_canonical(self) -> str:
+        return sys.intern(str(self)) if self.item_type._canonical() else ""
+
     @property
     def nonempty(self) -> bool:
         """
@@ -223,7 +290,7 @@ class Array(Base):
     def parameters(self) -> Iterable[Base]:
         yield self.item_type
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, Array):
             return self.item_type.coerces(rhs.item_type, check_quant) and self._check_optional(
@@ -237,7 +304,10 @@ class Array(Base):
 
     def copy(self, optional: Optional[bool] = None, nonempty: Optional[bool] = None) -> Base:
         ans = super().copy(optional)
-        if nonempty is not None:
+        if nonempty is not None and nonempty != self._nonempty:
+            if ans is self:
+                ans = self._copy()
+            assert isinstance(ans, Array)
             ans._nonempty = nonempty
         return ans
 
@@ -273,6 +343,8 @@ class Map(Base):
         self.literal_keys = literal_keys
 
     def __str__(self) -> str:
+        if self._canonical_str:
+            return self._canonical_str
         return (
             "Map["
             + (
@@ -289,7 +361,12 @@ class Map(Base):
         yield self.item_type[0]
         yield self.item_type[1]
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _make_canonical(self) -> str:
+        if self.item_type[0]._canonical() and self.item_type[1]._canonical():
+            return sys.intern(str(self))
+        return ""
+
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, Map):
             return (
@@ -337,6 +414,8 @@ class Pair(Base):
         self.right_type = right_type
 
     def __str__(self) -> str:
+        if self._canonical_str:
+            return self._canonical_str
         return (
             "Pair["
             + (str(self.left_type) + "," + str(self.right_type))
@@ -349,7 +428,12 @@ class Pair(Base):
         yield self.left_type
         yield self.right_type
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _make_canonical(self) -> str:
+        if self.left_type._canonical() and self.right_type._canonical():
+            return sys.intern(str(self))
+        return ""
+
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, Pair):
             return (
@@ -395,7 +479,7 @@ class StructInstance(Base):
             "?" if self.optional else ""
         )
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         ""
         if isinstance(rhs, StructInstance):
             return self.type_id == rhs.type_id and self._check_optional(rhs, check_quant)
@@ -418,6 +502,9 @@ class StructInstance(Base):
         assert self.members is not None
         return self.members.values()
 
+    def _make_canonical(self) -> str:
+        return ""
+
 
 def _struct_type_id(members: Dict[str, Base]) -> str:
     # generates a content hash of the struct type definition, used to recognize
@@ -456,7 +543,10 @@ class Object(Base):
     def parameters(self) -> Iterable[Base]:
         return self.members.values()
 
-    def coerces(self, rhs: Base, check_quant: bool = True) -> bool:
+    def _make_canonical(self) -> str:
+        return ""
+
+    def _coerces(self, rhs: Base, check_quant: bool) -> bool:
         if isinstance(rhs, (StructInstance, Object)):
             rhs_members = rhs.members
             assert rhs_members is not None
@@ -8,7 +8,8 @@ Each value is represented by an instance of a Python class inheriting from
    :top-classes: WDL.Value.Base
 """
 from abc import ABC
-from typing import Any, List, Optional, Tuple, Dict, Iterable, Union
+from typing import Any, List, Optional, Tuple, Dict, Iterable, Iterator, Union, Callable, Sequence
+from array import array
 import json
 from . import Error, Type
 
@@ -16,6 +17,8 @@ from . import Error, Type
 class Base(ABC):
     """The abstract base class for WDL values"""
 
+    __slots__ = ("type", "value", "expr")
+
     type: Type.Base
     ":type: WDL.Type.Base"
 
@@ -25,7 +28,7 @@ class Base(ABC):
     expr: "Optional[WDL.Expr.Base]"
     """
     Reference to the WDL expression that generated this value, if it originated
-    from ``WDL.Expr.eval``
+    from ``WDL.Expr.eval`` (unless disabled by ``WDL.Expr.value_provenance``)
     """
 
     def __init__(self, type: Type.Base, value: Any) -> None:
@@ -73,11 +76,35 @@ class Base(ABC):
         return []
 
 
+# Type objects are immutable, so values share them: one instance for each atomic type, and
+# parametric types memoized on the identities of their parameter type objects (which the memo
+# entries reference, keeping the ids valid)
+_BOOLEAN = Type.Boolean()
+_FLOAT = Type.Float()
+_INT = Type.Int()
+_STRING = Type.String()
+_NULL = Type.Any(optional=True)
+_shared_types: Dict[Tuple[Any, ...], Tuple[Any, Type.Base]] = {}
+_SHARED_TYPES_MAX = 4096
+
+
+def _shared_type(key: Tuple[Any, ...], params: Any, make: Callable[[], Type.Base]) -> Any:
+    ans = _shared_types.get(key)
+    if ans is None:
+        if len(_shared_types) >= _SHARED_TYPES_MAX:
+            _shared_types.clear()
+        ans = (params, make())
+        _shared_types[key] = ans
+    return ans[1]
+
+
 class Boolean(Base):
     """``value`` has Python type ``bool``"""
 
+    __slots__ = ()
+
     def __init__(self, value: bool) -> None:
-        super().__init__(Type.Boolean(), value)
+        super().__init__(_BOOLEAN, value)
 
     def coerce(self, desired_type: Optional[Type.Base] = None) -> Base:
         ""
@@ -89,15 +116,19 @@ class Boolean(Base):
 class Float(Base):
     """``value`` has Python type ``float``"""
 
+    __slots__ = ()
+
     def __init__(self, value: float) -> None:
-        super().__init__(Type.Float(), value)
+        super().__init__(_FLOAT, value)
 
 
 class Int(Base):
     """``value`` has Python type ``int``"""
 
+    __slots__ = ()
+
     def __init__(self, value: int) -> None:
-        super().__init__(Type.Int(), value)
+        super().__init__(_INT, value)
 
     def coerce(self, desired_type: Optional[Type.Base] = None) -> Base:
         ""
@@ -109,8 +140,10 @@ class Int(Base):
 class String(Base):
     """``value`` has Python type ``str``"""
 
+    __slots__ = ()
+
     def __init__(self, value: str) -> None:
-        super().__init__(Type.String(), value)
+        super().__init__(_STRING, value)
 
     def coerce(self, desired_type: Optional[Type.Base] = None) -> Base:
         ""
@@ -131,23 +164,35 @@ class String(Base):
 class File(String):
     """``value`` has Python type ``str``"""
 
-    pass
+    __slots__ = ()
 
 
 class Array(Base):
-    """``value`` is a Python ``list`` of other ``WDL.Value.Base`` instances"""
+    """``value`` is a Python ``list`` of other ``WDL.Value.Base`` instances, or for arrays of
+    ``Int``, ``Float``, ``Boolean``, ``String`` (or ``File``), possibly an equivalent
+    :class:`PackedItems` sequence"""
+
+    __slots__ = ()
 
-    value: List[Base]
+    value: "Union[List[Base], PackedItems]"
     type: Type.Array
 
-    def __init__(self, item_type: Type.Base, value: List[Base]) -> None:
-        self.value = []
-        self.type = Type.Array(item_type, nonempty=(len(value) > 0))
-        super().__init__(self.type, value)
+    def __init__(self, item_type: Type.Base, value: "Union[List[Base], PackedItems]") -> None:
+        nonempty = len(value) > 0
+        super().__init__(
+            _shared_type(
+                ("Array", id(item_type), nonempty),
+                item_type,
+                lambda: Type.Array(item_type, nonempty=nonempty),
+            ),
+            value,
+        )
 
     @property
     def json(self) -> Any:
         ""
+        if isinstance(self.value, PackedItems):
+            return self.value.json
         return [item.json for item in self.value]
 
     @property
@@ -167,20 +212,265 @@ class Array(Base):
                 or isinstance(self.type.item_type, Type.Any)
             ):
                 return self
+            if isinstance(self.value, PackedItems):
+                packed = self.value.coerce(desired_type.item_type)
+                if packed is not None:
+                    return Array(desired_type, packed)
             return Array(desired_type, [v.coerce(desired_type.item_type) for v in self.value])
         return super().coerce(desired_type)
 
 
+class PackedItems(Sequence):
+    """
+    Immutable sequence of ``Int``, ``Float``, ``Boolean``, ``String``, or ``File`` values, which may
+    serve as an ``Array`` value in place of a list. The raw Python values are stored in ``data`` (an
+    ``array.array`` for numbers, a :class:`PathList` for files, otherwise a list), and each is boxed
+    as a ``WDL.Value.Base`` only upon access. Use :func:`packed_array` to construct.
+    """
+
+    __slots__ = ("item_class", "data")
+
+    item_class: type
+    ":type: the ``WDL.Value.Base`` subclass of the items"
+    data: Sequence[Any]
+    ":type: the raw values"
+
+    def __init__(self, item_class: type, data: Sequence[Any]) -> None:
+        assert item_class in (Int, Float, Boolean, String, File)
+        self.item_class = item_class
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return PackedItems(self.item_class, self.data[index])
+        return self.item_class(self.data[index])
+
+    def __iter__(self) -> Iterator[Base]:
+        return map(self.item_class, self.data)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, PackedItems):
+            return self.item_class is other.item_class and list(self.data) == list(other.data)
+        if isinstance(other, list):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return False
+
+    __hash__ = None  # pyre-ignore
+
+    def __repr__(self) -> str:
+        return "PackedItems(" + self.item_class.__name__ + ", " + repr(list(self.data)) + ")"
+
+    @property
+    def json(self) -> List[Any]:
+        ":type: List[Any]"
+        return self.data.tolist() if isinstance(self.data, array) else list(self.data)
+
+    @staticmethod
+    def concat(parts: "List[PackedItems]") -> "Optional[PackedItems]":
+        """
+        Concatenate packed sequences of the same item class (or return None if they differ)
+        """
+        if not parts or any(part.item_class is not parts[0].item_class for part in parts):
+            return None
+        data: Any
+        if parts[0].item_class is File:
+            return PackedItems(File, PathList(path for part in parts for path in part.data))
+        if all(isinstance(part.data, array) for part in parts):
+            data = array(parts[0].data.typecode)  # pyre-ignore
+        else:
+            data = []
+        for part in parts:
+            data.extend(part.data)
+        return PackedItems(parts[0].item_class, data)
+
+    def coerce(self, item_type: Type.Base) -> "Optional[PackedItems]":
+        """
+        Coerce all the items to the given type in bulk, or return None if that isn't possible
+        (leaving the caller to coerce the items individually)
+        """
+        ic = self.item_class
+        if isinstance(item_type, Type.Any) or _packed_item_class(item_type) is ic:
+            return self
+        if isinstance(item_type, Type.File):
+            if ic is File:
+                return self
+            if ic is String and compact_file_arrays:
+                return PackedItems(File, PathList(self.data))
+            return None
+        if isinstance(item_type, Type.String):
+            if ic is Boolean:
+                return PackedItems(String, ["true" if b else "false" for b in self.data])
+            return PackedItems(String, [str(x) for x in self.data])
+        if ic is Int and isinstance(item_type, Type.Float):
+            return PackedItems(Float, array("d", self.data))
+        try:
+            if ic is String and isinstance(item_type, Type.Int):
+                return _pack(Int, [int(s) for s in self.data])
+            if ic is String and isinstance(item_type, Type.Float):
+                return _pack(Float, [float(s) for s in self.data])
+        except ValueError:
+            # (so that the caller raises the appropriate error)
+            pass
+        return None
+
+
+class PathList(Sequence):
+    """
+    Immutable sequence of path strings, stored compactly for large arrays of ``File`` values which
+    tend to share long directory prefixes. Each path is split into its directory (up to & including
+    the last slash) and its basename; each distinct directory is stored once, and the path is
+    stored as the index of its directory with its basename. The full path strings are rendered
+    only upon access.
+    """
+
+    __slots__ = ("dirs", "dir_ids", "names")
+
+    dirs: List[str]
+    ":type: the distinct directories"
+    dir_ids: array
+    ":type: the index in ``dirs`` of each path's directory"
+    names: List[str]
+    ":type: the basename of each path"
+
+    def __init__(self, paths: Iterable[str] = ()) -> None:
+        self.dirs = []
+        self.dir_ids = array("I")
+        self.names = []
+        dir_index: Dict[str, int] = {}
+        for path in paths:
+            sep = path.rfind("/") + 1
+            prefix = path[:sep]
+            dir_id = dir_index.get(prefix)
+            if dir_id is None:
+                dir_id = dir_index[prefix] = len(self.dirs)
+                self.dirs.append(prefix)
+            self.dir_ids.append(dir_id)
+            self.names.append(path[sep:])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            ans = PathList()
+            ans.dirs = self.dirs  # shared (never modified after construction)
+            ans.dir_ids = self.dir_ids[index]
+            ans.names = self.names[index]
+            return ans
+        return self.dirs[self.dir_ids[index]] + self.names[index]
+
+    def __iter__(self) -> Iterator[str]:
+        return map(str.__add__, map(self.dirs.__getitem__, self.dir_ids), self.names)
+
+    def __repr__(self) -> str:
+        return "PathList(" + repr(list(self)) + ")"
+
+
+compact_file_arrays: bool = False
+"""
+Whether arrays of ``File`` values constructed from JSON, by :func:`packed_array`, or by coercion
+of packed ``String`` arrays, store their paths in a :class:`PathList` (reducing memory use for
+large arrays of files sharing directories, at some cost to access each item).
+"""
+
+
+def _packed_item_class(item_type: Type.Base) -> Optional[type]:
+    for ty, cls in ((Type.Int, Int), (Type.Float, Float), (Type.Boolean, Boolean)):
+        if isinstance(item_type, ty):
+            return cls
+    if isinstance(item_type, Type.String):
+        return String
+    if isinstance(item_type, Type.File) and compact_file_arrays:
+        return File
+    return None
+
+
+def _pack(item_class: type, raw: Sequence[Any]) -> PackedItems:
+    data: Sequence[Any]
+    if item_class is Int:
+        try:
+            data = array("q", raw)
+        except OverflowError:
+            data = list(raw)
+    elif item_class is Float:
+        data = array("d", raw)
+    elif item_class is File:
+        data = PathList(raw)
+    else:
+        data = list(raw)
+    return PackedItems(item_class, data)
+
+
+def packed_array(item_type: Type.Base, raw: Sequence[Any]) -> Array:
+    """
+    Construct an ``Array`` of the given atomic item type from raw Python values (not None), with
+    the items packed if the type is ``Int``, ``Float``, ``Boolean``, or ``String`` (or ``File``, if
+    ``compact_file_arrays`` is set).
+    """
+    item_class = _packed_item_class(item_type)
+    if item_class is None:
+        return Array(item_type, [from_json(item_type, x) for x in raw])
+    return Array(item_type, _pack(item_class, raw))
+
+
 class Map(Base):
+    """
+    ``value`` is a list of (key, value) tuples. Lookups with ``get()`` use a hash index keyed on
+    the raw key values, built upon first use.
+    """
+
+    __slots__ = ("_index",)
+
     value: List[Tuple[Base, Base]]
     type: Type.Map
+    _index: Optional[Dict[Any, Base]]
 
     def __init__(
         self, item_type: Tuple[Type.Base, Type.Base], value: List[Tuple[Base, Base]]
     ) -> None:
-        self.value = []
-        self.type = Type.Map(item_type)
-        super().__init__(self.type, value)
+        super().__init__(
+            _shared_type(
+                ("Map", id(item_type[0]), id(item_type[1])), item_type, lambda: Type.Map(item_type)
+            ),
+            value,
+        )
+        self._index = None
+
+    def get(self, key: Base) -> Optional[Base]:
+        """
+        Look up the value for ``key`` (which should already be coerced to the map's key type), or
+        ``None`` if absent. If the map has duplicate keys, the last one's value is returned (as in
+        ``json``).
+        """
+        index = self.index
+        if index is not None:
+            return index.get(key.value)
+        ans = None
+        for k, v in self.value:
+            if key == k:
+                ans = v
+        return ans
+
+    @property
+    def index(self) -> Optional[Dict[Any, Base]]:
+        """
+        Insertion-ordered dict from each raw key value to the corresponding value, or ``None`` if
+        the keys aren't hashable. (Its length is less than that of ``value`` if there are
+        duplicate keys.)
+        """
+        index = getattr(self, "_index", None)  # (unset on copies from _with_value)
+        if index is None:
+            index = {}
+            try:
+                for k, v in self.value:
+                    index[k.value] = v
+            except TypeError:
+                return None
+            self._index = index
+        return index
 
     @property
     def json(self) -> Any:
@@ -219,15 +509,22 @@ class Map(Base):
 
 
 class Pair(Base):
+    __slots__ = ()
+
     value: Tuple[Base, Base]
     type: Type.Pair
 
     def __init__(
         self, left_type: Type.Base, right_type: Type.Base, value: Tuple[Base, Base]
     ) -> None:
-        self.value = value
-        self.type = Type.Pair(left_type, right_type)
-        super().__init__(self.type, value)
+        super().__init__(
+            _shared_type(
+                ("Pair", id(left_type), id(right_type)),
+                (left_type, right_type),
+                lambda: Type.Pair(left_type, right_type),
+            ),
+            value,
+        )
 
     def __str__(self) -> str:
         assert isinstance(self.value, tuple)
@@ -261,8 +558,10 @@ class Null(Base):
     """Represents the missing value which optional inputs may take.
     ``type`` and ``value`` are both None."""
 
+    __slots__ = ()
+
     def __init__(self) -> None:
-        super().__init__(Type.Any(optional=True), None)
+        super().__init__(_NULL, None)
 
     def coerce(self, desired_type: Optional[Type.Base] = None) -> Base:
         ""
@@ -282,6 +581,8 @@ class Null(Base):
 
 
 class Struct(Base):
+    __slots__ = ()
+
     value: Dict[str, Base]
 
     def __init__(
@@ -330,41 +631,261 @@ def from_json(type: Type.Base, value: Any) -> Base:
 
     :raise WDL.Error.InputError: if the given value isn't coercible to the specified type
     """
-    if isinstance(type, Type.Boolean) and value in [True, False]:
-        return Boolean(value)
-    if isinstance(type, Type.Int) and isinstance(value, int):
-        return Int(value)
-    if isinstance(type, Type.Float) and isinstance(value, (float, int)):
-        return Float(float(value))
-    if isinstance(type, Type.File) and isinstance(value, str):
-        return File(value)
-    if isinstance(type, Type.String) and isinstance(value, str):
-        return String(value)
-    if isinstance(type, Type.Array) and isinstance(value, list):
-        return Array(type, [from_json(type.item_type, item) for item in value])
-    if (
-        isinstance(type, Type.Map)
-        and type.item_type[0] == Type.String()
-        and isinstance(value, dict)
-    ):
+    return _json_converter(type)(value)
+
+
+def from_json_stream(type: Type.Base, stream: Any) -> Base:
+    """
+    Like :func:`from_json`, but decoding the value from a ``WDL._util.JSONStream`` as it's read:
+    the items of arrays and maps are instantiated one by one, without first parsing the whole JSON
+    value.
+
+    :raise WDL.Error.InputError: if the value isn't coercible to the specified type
+    """
+    ch = stream.peek()
+    if isinstance(type, Type.Array) and ch == "[":
+        if isinstance(type.item_type, Type.Array):
+            return Array(type, [from_json_stream(type.item_type, stream) for _ in stream.items()])
+        if _packed_item_class(type.item_type) is not None:
+            # the raw items become the packed array data
+            return _json_converter(type)(list(stream.array()))
+        item = _json_converter(type.item_type)
+        return Array(type, [item(v) for v in stream.array()])
+    if isinstance(type, Type.Map) and type.item_type[0] == Type.String() and ch == "{":
         items = []
-        for k, v in value.items():
-            assert isinstance(k, str)
-            items.append((from_json(type.item_type[0], k), from_json(type.item_type[1], v)))
+        for k in stream.members():
+            v = from_json_stream(type.item_type[1], stream)
+            items.append((String(k), v))
         return Map(type.item_type, items)
-    if (
-        isinstance(type, Type.StructInstance)
-        and isinstance(value, dict)
-        and type.members
-        and set(type.members.keys()) == set(value.keys())
-    ):
-        items = {}
-        for k, v in value.items():
-            assert isinstance(k, str)
-            items[k] = from_json(type.members[k], v)
-        return Struct(Type.Object(type.members), items)
-    if type.optional and value is None:
-        return Null()
-    raise Error.InputError(
-        "couldn't construct {} from input {}".format(str(type), json.dumps(value))
-    )
+    return _json_converter(type)(stream.value())
+
+
+def _json_converter(type: Type.Base) -> Callable[[Any], Base]:
+    # Compile a function to instantiate values of the given type from parsed JSON, dispatching on
+    # the type once (instead of for each item of an array)
+
+    def mismatch(value: Any) -> Base:
+        if type.optional and value is None:
+            return Null()
+        raise Error.InputError(
+            "couldn't construct {} from input {}".format(str(type), json.dumps(value))
+        )
+
+    if isinstance(type, Type.Boolean):
+        return lambda value: Boolean(value) if value in (True, False) else mismatch(value)
+    if isinstance(type, Type.Int):
+        return lambda value: Int(value) if isinstance(value, int) else mismatch(value)
+    if isinstance(type, Type.Float):
+        return lambda value: (
+            Float(float(value)) if isinstance(value, (float, int)) else mismatch(value)
+        )
+    if isinstance(type, Type.File):
+        return lambda value: File(value) if isinstance(value, str) else mismatch(value)
+    if isinstance(type, Type.String):
+        return lambda value: String(value) if isinstance(value, str) else mismatch(value)
+    if isinstance(type, Type.Array):
+        array_type = type
+        item_class = _packed_item_class(type.item_type)
+        item = _json_converter(type.item_type)
+
+        def array(value: Any) -> Base:
+            if not isinstance(value, list):
+                return mismatch(value)
+            if item_class is not None and _packable_json(item_class, value):
+                return Array(array_type, _pack(item_class, value))
+            return Array(array_type, [item(v) for v in value])
+
+        return array
+    if isinstance(type, Type.Map) and type.item_type[0] == Type.String():
+        map_type = type
+        map_value = _json_converter(type.item_type[1])
+
+        def map(value: Any) -> Base:
+            if not isinstance(value, dict):
+                return mismatch(value)
+            return Map(map_type.item_type, [(String(k), map_value(v)) for k, v in value.items()])
+
+        return map
+    if isinstance(type, Type.StructInstance) and type.members:
+        members = type.members
+        object_type = Type.Object(members)
+        member_values = dict((k, _json_converter(ty)) for k, ty in members.items())
+
+        def struct(value: Any) -> Base:
+            if not isinstance(value, dict) or len(value) != len(members):
+                return mismatch(value)
+            try:
+                items = dict((k, member_values[k](v)) for k, v in value.items())
+            except KeyError:
+                return mismatch(value)
+            return Struct(object_type, items)
+
+        return struct
+    return mismatch
+
+
+def write_json(v: Any, write: Callable[[str], Any], indent: Optional[int] = None) -> None:
+    """
+    Write the JSON representation of ``v`` in chunks through the ``write`` function (e.g. of a
+    text file), without building ``v.json`` or its whole text in memory. The text is the same as
+    ``json.dumps(v.json, indent=indent)`` for an ``indent``, or compact (without whitespace) if
+    ``indent`` is None.
+
+    :param v: a ``WDL.Value.Base``, or a dict whose values are ``WDL.Value.Base`` (or plain JSON
+              values)
+    """
+    _write_json(v, write, indent, 0)
+
+
+def _write_json(v: Any, write: Callable[[str], Any], indent: Optional[int], level: int) -> None:
+    items: Any = None
+    if not isinstance(v, Base):
+        if not isinstance(v, dict):
+            if indent is None:
+                write(json.dumps(v, separators=(",", ":")))
+            else:
+                write(json.dumps(v, indent=indent).replace("\n", "\n" + " " * (indent * level)))
+            return
+        members = v
+    elif isinstance(v, Array):
+        items = v.value
+    elif isinstance(v, Pair):
+        items = v.value
+    elif isinstance(v, Map):
+        if not all(k.__class__ in _JSON_SCALAR_CLASSES for k, _ in v.value):
+            raise ValueError("can't write JSON for Map with non-scalar keys: " + str(v.type))
+        index = v.index
+        assert index is not None
+        # JSON object keys must be strings; stringify other scalars as json.dumps() does
+        members = dict(
+            (k if isinstance(k, str) else _json_scalar(k), item) for k, item in index.items()
+        )
+    elif isinstance(v, Struct):
+        members = v.value
+    else:
+        write(_json_scalar(v.json))
+        return
+
+    if indent is None:
+        newline = close = ""
+        separator = ","
+    else:
+        newline = "\n" + " " * (indent * (level + 1))
+        close = "\n" + " " * (indent * level)
+        separator = "," + newline
+
+    if items is not None:
+        if not items:
+            write("[]")
+            return
+        write("[" + newline)
+        packed = isinstance(items, PackedItems)
+        for i in range(0, len(items), 4096):
+            if i:
+                write(separator)
+            raw = None
+            if packed:
+                raw = items.data[i : i + 4096]
+            else:
+                chunk = items[i : i + 4096]
+                if all(item.__class__ in _JSON_SCALAR_CLASSES for item in chunk):
+                    raw = [item.value for item in chunk]
+            if raw is not None:
+                write(separator.join(map(_json_scalar, raw)))
+            else:
+                for j, item in enumerate(chunk):
+                    if j:
+                        write(separator)
+                    _write_json(item, write, indent, level + 1)
+        write(close + "]")
+        return
+
+    if not members:
+        write("{}")
+        return
+    write("{" + newline)
+    key_separator = ":" if indent is None else ": "
+    for i, (k, item) in enumerate(members.items()):
+        write((separator if i else "") + _json_string(k) + key_separator)
+        _write_json(item, write, indent, level + 1)
+    write(close + "}")
+
+
+_json_string = json.encoder.encode_basestring_ascii  # pyre-ignore
+_JSON_SCALAR_CLASSES = frozenset((Boolean, Float, Int, String, File))
+
+
+def _json_scalar(x: Any) -> str:
+    # json.dumps() for a str, int, float, bool or None (faster, for each item of large arrays)
+    cls = x.__class__
+    if cls is str:
+        return _json_string(x)
+    if cls is int:
+        return int.__repr__(x)
+    if x is None:
+        return "null"
+    if cls is bool:
+        return "true" if x else "false"
+    return json.dumps(x)
+
+
+def _packable_json(item_class: type, value: List[Any]) -> bool:
+    # whether the JSON list items are all raw values for the packed item class (leaving corner cases
+    # such as a bool for Int to from_json on each item)
+    if item_class is Float:
+        return all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in value)
+    cls = {Int: int, Boolean: bool, String: str, File: str}[item_class]
+    return all(item.__class__ is cls for item in value)
+
+
+def rewrite_files(v: Base, f: Callable[[str], str]) -> Base:
+    """
+    Produce a value like ``v``, but with the path of each ``File`` within it rewritten by ``f``.
+
+    ``v`` isn't modified; the result shares with it every subtree (and type) not containing a
+    rewritten ``File``, so that only the ``File`` leaves and their ancestors are copied.
+    """
+    if isinstance(v, File):
+        fn = f(v.value)
+        if fn == v.value:
+            return v
+        return _with_value(v, fn)
+    if isinstance(v, Array):
+        if isinstance(v.value, PackedItems):
+            if v.value.item_class is not File:
+                return v
+            paths = v.value.data
+            rewritten = [f(path) for path in paths]
+            if all(fn == path for fn, path in zip(rewritten, paths)):
+                return v
+            return _with_value(v, PackedItems(File, PathList(rewritten)))
+        items = [rewrite_files(item, f) for item in v.value]
+        if all(item is orig for item, orig in zip(items, v.value)):
+            return v
+        return _with_value(v, items)
+    if isinstance(v, Map):
+        pairs = [(rewrite_files(k, f), rewrite_files(w, f)) for (k, w) in v.value]
+        if all(k is k0 and w is w0 for ((k, w), (k0, w0)) in zip(pairs, v.value)):
+            return v
+        return _with_value(v, pairs)
+    if isinstance(v, Pair):
+        pair = (rewrite_files(v.value[0], f), rewrite_files(v.value[1], f))
+        if pair[0] is v.value[0] and pair[1] is v.value[1]:
+            return v
+        return _with_value(v, pair)
+    if isinstance(v, Struct):
+        members = dict((k, rewrite_files(w, f)) for (k, w) in v.value.items())
+        if all(members[k] is w for (k, w) in v.value.items()):
+            return v
+        return _with_value(v, members)
+    return v
+
+
+def _with_value(v: Base, value: Any) -> Base:
+    # shallow copy of v with the given raw value (bypassing __init__, which would construct a new
+    # type object)
+    ans = v.__class__.__new__(v.__class__)
+    ans.type = v.type
+    ans.value = value
+    ans.expr = v.expr
+    return ans
@@ -9,7 +9,7 @@ documents.
 import os
 import errno
 import inspect
-from typing import List, Optional, Callable, Dict, Any, Awaitable
+from typing import List, Optional, Callable, Dict, Any, Awaitable, Tuple, TextIO
 from . import _util, _parser, Error, Type, Value, Env, Expr, Tree, Walker, Lint, StdLib
 from .Tree import (
     Decl,
@@ -174,21 +174,56 @@ def values_from_json(
         namespace += "."
     ans = Env.Bindings()
     for key in values_json:
-        key2 = key
-        if namespace and key.startswith(namespace):
-            key2 = key[len(namespace) :]
-        try:
-            ty = available[key2].type
-        except KeyError:
-            raise Error.InputError("unknown input/output: " + key) from None
+        key2, ty = _json_key_type(key, available, namespace)
         ans = ans.bind(key2, Value.from_json(ty, values_json[key]))
+    _check_required(ans, required)
+    return ans
+
+
+def values_from_json_file(
+    infile: TextIO,
+    available: Env.Bindings[Tree.Decl],
+    required: Optional[Env.Bindings[Tree.Decl]] = None,
+    namespace: str = "",
+) -> Env.Bindings[Value.Base]:
+    """
+    Equivalent to ``values_from_json(json.load(infile), ...)``, but streaming: each value is
+    decoded directly into the declared type as the file is read, so that very large inputs (e.g.
+    arrays of millions of files) aren't first loaded whole as plain JSON.
+    """
+    if namespace and not namespace.endswith("."):
+        namespace += "."
+    ans = Env.Bindings()
+    stream = _util.JSONStream(infile)
+    for key in stream.members():
+        key2, ty = _json_key_type(key, available, namespace)
+        ans = ans.bind(key2, Value.from_json_stream(ty, stream))
+    stream.end()
+    _check_required(ans, required)
+    return ans
+
+
+def _json_key_type(
+    key: str, available: Env.Bindings[Tree.Decl], namespace: str
+) -> Tuple[str, Type.Base]:
+    key2 = key
+    if namespace and key.startswith(namespace):
+        key2 = key[len(namespace) :]
+    try:
+        return (key2, available[key2].type)
+    except KeyError:
+        raise Error.InputError("unknown input/output: " + key) from None
+
+
+def _check_required(
+    values: Env.Bindings[Value.Base], required: Optional[Env.Bindings[Tree.Decl]]
+) -> None:
     if required:
-        missing = required.subtract(ans)
+        missing = required.subtract(values)
         if missing:
             raise Error.InputError(
                 "missing required inputs/outputs: " + ", ".join(values_to_json(missing))
             )
-    return ans
 
 
 def values_to_json(values_env: Env.Bindings[Value.Base], namespace: str = "") -> Dict[str, Any]:
@@ -3,17 +3,35 @@
 
 import sys
 import os
+import re
 import json
 import logging
 import signal
 import threading
-from time import sleep
+import select
+import struct
+import ctypes
+import ctypes.util
+from time import sleep, monotonic
 from datetime import datetime
 from contextlib import contextmanager
-from typing import Tuple, Dict, Set, Iterable, Iterator, List, TypeVar, Generic, Optional, Callable
+from typing import (
+    Tuple,
+    Dict,
+    Set,
+    Iterable,
+    Iterator,
+    List,
+    TypeVar,
+    Generic,
+    Optional,
+    Callable,
+    BinaryIO,
+    TextIO,
+    Any,
+)
 from types import FrameType
 import coloredlogs
-from pygtail import Pygtail
 import docker
 
 __all__: List[str] = []
@@ -145,17 +163,243 @@ def topsort(adj: AdjM[T]) -> List[T]:
     return ans
 
 
+# write_values_json() output without indentation (set from the CLI)
+values_json_compact: bool = False
+
+
 @export
 def write_values_json(
-    values_env: "Env.Bindings[Value.Base]", filename: str, namespace: str = ""
+    values_env: "Env.Bindings[Value.Base]",
+    filename: str,
+    namespace: str = "",
+    extra: Optional[Dict[str, Any]] = None,
+    compact: Optional[bool] = None,
 ) -> None:
-    from . import values_to_json
+    """
+    Write the Cromwell-style JSON of the values to the file, streaming each value's JSON text
+    instead of building it in memory. The output is the same as ``json.dumps(values_to_json(...),
+    indent=2)`` unless ``compact`` (defaulting to ``values_json_compact``), which omits whitespace.
+    """
+    from .Value import write_json
 
-    with open(filename, "w") as outfile:
-        print(
-            json.dumps(values_to_json(values_env, namespace=namespace), indent=2),  # pyre-ignore
-            file=outfile,
-        )
+    if namespace and not namespace.endswith("."):
+        namespace += "."
+    # (as values_to_json: a later binding of the same name takes the place of an earlier one)
+    j: Dict[str, Any] = {}
+    for item in values_env:
+        j[namespace + item.name] = item.value
+    if extra:
+        j.update(extra)
+    compact = values_json_compact if compact is None else compact
+    with open(filename, "w", buffering=1048576) as outfile:
+        write_json(j, outfile.write, indent=(None if compact else 2))
+        outfile.write("\n")
+
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_DELIMITERS = frozenset(" \t\n\r,:]}")
+_JSON_ITEM_SEPARATOR = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+_JSON_ARRAY_BATCH = 65536
+
+
+@export
+class JSONStream:
+    """
+    Incremental reader of JSON text from a file object, for decoding large documents without
+    reading them into memory whole. The caller steps through the members of objects and the items
+    of arrays, consuming each as it goes; other values are decoded by the ``json`` module.
+    """
+
+    _infile: TextIO
+    _chunk_size: int
+    _buf: str
+    _pos: int
+    _eof: bool
+
+    def __init__(self, infile: TextIO, chunk_size: int = 1048576) -> None:
+        self._infile = infile
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+        self._scan = json.scanner.make_scanner(self._decoder)  # pyre-ignore
+
+    def _read(self) -> bool:
+        # append the next chunk to the unconsumed part of the buffer; at least doubling it, so that
+        # retrying to decode a large value costs amortized linear time
+        if self._eof:
+            return False
+        chunk = self._infile.read(max(self._chunk_size, len(self._buf) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _error(self, msg: str) -> None:
+        raise json.JSONDecodeError(msg, self._buf, self._pos)
+
+    def _expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            self._error(f"Expecting '{ch}'")
+        self._pos += 1
+
+    def peek(self) -> str:
+        """
+        Skip whitespace and return the next character, or the empty string at the end of the input
+        """
+        while True:
+            self._pos = _JSON_WHITESPACE.match(self._buf, self._pos).end()  # pyre-ignore
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read():
+                return ""
+
+    def value(self) -> Any:
+        "Decode the next complete value"
+        self.peek()
+        while True:
+            try:
+                ans, end = self._decoder.raw_decode(self._buf, self._pos)
+                # unless followed by a delimiter, a number might continue in the next chunk
+                if self._eof or (end < len(self._buf) and self._buf[end] in _JSON_DELIMITERS):
+                    self._pos = end
+                    return ans
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read()
+
+    def members(self) -> Iterator[str]:
+        """
+        Step through an object, yielding each key. The caller consumes the corresponding value
+        before resuming the iterator.
+        """
+        self._expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                self._error("Expecting property name enclosed in double quotes")
+            key = self.value()
+            self._expect(":")
+            yield key
+            if self.peek() == "}":
+                self._pos += 1
+                return
+            self._expect(",")
+
+    def items(self) -> Iterator[None]:
+        """
+        Step through an array, yielding before each item, which the caller consumes before resuming
+        the iterator.
+        """
+        self._expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield None
+            if self.peek() == "]":
+                self._pos += 1
+                return
+            self._expect(",")
+
+    def array(self) -> Iterator[Any]:
+        """
+        Step through an array, yielding each item decoded (like ``items()`` followed by ``value()``
+        for each, but faster)
+        """
+        self._expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        whitespace = _JSON_WHITESPACE.match
+        separator = _JSON_ITEM_SEPARATOR.match
+        individually = 0
+        while True:
+            buf = self._buf
+            pos = self._pos
+            if not individually:
+                # Decode a batch of items at once: those preceding the last comma in the next
+                # window of the buffer. If that comma is actually inside an item, then the
+                # truncated text fails to parse (with a string or brackets left unterminated), and
+                # we decode some items individually instead.
+                comma = buf.rfind(",", pos, pos + _JSON_ARRAY_BATCH)
+                if comma > pos:
+                    try:
+                        items = self._decoder.decode("[" + buf[pos:comma] + "]")
+                    except json.JSONDecodeError:
+                        individually = 64
+                    else:
+                        self._pos = whitespace(buf, comma + 1).end()  # pyre-ignore
+                        yield from items
+                        continue
+            try:
+                item, end = self._scan(buf, pos)
+                sep = separator(buf, end)
+            except (StopIteration, json.JSONDecodeError):
+                sep = end = None
+            if sep is None:
+                # item or separator incomplete at the end of the buffer
+                if self._read():
+                    # (whitespace following a separator might have continued into the new chunk)
+                    self._pos = whitespace(self._buf, self._pos).end()  # pyre-ignore
+                    continue
+                if end is None:
+                    self._decoder.raw_decode(buf, pos)  # raises appropriate error
+                self._pos = whitespace(buf, end).end()  # pyre-ignore
+                self._error("Expecting ',' delimiter")
+            self._pos = sep.end()
+            individually = max(individually - 1, 0)
+            yield item
+            if sep.group(1) == "]":
+                return
+
+    def end(self) -> None:
+        "Check that nothing but whitespace remains"
+        if self.peek():
+            self._error("Extra data")
+
+
+_byte_size_units = {
+    "": 1,
+    "b": 1,
+    "k": 1000,
+    "kb": 1000,
+    "ki": 1024,
+    "kib": 1024,
+    "m": 1000 ** 2,
+    "mb": 1000 ** 2,
+    "mi": 1024 ** 2,
+    "mib": 1024 ** 2,
+    "g": 1000 ** 3,
+    "gb": 1000 ** 3,
+    "gi": 1024 ** 3,
+    "gib": 1024 ** 3,
+    "t": 1000 ** 4,
+    "tb": 1000 ** 4,
+    "ti": 1024 ** 4,
+    "tib": 1024 ** 4,
+}
+
+
+@export
+def parse_byte_size(s: str) -> int:
+    """
+    Convert a string like "4 GiB", "500M", or "1.5G" into a number of bytes. Units are
+    case-insensitive, decimal (K, KB, M, MB, ...) or binary (Ki, KiB, Mi, MiB, ...). A bare number
+    is taken as bytes.
+
+    :raise ValueError: unparseable string
+    """
+    m = re.fullmatch(r"\s*([0-9]+(\.[0-9]*)?)\s*([A-Za-z]*)\s*", s)
+    if not m or m.group(3).lower() not in _byte_size_units:
+        raise ValueError("invalid byte size string: " + s)
+    return int(float(m.group(1)) * _byte_size_units[m.group(3).lower()])
 
 
 @export
@@ -227,38 +471,230 @@ def install_coloredlogs(logger: logging.Logger) -> None:
     )
 
 
-@export
-@contextmanager
-def PygtailLogger(
-    logger: logging.Logger, filename: str, prefix: str = "2| "
-) -> Iterator[Callable[[], None]]:
-    """
-    Helper for streaming task stderr into logger using pygtail. Context manager yielding a function
-    which reads the latest lines from the file and writes them into logger at verbose level. This
-    function also runs automatically on context exit.
-    """
-    pygtail = Pygtail(filename, full_lines=True)
-    pygtail_ok = True
+class _Tailer:
+    # Process-wide singleton thread which follows all the files currently registered by TailLogger
+    # contexts, logging their new lines as they're appended. On Linux it uses inotify to wake up
+    # only when some file is modified; elsewhere (or if inotify fails), it falls back to polling.
+    # Either way it keeps each file open and just read()s from the last position, without
+    # re-opening or re-stat-ing the files, nor writing any offset files.
 
-    def poll() -> None:
-        nonlocal pygtail_ok
-        if pygtail_ok:
+    _IN_MODIFY = 0x00000002
+    _SWEEP_SECONDS = 2.0  # with inotify, read all files at this interval anyway
+    _POLL_SECONDS = 0.5  # without inotify, read all files at this interval
+
+    _instance: "Optional[_Tailer]" = None
+    _instance_lock: threading.Lock = threading.Lock()
+
+    _lock: threading.Lock
+    _files: "Dict[int, _TailFile]"
+    _wds: Dict[int, int]
+    _inotify_fd: Optional[int]
+    _libc: "Optional[ctypes.CDLL]"
+    _thread: threading.Thread
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._files = {}
+        self._wds = {}
+        self._inotify_fd = None
+        self._libc = None
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                if fd >= 0:
+                    self._libc = libc
+                    self._inotify_fd = fd
+            except (OSError, AttributeError):
+                pass
+        self._thread = threading.Thread(target=self._loop, name="miniwdl-tailer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get(cls) -> "_Tailer":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = _Tailer()
+            return cls._instance
+
+    def register(self, tail: "_TailFile") -> None:
+        with self._lock:
+            self._files[id(tail)] = tail
+            if self._inotify_fd is not None:
+                assert self._libc is not None
+                wd = self._libc.inotify_add_watch(
+                    self._inotify_fd, tail.filename.encode(), self._IN_MODIFY
+                )
+                if wd >= 0:
+                    tail.wd = wd
+                    self._wds[wd] = self._wds.get(wd, 0) + 1
+        tail.read()
+
+    def unregister(self, tail: "_TailFile") -> None:
+        with self._lock:
+            del self._files[id(tail)]
+            if tail.wd is not None:
+                assert self._libc is not None and self._inotify_fd is not None
+                self._wds[tail.wd] -= 1
+                if not self._wds[tail.wd]:
+                    # (the same file registered twice yields the same watch descriptor)
+                    del self._wds[tail.wd]
+                    self._libc.inotify_rm_watch(self._inotify_fd, tail.wd)
+        tail.read(final=True)
+
+    def _loop(self) -> None:
+        last_sweep = monotonic()
+        while True:
+            wds = None
+            if self._inotify_fd is not None:
+                ready, _, _ = select.select([self._inotify_fd], [], [], self._SWEEP_SECONDS)
+                if ready:
+                    wds = self._read_events()
+                    # read all the files after an event queue overflow (which loses events, and
+                    # reports wd -1), or if they haven't all been read for a while (in case some
+                    # modifications don't generate events, e.g. from another host on NFS)
+                    if -1 in wds or monotonic() - last_sweep >= self._SWEEP_SECONDS:
+                        wds = None
+            else:
+                sleep(self._POLL_SECONDS)
+            if wds is None:
+                last_sweep = monotonic()
+            with self._lock:
+                tails = [tail for tail in self._files.values() if wds is None or tail.wd in wds]
+            for tail in tails:
+                tail.read()
+
+    def _read_events(self) -> Set[int]:
+        # read pending inotify events & return the set of watch descriptors mentioned
+        ans = set()
+        try:
+            buf = os.read(self._inotify_fd, 65536)  # pyre-ignore
+        except BlockingIOError:
+            return ans
+        pos = 0
+        while pos + 16 <= len(buf):
+            wd, _, _, name_len = struct.unpack_from("iIII", buf, pos)
+            ans.add(wd)
+            pos += 16 + name_len
+        return ans
+
+
+class _TailFile:
+    # the state of one file followed by _Tailer
+    filename: str
+    logger: logging.Logger
+    prefix: str
+    wd: Optional[int]
+    _file: Optional[BinaryIO]
+    _partial: bytes
+    _lock: threading.Lock
+    _ok: bool
+
+    def __init__(self, logger: logging.Logger, filename: str, prefix: str) -> None:
+        self.filename = filename
+        self.logger = logger
+        self.prefix = prefix
+        self.wd = None
+        self._file = None
+        self._partial = b""
+        self._lock = threading.Lock()
+        self._ok = True
+
+    def read(self, final: bool = False) -> None:
+        # log any new complete lines (or, if final, also the last incomplete line)
+        with self._lock:
+            if not self._ok:
+                return
             try:
-                for line in pygtail:
-                    logger.verbose(prefix + line.rstrip())  # pyre-ignore
-            except:
-                pygtail_ok = False
-                # cf. https://github.com/bgreenlee/pygtail/issues/48
-                logger.verbose(  # pyre-ignore
+                if self._file is None:
+                    if not os.path.exists(self.filename) and not final:
+                        return
+                    self._file = open(self.filename, "rb")
+                file = self._file
+                assert file is not None
+                lines = (self._partial + file.read()).split(b"\n")
+                self._partial = lines.pop()
+                if final:
+                    if self._partial:
+                        lines.append(self._partial)
+                    self._partial = b""
+                    file.close()
+                    self._file = None
+                    self._ok = False
+                for line in lines:
+                    self.logger.verbose(  # pyre-ignore
+                        self.prefix + line.decode("utf-8", errors="replace").rstrip()
+                    )
+            except Exception:
+                self._ok = False
+                self.logger.verbose(  # pyre-ignore
                     "incomplete log stream due to the following exception; see %s",
-                    filename,
+                    self.filename,
                     exc_info=sys.exc_info(),
                 )
 
+
+@export
+@contextmanager
+def TailLogger(logger: logging.Logger, filename: str, prefix: str = "2| ") -> Iterator[None]:
+    """
+    Helper for streaming task stderr into logger. Within the context, lines appended to the file
+    are written into logger at verbose level, promptly as they're written. A single background
+    thread per process serves all the open contexts. On context exit, any remaining lines are
+    logged, including an incomplete last line.
+    """
+    tail = _TailFile(logger, filename, prefix)
+    tailer = _Tailer.get()
+    tailer.register(tail)
+    try:
+        yield
+    finally:
+        tailer.unregister(tail)
+
+
+@export
+@contextmanager
+def ExprProfiling(logger: logging.Logger, run_dir: str) -> Iterator[None]:
+    """
+    Context manager for a task or workflow run, when expression profiling is enabled (by setting
+    ``WDL.Expr.profiler``). Profiles the expression evaluations within the context separately,
+    then logs the top entries and writes the full report into ``profile.json`` in the run
+    directory, and finally adds the statistics into the enclosing profiler.
+    """
+    from . import Expr
+
+    outer = Expr.profiler
+    if outer is None:
+        yield
+        return
+    profiler = Expr.profiler = Expr.Profiler()
     try:
-        yield poll
+        yield
     finally:
-        poll()
+        Expr.profiler = outer
+        outer.merge(profiler)
+        report = profiler.report
+        if report:
+            logger.notice(  # pyre-fixme
+                "expression profile (top %d of %d, by cumulative seconds):",
+                min(len(report), 10),
+                len(report),
+            )
+            for entry in report[:10]:
+                logger.notice(  # pyre-fixme
+                    "%10.3fs %8dx %10d values  %s (Ln %d Col %d)",
+                    entry.seconds,
+                    entry.count,
+                    entry.size,
+                    entry.label if len(entry.label) <= 60 else entry.label[:57] + "...",
+                    entry.pos.line,
+                    entry.pos.column,
+                )
+            try:
+                with open(os.path.join(run_dir, "profile.json"), "w") as outfile:
+                    print(json.dumps([entry.json for entry in report], indent=2), file=outfile)
+            except Exception:
+                logger.exception("failed to write expression profile")
 
 
 @export
@@ -24,6 +24,29 @@ class CommandFailure(_RuntimeError):
         self.stderr_file = stderr_file
 
 
+class OutOfMemory(CommandFailure):
+    """
+    The task command was killed for exceeding its memory limit (``runtime.memory``)
+    """
+
+    def __init__(self, exit_status: int, stderr_file: str) -> None:
+        super().__init__(
+            exit_status,
+            stderr_file,
+            f"task command killed for exceeding its memory limit (exit status {exit_status})",
+        )
+
+
+class ContainerFailure(_RuntimeError, RuntimeError):
+    """
+    Transient failure of the container infrastructure, as opposed to the task command itself (e.g.
+    a docker API timeout, or a swarm task rejected or orphaned by a node hiccup); the task may
+    succeed if retried
+    """
+
+    pass
+
+
 class Terminated(_RuntimeError):
     """
     Workflow/task was terminated, e.g. by Unix signal
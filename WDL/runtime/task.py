@@ -5,28 +5,119 @@ Local task runner
 import logging
 import os
 import json
-import copy
 import traceback
-import glob
+import re
+import fnmatch
 import time
 import math
 import multiprocessing
+import shutil
+import tempfile
+import threading
+import uuid
+import random
+import contextlib
+import shlex
+import hashlib
+import concurrent.futures
 from abc import ABC, abstractmethod
-from typing import Tuple, List, Dict, Optional, Callable
+from typing import Tuple, List, Dict, Set, Optional, Callable, Iterable, Any
 
-from requests.exceptions import ReadTimeout
+from requests.exceptions import ReadTimeout, ConnectionError as RequestsConnectionError
 import docker
 from .. import Error, Type, Env, Expr, Value, StdLib, Tree, _util
 from .._util import (
     write_values_json,
     provision_run_dir,
     LOGGING_FORMAT,
-    PygtailLogger,
+    TailLogger,
     TerminationSignalFlag,
 )
 from .error import *
 
 
+class TaskTimer:
+    """
+    Records the time at which each phase of a task run ends (input evaluation, command
+    interpolation, container scheduling & startup, command execution, output evaluation, etc.),
+    using the monotonic clock, for a breakdown of where the time went.
+    """
+
+    start_time: float
+    """
+    :type: float
+
+    wall-clock time (seconds since the epoch) when the timer started
+    """
+
+    timeline: Dict[str, float]
+    """
+    :type: Dict[str,float]
+
+    seconds from the start until the end of each phase so far, in order
+    """
+
+    filename: str = "timing.json"
+    _t0: float
+
+    def __init__(self) -> None:
+        self.start_time = time.time()
+        self._t0 = time.monotonic()
+        self.timeline = {}
+
+    def mark(self, phase: str) -> None:
+        """
+        Record the end of the phase (now), unless it was already recorded
+        """
+        if phase not in self.timeline:
+            self.timeline[phase] = round(time.monotonic() - self._t0, 6)
+
+    def retry(self, phase: str, keep: Iterable[str]) -> "TaskTimer":
+        """
+        Continue timing with a new timer, for a retry of the phases other than ``keep`` (which it
+        copies). The new timer has the same start, and records everything since the last kept
+        phase (e.g. a failed attempt and the delay before retrying it) as the given ``phase``.
+        """
+        ans = TaskTimer()
+        ans.start_time = self.start_time
+        ans._t0 = self._t0
+        ans.timeline = {p: t for p, t in self.timeline.items() if p in keep}
+        ans.mark(phase)
+        return ans
+
+    @property
+    def phases(self) -> Dict[str, float]:
+        """
+        :type: Dict[str,float]
+
+        duration of each phase in seconds, in order
+        """
+        ans = {}
+        t = 0.0
+        for phase, end in self.timeline.items():
+            ans[phase] = round(end - t, 6)
+            t = end
+        return ans
+
+    def write(self, host_dir: str) -> None:
+        """
+        Write ``timing.json`` into the task run directory
+        """
+        with open(os.path.join(host_dir, self.filename), "w") as outfile:
+            print(
+                json.dumps(
+                    {
+                        "start_time": self.start_time,
+                        "timeline": self.timeline,
+                        "phases": self.phases,
+                        "total_seconds": max(self.timeline.values(), default=0.0),
+                    },
+                    indent=2,
+                ),
+                file=outfile,
+            )
+
+
 class TaskContainer(ABC):
     """
     Base class for task containers, subclassed by runtime-specific
@@ -59,14 +150,37 @@ class TaskContainer(ABC):
     maintained by ``add_files``.
     """
 
+    timer: TaskTimer
+    """
+    :type: TaskTimer
+
+    records the phases of the task run, including the container's
+    """
+
+    _input_file_map_rev: Dict[str, str]
+    # reverse index of input_file_map (in-container path to host path), for host_file() lookups
+
     _running: bool
+    _oom_killed: bool = False
 
     def __init__(self, run_id: str, host_dir: str) -> None:
         self.run_id = run_id
         self.host_dir = host_dir
         self.container_dir = "/mnt/miniwdl_task_container"
         self.input_file_map = {}
+        self._input_file_map_rev = {}
         self._running = False
+        self.timer = TaskTimer()
+
+    @property
+    def container_inputs_dir(self) -> str:
+        """
+        :type: str
+
+        The in-container directory under which ``add_files`` mounts input files; by default
+        ``{container_dir}/inputs/``.
+        """
+        return os.path.join(self.container_dir, "inputs")
 
     def add_files(self, host_files: List[str]) -> None:
         """
@@ -92,18 +206,26 @@ class TaskContainer(ABC):
         for files in host_files_by_dir.values():
             dn = str(len(self.input_file_map))
             for host_file in files:
-                self.input_file_map[host_file] = os.path.join(
-                    self.container_dir, "inputs", dn, os.path.basename(host_file)
+                container_file = os.path.join(
+                    self.container_inputs_dir, dn, os.path.basename(host_file)
                 )
-
-    def run(self, logger: logging.Logger, command: str, cpu: int) -> None:
+                if host_file in self.input_file_map:
+                    del self._input_file_map_rev[self.input_file_map[host_file]]
+                self.input_file_map[host_file] = container_file
+                self._input_file_map_rev[container_file] = host_file
+
+    def run(
+        self, logger: logging.Logger, command: str, cpu: int, memory: Optional[int] = None
+    ) -> None:
         """
-        1. Container is instantiated
+        1. Container is instantiated, reserving ``cpu`` CPUs and ``memory`` bytes of memory (if
+           specified)
         2. Command is executed in ``{host_dir}/work/`` (where {host_dir} is mounted to
            {container_dir} inside the container)
         3. Standard output is written to ``{host_dir}/stdout.txt``
         4. Standard error is written to ``{host_dir}/stderr.txt`` and logged at VERBOSE level
-        5. Raises CommandFailure for nonzero exit code, or any other error
+        5. Raises CommandFailure for nonzero exit code (OutOfMemory if the command was killed for
+           exceeding the memory limit), or any other error
 
         The container is torn down in any case, including SIGTERM/SIGHUP signal which is trapped.
         """
@@ -116,20 +238,29 @@ class TaskContainer(ABC):
                 self._running = True
                 try:
                     os.makedirs(os.path.join(self.host_dir, "work"))
-                    exit_status = self._run(logger, terminating, command, cpu)
+                    exit_status = self._run(logger, terminating, command, cpu, memory)
                 finally:
                     self._running = False
 
                 if terminating():
                     raise Terminated()
                 if exit_status != 0:
-                    raise CommandFailure(exit_status, os.path.join(self.host_dir, "stderr.txt"))
+                    stderr_file = os.path.join(self.host_dir, "stderr.txt")
+                    if self._oom_killed:
+                        raise OutOfMemory(exit_status, stderr_file)
+                    raise CommandFailure(exit_status, stderr_file)
 
     @abstractmethod
     def _run(
-        self, logger: logging.Logger, terminating: Callable[[], bool], command: str, cpu: int
+        self,
+        logger: logging.Logger,
+        terminating: Callable[[], bool],
+        command: str,
+        cpu: int,
+        memory: Optional[int],
     ) -> int:
-        # run command in container & return exit status
+        # run command in container & return exit status. set _oom_killed if the container was
+        # killed for exceeding its memory limit.
         raise NotImplementedError()
 
     def host_file(self, container_file: str, inputs_only: bool = False) -> str:
@@ -148,13 +279,9 @@ class TaskContainer(ABC):
             ]:
                 return os.path.join(self.host_dir, os.path.basename(container_file))
             # handle output of an input file
-            host_input_files = [
-                host_input_file
-                for (host_input_file, container_input_file) in self.input_file_map.items()
-                if container_input_file == container_file
-            ]
-            if host_input_files:
-                return host_input_files[0]
+            host_input_file = self._input_file_map_rev.get(container_file, None)
+            if host_input_file is not None:
+                return host_input_file
             if inputs_only:
                 raise Error.InputError(
                     "task inputs attempted to use a non-input or non-existent file "
@@ -177,6 +304,216 @@ class TaskContainer(ABC):
             )
         raise OutputError("task output file not found: " + container_file)
 
+    def host_files(
+        self, container_files: Iterable[str], inputs_only: bool = False
+    ) -> Dict[str, str]:
+        """
+        Map many in-container paths at once, as ``host_file`` would each one; returns a dict from
+        each distinct in-container path to the host path.
+        """
+        ans = {}
+        pipe_files = dict(
+            (os.path.join(self.container_dir, pipe_file), os.path.join(self.host_dir, pipe_file))
+            for pipe_file in ["stdout.txt", "stderr.txt"]
+        )
+        container_workdir = os.path.join(self.container_dir, "work")
+        host_workdir = os.path.join(self.host_dir, "work")
+        host_workdir_real = os.path.realpath(host_workdir)
+        for container_file in container_files:
+            if container_file in ans:
+                continue
+            if container_file in pipe_files:
+                ans[container_file] = pipe_files[container_file]
+                continue
+            host_input_file = self._input_file_map_rev.get(container_file, None)
+            if host_input_file is not None:
+                ans[container_file] = host_input_file
+                continue
+            if (
+                not inputs_only
+                and host_workdir_real == host_workdir
+                and container_file.startswith(container_workdir + "/")
+                and "/." not in container_file
+                and "//" not in container_file
+            ):
+                # fast path for the common case of a plain relative path in the working directory:
+                # we still need realpath() to follow any symlinks, but can skip relpath() etc.
+                ans_file = os.path.realpath(host_workdir + container_file[len(container_workdir) :])
+                if ans_file.startswith(host_workdir + "/") and os.path.isfile(ans_file):
+                    ans[container_file] = ans_file
+                    continue
+            # general case (including all error cases)
+            ans[container_file] = self.host_file(container_file, inputs_only=inputs_only)
+        return ans
+
+
+class ContainerResourceSampler:
+    """
+    Samples a running container's resource usage (CPU time, memory, block I/O) by reading its
+    control group statistics from the host's cgroup filesystem, which is inexpensive enough to do on
+    every container poll. Supports cgroup v1 & v2 with either the cgroupfs or systemd cgroup driver.
+    If the container's cgroup can't be found (e.g. swarm scheduled it on another node), sampling is
+    silently disabled.
+
+    ``write()`` records the time series in ``resources.tsv`` and the summary in ``resources.json``.
+    """
+
+    container_id: str
+    cgroup_root: str
+    samples: List[Tuple[float, float, int, int, int]]
+    """
+    time series of (elapsed seconds, CPU seconds, memory bytes, I/O bytes read, I/O bytes written)
+    """
+
+    columns: List[str] = [
+        "elapsed_seconds",
+        "cpu_seconds",
+        "mem_bytes",
+        "io_read_bytes",
+        "io_write_bytes",
+    ]
+
+    _t0: float
+    _peak_mem: int
+    _dirs: Optional[Dict[str, str]]
+    _ok: bool
+
+    def __init__(self, container_id: str, cgroup_root: str = "/sys/fs/cgroup") -> None:
+        self.container_id = container_id
+        self.cgroup_root = cgroup_root
+        self.samples = []
+        self._t0 = time.monotonic()
+        self._peak_mem = 0
+        self._dirs = None
+        self._ok = True
+
+    def _locate(self) -> Optional[Dict[str, str]]:
+        # find the container's cgroup directory for each controller of interest
+        cid = self.container_id
+        leaves = [os.path.join("docker", cid), os.path.join("system.slice", f"docker-{cid}.scope")]
+        # cgroup v2 (unified hierarchy)
+        if os.path.isfile(os.path.join(self.cgroup_root, "cgroup.controllers")):
+            for leaf in leaves:
+                dn = os.path.join(self.cgroup_root, leaf)
+                if os.path.isdir(dn):
+                    return {"version": "2", "cpu": dn, "memory": dn, "io": dn}
+            return None
+        # cgroup v1
+        for leaf in leaves:
+            ans = {"version": "1"}
+            for key, controller in [("cpu", "cpuacct"), ("memory", "memory"), ("io", "blkio")]:
+                dn = os.path.join(self.cgroup_root, controller, leaf)
+                if os.path.isdir(dn):
+                    ans[key] = dn
+            if len(ans) == 4:
+                return ans
+        return None
+
+    def sample(self, logger: logging.Logger) -> None:
+        """
+        Take one sample of the container's resource usage
+        """
+        if not self._ok:
+            return
+        try:
+            if self._dirs is None:
+                self._dirs = self._locate()
+                if self._dirs is None:
+                    self._ok = False
+                    logger.debug("container cgroup not found; resource usage won't be recorded")
+                    return
+                logger.debug("container cgroup: %s", str(self._dirs))
+            elapsed = time.monotonic() - self._t0
+            if self._dirs["version"] == "2":
+                cpu, mem, peak, io_read, io_write = self._sample_v2(self._dirs)
+            else:
+                cpu, mem, peak, io_read, io_write = self._sample_v1(self._dirs)
+        except FileNotFoundError:
+            # cgroup torn down upon container exit
+            return
+        except Exception:
+            self._ok = False
+            logger.debug("failed reading container cgroup; resource usage won't be recorded")
+            logger.debug(traceback.format_exc())
+            return
+        self._peak_mem = max(self._peak_mem, peak, mem)
+        self.samples.append((round(elapsed, 3), cpu, mem, io_read, io_write))
+
+    @staticmethod
+    def _sample_v1(dirs: Dict[str, str]) -> Tuple[float, int, int, int, int]:
+        with open(os.path.join(dirs["cpu"], "cpuacct.usage")) as infile:
+            cpu = int(infile.read()) / 1e9
+        with open(os.path.join(dirs["memory"], "memory.usage_in_bytes")) as infile:
+            mem = int(infile.read())
+        with open(os.path.join(dirs["memory"], "memory.max_usage_in_bytes")) as infile:
+            peak = int(infile.read())
+        io_read = 0
+        io_write = 0
+        with open(os.path.join(dirs["io"], "blkio.throttle.io_service_bytes")) as infile:
+            for line in infile:
+                fields = line.split()
+                if len(fields) == 3 and fields[1] == "Read":
+                    io_read += int(fields[2])
+                elif len(fields) == 3 and fields[1] == "Write":
+                    io_write += int(fields[2])
+        return (cpu, mem, peak, io_read, io_write)
+
+    @staticmethod
+    def _sample_v2(dirs: Dict[str, str]) -> Tuple[float, int, int, int, int]:
+        cpu = 0.0
+        with open(os.path.join(dirs["cpu"], "cpu.stat")) as infile:
+            for line in infile:
+                fields = line.split()
+                if len(fields) == 2 and fields[0] == "usage_usec":
+                    cpu = int(fields[1]) / 1e6
+        with open(os.path.join(dirs["memory"], "memory.current")) as infile:
+            mem = int(infile.read())
+        peak = 0
+        if os.path.isfile(os.path.join(dirs["memory"], "memory.peak")):
+            with open(os.path.join(dirs["memory"], "memory.peak")) as infile:
+                peak = int(infile.read())
+        io_read = 0
+        io_write = 0
+        with open(os.path.join(dirs["io"], "io.stat")) as infile:
+            for line in infile:
+                for field in line.split()[1:]:
+                    if field.startswith("rbytes="):
+                        io_read += int(field[7:])
+                    elif field.startswith("wbytes="):
+                        io_write += int(field[7:])
+        return (cpu, mem, peak, io_read, io_write)
+
+    @property
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summary of the resource usage sampled so far
+        """
+        if not self.samples:
+            return {"samples": 0}
+        elapsed, cpu, _, io_read, io_write = self.samples[-1]
+        return {
+            "samples": len(self.samples),
+            "elapsed_seconds": elapsed,
+            "cpu_seconds": round(cpu, 3),
+            "mean_cpus": round(cpu / elapsed, 3) if elapsed > 0 else 0.0,
+            "peak_mem_bytes": self._peak_mem,
+            "io_read_bytes": io_read,
+            "io_write_bytes": io_write,
+        }
+
+    def write(self, host_dir: str) -> None:
+        """
+        Write ``resources.tsv`` and ``resources.json`` into the given directory
+        """
+        if not self.samples:
+            return
+        with open(os.path.join(host_dir, "resources.tsv"), "w") as outfile:
+            print("\t".join(ContainerResourceSampler.columns), file=outfile)
+            for sample in self.samples:
+                print("\t".join(str(x) for x in sample), file=outfile)
+        with open(os.path.join(host_dir, "resources.json"), "w") as outfile:
+            print(json.dumps(self.summary, indent=2), file=outfile)
+
 
 class TaskDockerContainer(TaskContainer):
     """
@@ -190,9 +527,40 @@ class TaskDockerContainer(TaskContainer):
     docker image tag (set as desired before running)
     """
 
+    resource_sampler: Optional[ContainerResourceSampler] = None
+    """
+    :type: Optional[ContainerResourceSampler]
+
+    samples the container's resource usage while it's running, once its ID is known
+    """
+
+    _container_id: Optional[str] = None
+
     def _run(
-        self, logger: logging.Logger, terminating: Callable[[], bool], command: str, cpu: int
+        self,
+        logger: logging.Logger,
+        terminating: Callable[[], bool],
+        command: str,
+        cpu: int,
+        memory: Optional[int],
     ) -> int:
+        mounts = self.prepare_mounts(command)
+        return self.run_service(
+            logger,
+            terminating,
+            "/bin/bash ../command >> ../stdout.txt 2>> ../stderr.txt",
+            os.path.join(self.container_dir, "work"),
+            mounts,
+            cpu,
+            memory,
+            [(logger, os.path.join(self.host_dir, "stderr.txt"))],
+        )
+
+    def prepare_mounts(self, command: str) -> List[str]:
+        """
+        Write the command & create the standard output/error files in ``host_dir``, and return the
+        docker mounts (``host_path:container_path:mode``) needed to run it
+        """
         with open(os.path.join(self.host_dir, "command"), "x") as outfile:
             outfile.write(command)
         pipe_files = ["stdout.txt", "stderr.txt"]
@@ -215,6 +583,24 @@ class TaskDockerContainer(TaskContainer):
         mounts.append(
             f"{os.path.join(self.host_dir, 'work')}:{os.path.join(self.container_dir, 'work')}:rw"
         )
+        return mounts
+
+    def run_service(
+        self,
+        logger: logging.Logger,
+        terminating: Callable[[], bool],
+        shell_command: str,
+        workdir: str,
+        mounts: List[str],
+        cpu: int,
+        memory: Optional[int],
+        stderr_files: List[Tuple[logging.Logger, str]],
+    ) -> int:
+        """
+        Run ``shell_command`` in a container with the given mounts (as a transient docker swarm
+        service), streaming each of ``stderr_files`` into its logger; return the container exit
+        code. Sets ``_oom_killed`` and writes the container resource usage into ``host_dir``.
+        """
         logger.debug("docker mounts: " + str(mounts))
 
         # connect to dockerd
@@ -226,42 +612,59 @@ class TaskDockerContainer(TaskContainer):
             logger.info("docker starting image {}".format(self.image_tag))
             svc = client.services.create(
                 self.image_tag,
-                command=[
-                    "/bin/bash",
-                    "-c",
-                    "/bin/bash ../command >> ../stdout.txt 2>> ../stderr.txt",
-                ],
+                command=["/bin/bash", "-c", shell_command],
                 # restart_policy 'none' so that swarm runs the container just once
                 restart_policy=docker.types.RestartPolicy("none"),
-                workdir=os.path.join(self.container_dir, "work"),
+                workdir=workdir,
                 mounts=mounts,
                 resources=docker.types.Resources(
                     # the unit expected by swarm is "NanoCPUs"
                     cpu_limit=cpu * 1_000_000_000,
                     cpu_reservation=cpu * 1_000_000_000,
+                    mem_limit=memory,
+                    mem_reservation=memory,
                 ),
             )
             logger.debug("docker service name = {}, id = {}".format(svc.name, svc.short_id))
+            self.timer.mark("service_create")
 
             exit_code = None
             # stream stderr into log
-            with PygtailLogger(logger, os.path.join(self.host_dir, "stderr.txt")) as poll_stderr:
+            with contextlib.ExitStack() as tailers:
+                for stderr_logger, stderr_file in stderr_files:
+                    tailers.enter_context(TailLogger(stderr_logger, stderr_file))
                 # poll for container exit
                 i = 0
                 while exit_code is None:
-                    poll_stderr()
                     # poll frequently in the first few seconds (QoS for short-running tasks)
                     time.sleep(1.05 - math.exp(i / -10.0))
                     if terminating():
                         raise Terminated() from None
                     exit_code = self.poll_service(logger, svc)
+                    if exit_code is None and self._container_id:
+                        if not self.resource_sampler:
+                            self.resource_sampler = ContainerResourceSampler(self._container_id)
+                        self.resource_sampler.sample(logger)
                     i += 1
+                self.timer.mark("command")
                 logger.info("container exit code = " + str(exit_code))
+                if exit_code != 0 and memory:
+                    self._oom_killed = self.check_oom_killed(logger, client)
 
             # retrieve and check container exit status
             assert isinstance(exit_code, int)
             return exit_code
+        except (ReadTimeout, RequestsConnectionError, docker.errors.APIError) as exn:
+            if isinstance(exn, docker.errors.NotFound):
+                raise
+            raise ContainerFailure(f"docker {exn.__class__.__name__}, {exn}") from exn
         finally:
+            if self.resource_sampler:
+                try:
+                    self.resource_sampler.write(self.host_dir)
+                    logger.info("resources: %s", json.dumps(self.resource_sampler.summary))
+                except:
+                    logger.exception("failed to write container resource usage")
             if svc:
                 try:
                     svc.remove()
@@ -272,6 +675,23 @@ class TaskDockerContainer(TaskContainer):
             except:
                 logger.exception("failed to close docker-py client")
 
+    def check_oom_killed(self, logger: logging.Logger, client: docker.DockerClient) -> bool:
+        # inspect the exited container to see if the kernel OOM killer got it. (This is only
+        # possible when swarm scheduled the container on the local node.)
+        if not self._container_id:
+            return False
+        try:
+            state = client.containers.get(self._container_id).attrs["State"]
+        except docker.errors.NotFound:
+            return False
+        except Exception:
+            logger.debug("failed to inspect container for OOM kill: %s", traceback.format_exc())
+            return False
+        if state.get("OOMKilled", False):
+            logger.error("container was killed for exceeding its memory limit")
+            return True
+        return False
+
     def poll_service(
         self, logger: logging.Logger, svc: docker.models.services.Service
     ) -> Optional[int]:
@@ -283,15 +703,25 @@ class TaskDockerContainer(TaskContainer):
             assert len(tasks) == 1
             status = tasks[0]["Status"]
             logger.debug("docker task status = " + str(status))
+            # note the container ID, for resource_sampler
+            container_id = status.get("ContainerStatus", {}).get("ContainerID", None)
+            if container_id:
+                self._container_id = container_id
             state = status["State"]
+            # note the ends of the scheduling & container startup (including image pull) phases
+            if state not in ["new", "pending", "assigned", "accepted"]:
+                self.timer.mark("scheduling")
+            if state not in ["new", "pending", "assigned", "accepted", "preparing", "starting"]:
+                self.timer.mark("container_start")
             if state in ["complete", "failed"]:
                 exit_code = status["ContainerStatus"]["ExitCode"]
                 assert isinstance(exit_code, int)
                 return exit_code
             elif state in ["rejected", "orphaned", "remove", "shutdown"]:
-                raise RuntimeError(
-                    f"docker task {state}" + ((": " + status["Err"]) if "Err" in status else "")
-                )
+                msg = f"docker task {state}" + ((": " + status["Err"]) if "Err" in status else "")
+                if "No such image" in status.get("Err", ""):
+                    raise RuntimeError(msg)
+                raise ContainerFailure(msg)
             # https://docs.docker.com/engine/swarm/how-swarm-mode-works/swarm-task-states/
             elif state not in [
                 "new",
@@ -306,11 +736,305 @@ class TaskDockerContainer(TaskContainer):
         return None
 
 
+class ContainerPool:
+    """
+    Opt-in pool of warm, long-lived docker containers, to save container creation & teardown for
+    scatters of many short tasks on the same image. Keeps up to ``size`` containers per image,
+    each with ``{scratch_dir}/tasks`` mounted read/write at ``container_scratch_dir``, and
+    ``{scratch_dir}/inputs`` mounted read-only at ``container_inputs_dir``. Tasks run in them
+    using :class:`TaskDockerPoolContainer`, and each container is recycled after ``max_uses``
+    tasks.
+
+    The pool is thread-safe, and usable as a context manager which removes its containers on exit.
+
+    Caveats, compared to :class:`TaskDockerContainer`:
+
+    - The containers don't have per-task ``runtime.cpu`` or ``runtime.memory`` limits.
+    - Task input files are hard-linked into the read-only inputs mount, or copied if they're on
+      another filesystem. ``scratch_dir`` should be on the same filesystem as the input files &
+      run directories, so that inputs needn't be copied, and working directories can be moved into
+      place upon task completion.
+    """
+
+    size: int
+    max_uses: int
+    scratch_dir: str
+    container_scratch_dir: str = "/mnt/miniwdl_pool"
+    container_inputs_dir: str = "/mnt/miniwdl_pool_inputs"
+
+    _lock: threading.Condition
+    _idle: Dict[str, List[Tuple[Any, int]]]  # image_tag -> [(docker container, uses)]
+    _count: Dict[str, int]  # image_tag -> number of containers (idle or busy)
+    _client: Optional[docker.DockerClient]
+
+    def __init__(self, size: int = 4, max_uses: int = 100, scratch_dir: Optional[str] = None):
+        assert size > 0 and max_uses > 0
+        self.size = size
+        self.max_uses = max_uses
+        self.scratch_dir = os.path.abspath(scratch_dir or tempfile.mkdtemp(prefix="miniwdl_pool_"))
+        os.makedirs(os.path.join(self.scratch_dir, "tasks"), exist_ok=True)
+        os.makedirs(os.path.join(self.scratch_dir, "inputs"), exist_ok=True)
+        self._lock = threading.Condition()
+        self._idle = {}
+        self._count = {}
+        self._client = None
+
+    def task_container(self, run_id: str, host_dir: str) -> "TaskDockerPoolContainer":
+        """
+        Create a :class:`TaskContainer` which will run in this pool
+        """
+        return TaskDockerPoolContainer(run_id, host_dir, self)
+
+    def acquire(self, logger: logging.Logger, image_tag: str) -> Tuple[Any, int]:
+        """
+        Get an idle container (& its prior use count) for the image, starting one if the pool isn't
+        full, or else waiting for one to be released.
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = docker.from_env()
+            while True:
+                idle = self._idle.get(image_tag, [])
+                if idle:
+                    return idle.pop()
+                if self._count.get(image_tag, 0) < self.size:
+                    self._count[image_tag] = self._count.get(image_tag, 0) + 1
+                    break
+                self._lock.wait()
+            client = self._client
+        try:
+            logger.info("docker starting pool container for image %s", image_tag)
+            container = client.containers.run(
+                image_tag,
+                command=["/bin/sh", "-c", "while true; do sleep 3600; done"],
+                detach=True,
+                volumes={
+                    os.path.join(self.scratch_dir, "tasks"): {
+                        "bind": self.container_scratch_dir,
+                        "mode": "rw",
+                    },
+                    os.path.join(self.scratch_dir, "inputs"): {
+                        "bind": self.container_inputs_dir,
+                        "mode": "ro",
+                    },
+                },
+                labels={"miniwdl_pool": self.scratch_dir},
+            )
+            logger.debug("docker pool container id = %s", container.short_id)
+            return (container, 0)
+        except:
+            with self._lock:
+                self._count[image_tag] -= 1
+                self._lock.notify_all()
+            raise
+
+    def release(
+        self, logger: logging.Logger, image_tag: str, container: Any, uses: int, ok: bool = True
+    ) -> None:
+        """
+        Return a container to the pool after use, or remove it if it's reached ``max_uses`` (or if
+        not ``ok``, e.g. after an interrupted task)
+        """
+        recycle = not ok or uses >= self.max_uses
+        with self._lock:
+            if recycle:
+                self._count[image_tag] -= 1
+            else:
+                self._idle.setdefault(image_tag, []).append((container, uses))
+            self._lock.notify_all()
+        if recycle:
+            logger.debug(
+                "docker removing pool container %s after %d uses", container.short_id, uses
+            )
+            _remove_container(logger, container)
+
+    def close(self) -> None:
+        """
+        Remove all the idle containers (& any remaining scratch files)
+        """
+        logger = logging.getLogger("miniwdl-pool")
+        with self._lock:
+            idle = [c for cs in self._idle.values() for (c, _) in cs]
+            for image_tag, cs in self._idle.items():
+                self._count[image_tag] -= len(cs)
+            self._idle = {}
+            client = self._client
+            self._client = None
+        for container in idle:
+            _remove_container(logger, container)
+        if client:
+            client.close()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+    def __enter__(self) -> "ContainerPool":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def _remove_container(logger: logging.Logger, container: Any) -> None:
+    try:
+        container.remove(force=True)
+    except:
+        logger.exception("failed to remove docker container")
+
+
+class TaskDockerPoolContainer(TaskContainer):
+    """
+    TaskContainer running the command in a warm container from a :class:`ContainerPool`, using
+    ``docker exec``. The task's scratch directory is a fresh subdirectory of the pool's shared
+    scratch mount, and its input files are linked into a subdirectory of the pool's read-only
+    inputs mount; upon completion, its working directory & standard output/error files are moved
+    into ``host_dir``, where they'd have been with :class:`TaskDockerContainer`.
+    """
+
+    pool: ContainerPool
+    image_tag: str = "ubuntu:18.04"
+    _token: str
+
+    def __init__(self, run_id: str, host_dir: str, pool: ContainerPool) -> None:
+        super().__init__(run_id, host_dir)
+        self.pool = pool
+        self._token = uuid.uuid4().hex
+        self.container_dir = os.path.join(pool.container_scratch_dir, self._token)
+
+    @property
+    def container_inputs_dir(self) -> str:
+        return os.path.join(self.pool.container_inputs_dir, self._token)
+
+    def _run(
+        self,
+        logger: logging.Logger,
+        terminating: Callable[[], bool],
+        command: str,
+        cpu: int,
+        memory: Optional[int],
+    ) -> int:
+        scratch = os.path.join(self.pool.scratch_dir, "tasks", self._token)
+        inputs_scratch = os.path.join(self.pool.scratch_dir, "inputs", self._token)
+        pipe_files = ["stdout.txt", "stderr.txt"]
+        exit_code: Optional[int] = None
+        try:
+            os.makedirs(os.path.join(scratch, "work"))
+            with open(os.path.join(scratch, "command"), "x") as outfile:
+                outfile.write(command)
+            for touch_file in pipe_files:
+                with open(os.path.join(scratch, touch_file), "x") as outfile:
+                    pass
+            # link (or copy) the input files into the read-only inputs directory
+            for host_path, container_path in self.input_file_map.items():
+                scratch_path = os.path.join(
+                    inputs_scratch, os.path.relpath(container_path, self.container_inputs_dir)
+                )
+                os.makedirs(os.path.dirname(scratch_path), exist_ok=True)
+                try:
+                    os.link(host_path, scratch_path)
+                except OSError:
+                    shutil.copyfile(host_path, scratch_path)
+            logger.debug("pool scratch directory: %s", scratch)
+
+            container, uses = self.pool.acquire(logger, self.image_tag)
+            self.timer.mark("container_acquire")
+            ok = False
+            try:
+                api = container.client.api
+                exec_id = api.exec_create(
+                    container.id,
+                    ["/bin/bash", "-c", "/bin/bash ../command >> ../stdout.txt 2>> ../stderr.txt"],
+                    workdir=os.path.join(self.container_dir, "work"),
+                )["Id"]
+                logger.info(
+                    "docker exec in pool container %s (use %d)", container.short_id, uses + 1
+                )
+                with TailLogger(logger, os.path.join(scratch, "stderr.txt")):
+                    api.exec_start(exec_id, detach=True)
+                    # poll for command exit, frequently in the first few seconds
+                    i = 0
+                    while exit_code is None:
+                        time.sleep(1.05 - math.exp(i / -10.0))
+                        if terminating():
+                            raise Terminated() from None
+                        info = api.exec_inspect(exec_id)
+                        if not info["Running"]:
+                            exit_code = info["ExitCode"]
+                        i += 1
+                self.timer.mark("command")
+                logger.info("container exit code = " + str(exit_code))
+                assert isinstance(exit_code, int)
+                ok = True
+            except (ReadTimeout, RequestsConnectionError, docker.errors.APIError) as exn:
+                if isinstance(exn, docker.errors.NotFound):
+                    raise
+                raise ContainerFailure(f"docker {exn.__class__.__name__}, {exn}") from exn
+            finally:
+                # if the command was interrupted then it may still be running in the container,
+                # so recycle it rather than returning it to the pool
+                self.pool.release(logger, self.image_tag, container, uses + 1, ok=ok)
+        finally:
+            # move the working directory & other files into host_dir
+            host_work = os.path.join(self.host_dir, "work")
+            if os.path.isdir(os.path.join(scratch, "work")):
+                if os.path.isdir(host_work) and not os.listdir(host_work):
+                    os.rmdir(host_work)
+            for fn in ["work", "command"] + pipe_files:
+                if os.path.exists(os.path.join(scratch, fn)):
+                    shutil.move(os.path.join(scratch, fn), os.path.join(self.host_dir, fn))
+            shutil.rmtree(scratch, ignore_errors=True)
+            shutil.rmtree(inputs_scratch, ignore_errors=True)
+        assert isinstance(exit_code, int)
+        return exit_code
+
+
+class RetryPolicy:
+    """
+    Policy for retrying failed task attempts, each in a fresh container & working directory after
+    an exponential backoff delay. Two kinds of failures are retried:
+
+    - :class:`CommandFailure`: up to the task's ``runtime.maxRetries`` times, or ``max_retries``
+      if the task doesn't specify it
+    - :class:`ContainerFailure` (transient infrastructure errors): up to ``transient_retries``
+      times, in addition to (and not counting against) the former
+
+    Other errors, such as in input or output evaluation, aren't retried; nor is
+    :class:`OutOfMemory`, since the retry would run with the same ``runtime.memory`` limit.
+    """
+
+    max_retries: int
+    transient_retries: int
+    backoff_base: float
+    backoff_max: float
+
+    def __init__(
+        self,
+        max_retries: int = 0,
+        transient_retries: int = 0,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ) -> None:
+        assert max_retries >= 0 and transient_retries >= 0
+        self.max_retries = max_retries
+        self.transient_retries = transient_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff(self, retry: int) -> float:
+        """
+        Delay in seconds before the given retry (1, 2, ...): ``backoff_base * 2**(retry-1)``, up to
+        ``backoff_max``, with +/-25% jitter
+        """
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (retry - 1))
+        return delay * random.uniform(0.75, 1.25)
+
+
 def run_local_task(
     task: Tree.Task,
     posix_inputs: Env.Bindings[Value.Base],
     run_id: Optional[str] = None,
     run_dir: Optional[str] = None,
+    container_pool: Optional[ContainerPool] = None,
+    hash_outputs: bool = False,
+    retry_policy: Optional[RetryPolicy] = None,
 ) -> Tuple[str, Env.Bindings[Value.Base]]:
     """
     Run a task locally.
@@ -322,8 +1046,160 @@ def run_local_task(
     :param run_dir: outputs and scratch will be stored in this directory if it doesn't already
                     exist; if it does, a timestamp-based subdirectory is created and used (defaults
                     to current working directory)
+    :param container_pool: run the command in a warm container from this pool, instead of a new
+                           container just for this task
+    :param hash_outputs: compute SHA-256 digests of the output files, recording them in a manifest
+                         referenced from ``outputs.json`` (see :class:`OutputHasher`)
+    :param retry_policy: policy for retrying failed attempts (by default, only as specified by
+                         the task's ``runtime.maxRetries``). The files of each failed attempt are
+                         kept in a subdirectory ``attempt-N`` of the run directory.
     """
 
+    retry_policy = retry_policy or RetryPolicy()
+    run_id, run_dir, logger, timer = _start_task(task, posix_inputs, run_id, run_dir)
+    pre_run_phases = list(timer.timeline.keys())
+    attempt = 1
+    retries = 0
+    transient_retries = 0
+    with _util.ExprProfiling(logger, run_dir):
+        try:
+            while True:
+                # create appropriate TaskContainer
+                container = (
+                    container_pool.task_container(run_id, run_dir)
+                    if container_pool
+                    else TaskDockerContainer(run_id, run_dir)
+                )
+                container.timer = timer
+
+                # evaluate inputs, runtime, and command
+                container_env, command, cpu, memory, max_retries = _prepare_task(
+                    logger, task, posix_inputs, container
+                )
+                if max_retries is None:
+                    max_retries = retry_policy.max_retries
+
+                try:
+                    # start container & run command
+                    container.run(logger, command, cpu, memory)
+                except (CommandFailure, ContainerFailure) as exn:
+                    if isinstance(exn, ContainerFailure):
+                        if transient_retries >= retry_policy.transient_retries:
+                            raise
+                        transient_retries += 1
+                        retry = transient_retries
+                    else:
+                        if isinstance(exn, OutOfMemory) or retries >= max_retries:
+                            raise
+                        retries += 1
+                        retry = retries
+                    delay = retry_policy.backoff(retry)
+                    logger.warning(
+                        "attempt %d failed (%s, %s); retrying in %.1fs",
+                        attempt,
+                        exn.__class__.__name__,
+                        str(exn),
+                        delay,
+                    )
+                    timer.write(run_dir)
+                    _keep_attempt(run_dir, attempt)
+                    time.sleep(delay)
+                    # keep timing from the start, recording the failed attempt as one phase
+                    timer = timer.retry(f"attempt-{attempt}", pre_run_phases)
+                    pre_run_phases.append(f"attempt-{attempt}")
+                    attempt += 1
+                    continue
+
+                # evaluate output declarations
+                return (run_dir, _finish_task(logger, task, container_env, container, hash_outputs))
+        except Exception as exn:
+            raise _task_failure(logger, task, run_id, run_dir, timer, exn) from exn
+
+
+def _keep_attempt(run_dir: str, attempt: int) -> None:
+    # move the files of a failed attempt into a subdirectory, clearing the way for the next one
+    attempt_dir = os.path.join(run_dir, f"attempt-{attempt}")
+    os.makedirs(attempt_dir)
+    for fn in os.listdir(run_dir):
+        if fn not in ["task.log", "inputs.json"] and not fn.startswith("attempt-"):
+            os.rename(os.path.join(run_dir, fn), os.path.join(attempt_dir, fn))
+
+
+def run_local_task_pack(
+    task: Tree.Task,
+    shards: List[Tuple[Env.Bindings[Value.Base], Optional[str], Optional[str]]],
+    parallel: bool = False,
+    hash_outputs: bool = False,
+) -> List[Any]:
+    """
+    Run several invocations ("shards") of a task locally, packing those with the same docker image
+    & runtime resources into one container, to amortize the container overhead for scatters of
+    many small tasks. The packed commands run one after another (or concurrently, if
+    ``parallel``) inside the container, each with its own working directory, standard
+    output/error, exit status, and output evaluation, as if it had been run by
+    :func:`run_local_task`.
+
+    :param shards: list of ``(posix_inputs, run_id, run_dir)`` for each invocation
+    :param parallel: run the packed commands concurrently, reserving the sum of their runtime
+                     resources for the container
+    :param hash_outputs: as for :func:`run_local_task`
+    :returns: list with, for each shard, the ``(run_dir, outputs)`` pair as returned by
+              :func:`run_local_task`, or the :class:`TaskFailure` exception it would've raised
+    """
+    results: List[Any] = [None] * len(shards)
+    started = []
+    prepared = {}
+    groups: Dict[Tuple[str, int, Optional[int]], List[int]] = {}
+    for j, (posix_inputs, run_id, run_dir) in enumerate(shards):
+        run_id, run_dir, logger, timer = _start_task(task, posix_inputs, run_id, run_dir)
+        container = TaskDockerContainer(run_id, run_dir)
+        container.timer = timer
+        # give each shard its own directory in the container
+        container.container_dir = os.path.join(container.container_dir, str(j))
+        started.append((run_id, run_dir, logger, container))
+        try:
+            container_env, command, cpu, memory, _ = _prepare_task(
+                logger, task, posix_inputs, container
+            )
+            prepared[j] = (container_env, command)
+            groups.setdefault((container.image_tag, cpu, memory), []).append(j)
+        except Exception as exn:
+            results[j] = _task_failure(logger, task, run_id, run_dir, timer, exn)
+
+    for (_, cpu, memory), group in groups.items():
+        errors: List[Optional[Exception]] = []
+        try:
+            errors = _run_task_pack(
+                [started[j][2] for j in group],
+                [started[j][3] for j in group],
+                [prepared[j][1] for j in group],
+                cpu,
+                memory,
+                parallel,
+            )
+        except Exception as exn:
+            # the container failed as a whole
+            errors = [exn] * len(group)
+        for j, err in zip(group, errors):
+            run_id, run_dir, logger, container = started[j]
+            try:
+                if err:
+                    raise err
+                outputs = _finish_task(logger, task, prepared[j][0], container, hash_outputs)
+                results[j] = (run_dir, outputs)
+            except Exception as exn:
+                results[j] = _task_failure(logger, task, run_id, run_dir, container.timer, exn)
+    return results
+
+
+def _start_task(
+    task: Tree.Task,
+    posix_inputs: Env.Bindings[Value.Base],
+    run_id: Optional[str],
+    run_dir: Optional[str],
+) -> Tuple[str, str, logging.Logger, TaskTimer]:
+    # provision run directory & logger
+    timer = TaskTimer()
     run_id = run_id or task.name
     run_dir = provision_run_dir(task.name, run_dir)
     logger = logging.getLogger("wdl-task:" + run_id)
@@ -340,59 +1216,223 @@ def run_local_task(
         run_dir,
     )
     write_values_json(posix_inputs, os.path.join(run_dir, "inputs.json"))
+    timer.mark("provision")
+    return (run_id, run_dir, logger, timer)
 
+
+def _prepare_task(
+    logger: logging.Logger,
+    task: Tree.Task,
+    posix_inputs: Env.Bindings[Value.Base],
+    container: TaskContainer,
+) -> Tuple[Env.Bindings[Value.Base], str, int, Optional[int], Optional[int]]:
+    # evaluate input/postinput declarations, including mapping from host to
+    # in-container file paths
+    container_env = _eval_task_inputs(logger, task, posix_inputs, container)
+    container.timer.mark("input_eval")
+
+    # evaluate runtime fields
+    image_tag_expr = task.runtime.get("docker", None)
+    if image_tag_expr:
+        assert isinstance(image_tag_expr, Expr.Base)
+        container.image_tag = image_tag_expr.eval(container_env).coerce(Type.String()).value
+    cpu = 1
+    if "cpu" in task.runtime:
+        cpu_expr = task.runtime["cpu"]
+        assert isinstance(cpu_expr, Expr.Base)
+        cpu_value = cpu_expr.eval(container_env).coerce(Type.Int()).value
+        assert isinstance(cpu_value, int)
+        cpu = max(1, min(multiprocessing.cpu_count(), cpu_value))
+        if cpu != cpu_value:
+            logger.warning(f"runtime.cpu: {cpu} (adjusted from {cpu_value})")
+        else:
+            logger.info(f"runtime.cpu: {cpu}")
+    memory = None
+    if "memory" in task.runtime:
+        memory_expr = task.runtime["memory"]
+        assert isinstance(memory_expr, Expr.Base)
+        memory_value = memory_expr.eval(container_env)
+        if isinstance(memory_value, Value.Int):
+            memory_bytes = memory_value.value
+        else:
+            memory_str = memory_value.coerce(Type.String()).value
+            try:
+                memory_bytes = _util.parse_byte_size(memory_str)
+            except ValueError:
+                raise Error.EvalError(
+                    memory_expr, "invalid setting of runtime.memory, " + memory_str
+                )
+        assert isinstance(memory_bytes, int)
+        # clamp to host memory (& docker's minimum container memory limit)
+        memory = max(_MIN_MEMORY, min(_host_memory(), memory_bytes))
+        if memory != memory_bytes:
+            logger.warning(f"runtime.memory: {memory} (adjusted from {memory_bytes})")
+        else:
+            logger.info(f"runtime.memory: {memory}")
+    max_retries = None
+    if "maxRetries" in task.runtime:
+        max_retries_expr = task.runtime["maxRetries"]
+        assert isinstance(max_retries_expr, Expr.Base)
+        max_retries = max(0, max_retries_expr.eval(container_env).coerce(Type.Int()).value)
+        logger.info(f"runtime.maxRetries: {max_retries}")
+    container.timer.mark("runtime_eval")
+
+    # interpolate command
+    command = CommandTemplate.of(task).render(container_env, InputStdLib(container))
+    logger.debug("command:\n%s", command.rstrip())
+    container.timer.mark("command_interpolation")
+    return (container_env, command, cpu, memory, max_retries)
+
+
+def _finish_task(
+    logger: logging.Logger,
+    task: Tree.Task,
+    container_env: Env.Bindings[Value.Base],
+    container: TaskContainer,
+    hash_outputs: bool,
+) -> Env.Bindings[Value.Base]:
+    timer = container.timer
+    if not hash_outputs:
+        outputs = _eval_task_outputs(logger, task, container_env, container)
+        timer.mark("output_eval")
+        write_values_json(outputs, os.path.join(container.host_dir, "outputs.json"))
+    else:
+        with OutputHasher() as hasher:
+            outputs = _eval_task_outputs(logger, task, container_env, container, hasher)
+            timer.mark("output_eval")
+            hasher.write(os.path.join(container.host_dir, OutputHasher.manifest_filename))
+            timer.mark("output_hash")
+        # reference the manifest from outputs.json (under a key that can't collide with a WDL
+        # output name, as identifiers can't begin with an underscore)
+        write_values_json(
+            outputs,
+            os.path.join(container.host_dir, "outputs.json"),
+            extra={"_manifest": OutputHasher.manifest_filename},
+        )
+    timer.mark("json_write")
+    timer.write(container.host_dir)
+    logger.info("timing: %s", json.dumps(timer.phases))
+    logger.notice("done")  # pyre-fixme
+    return outputs
+
+
+def _task_failure(
+    logger: logging.Logger,
+    task: Tree.Task,
+    run_id: str,
+    run_dir: str,
+    timer: TaskTimer,
+    exn: Exception,
+) -> TaskFailure:
+    # log the exception and wrap it in TaskFailure
+    logger.debug(traceback.format_exc())
     try:
-        # create appropriate TaskContainer
-        container = TaskDockerContainer(run_id, run_dir)
+        timer.write(run_dir)
+    except Exception:
+        logger.exception("failed to write task timing")
+    wrapper = TaskFailure(task, run_id, run_dir)
+    msg = str(wrapper)
+    if hasattr(exn, "job_id"):
+        msg += " evaluating " + getattr(exn, "job_id")
+    msg += ": " + exn.__class__.__name__
+    if str(exn):
+        msg += ", " + str(exn)
+    logger.error(msg)
+    logger.info("run directory: %s", run_dir)
+    wrapper.__cause__ = exn
+    wrapper.__context__ = exn
+    return wrapper
+
+
+def _run_task_pack(
+    loggers: List[logging.Logger],
+    containers: List[TaskDockerContainer],
+    commands: List[str],
+    cpu: int,
+    memory: Optional[int],
+    parallel: bool,
+) -> List[Optional[Exception]]:
+    # run the commands in one container, led by the first; return the exception for each command
+    # (CommandFailure) or None if it succeeded
+    ans: List[Optional[Exception]] = [None] * len(containers)
+    packed = [j for j, command in enumerate(commands) if command.strip()]
+    if not packed:
+        return ans
+    lead = containers[packed[0]]
+    logger = loggers[packed[0]]
+    if parallel:
+        cpu = min(multiprocessing.cpu_count(), cpu * len(packed))
+        memory = min(_host_memory(), memory * len(packed)) if memory else None
+    logger.info(
+        "packing %d task commands into one container: %s",
+        len(packed),
+        ", ".join(containers[j].run_id for j in packed),
+    )
 
-        # evaluate input/postinput declarations, including mapping from host to
-        # in-container file paths
-        container_env = _eval_task_inputs(logger, task, posix_inputs, container)
-
-        # evaluate runtime fields
-        image_tag_expr = task.runtime.get("docker", None)
-        if image_tag_expr:
-            assert isinstance(image_tag_expr, Expr.Base)
-            container.image_tag = image_tag_expr.eval(container_env).coerce(Type.String()).value
-        cpu = 1
-        if "cpu" in task.runtime:
-            cpu_expr = task.runtime["cpu"]
-            assert isinstance(cpu_expr, Expr.Base)
-            cpu_value = cpu_expr.eval(container_env).coerce(Type.Int()).value
-            assert isinstance(cpu_value, int)
-            cpu = max(1, min(multiprocessing.cpu_count(), cpu_value))
-            if cpu != cpu_value:
-                logger.warning(f"runtime.cpu: {cpu} (adjusted from {cpu_value})")
+    with TerminationSignalFlag(logger) as terminating:
+        mounts = []
+        script = []
+        for j in packed:
+            container = containers[j]
+            assert not container._running
+            if container is not lead:
+                loggers[j].info("packed into container with %s", lead.run_id)
+            os.makedirs(os.path.join(container.host_dir, "work"))
+            mounts += container.prepare_mounts(commands[j])
+            # the command's exit status is recorded in a file of its own
+            with open(os.path.join(container.host_dir, "exit_status"), "x"):
+                pass
+            exit_status = os.path.join(container.container_dir, "exit_status")
+            mounts.append(f"{os.path.join(container.host_dir, 'exit_status')}:{exit_status}:rw")
+            line = "(cd {} && /bin/bash ../command >> ../stdout.txt 2>> ../stderr.txt)".format(
+                shlex.quote(os.path.join(container.container_dir, "work"))
+            )
+            line += "; echo $? > " + shlex.quote(exit_status)
+            script.append(f"({line}) &" if parallel else line)
+            container._running = True
+        if parallel:
+            script.append("wait")
+
+        try:
+            exit_code = lead.run_service(
+                logger,
+                terminating,
+                "\n".join(script),
+                lead.container_dir,
+                mounts,
+                cpu,
+                memory,
+                [(loggers[j], os.path.join(containers[j].host_dir, "stderr.txt")) for j in packed],
+            )
+        finally:
+            for j in packed:
+                containers[j]._running = False
+                # the other packed commands' timings are subsumed by the lead's container
+                containers[j].timer.mark("command")
+
+        if terminating():
+            raise Terminated()
+
+    for j in packed:
+        stderr_file = os.path.join(containers[j].host_dir, "stderr.txt")
+        with open(os.path.join(containers[j].host_dir, "exit_status")) as infile:
+            exit_status = infile.read().strip()
+        if not exit_status:
+            # the container exited before this command finished
+            if lead._oom_killed:
+                ans[j] = OutOfMemory(exit_code, stderr_file)
             else:
-                logger.info(f"runtime.cpu: {cpu}")
+                ans[j] = CommandFailure(exit_code, stderr_file)
+        elif int(exit_status) != 0:
+            ans[j] = CommandFailure(int(exit_status), stderr_file)
+    return ans
 
-        # interpolate command
-        command = _util.strip_leading_whitespace(
-            task.command.eval(container_env, stdlib=InputStdLib(container)).value
-        )[1]
-        logger.debug("command:\n%s", command.rstrip())
 
-        # start container & run command
-        container.run(logger, command, cpu)
+_MIN_MEMORY = 6 * 1024 * 1024  # dockerd refuses memory limits below 6 MiB
 
-        # evaluate output declarations
-        outputs = _eval_task_outputs(logger, task, container_env, container)
 
-        write_values_json(outputs, os.path.join(run_dir, "outputs.json"))
-        logger.notice("done")  # pyre-fixme
-        return (run_dir, outputs)
-    except Exception as exn:
-        logger.debug(traceback.format_exc())
-        wrapper = TaskFailure(task, run_id, run_dir)
-        msg = str(wrapper)
-        if hasattr(exn, "job_id"):
-            msg += " evaluating " + getattr(exn, "job_id")
-        msg += ": " + exn.__class__.__name__
-        if str(exn):
-            msg += ", " + str(exn)
-        logger.error(msg)
-        logger.info("run directory: %s", run_dir)
-        raise wrapper from exn
+def _host_memory() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
 
 
 def _eval_task_inputs(
@@ -409,6 +1449,10 @@ def _eval_task_inputs(
     def collect_host_files(v: Value.Base) -> None:
         if isinstance(v, Value.File):
             host_files.append(v.value)
+        elif isinstance(v, Value.Array) and isinstance(v.value, Value.PackedItems):
+            if v.value.item_class is Value.File:
+                host_files.extend(v.value.data)
+            return
         for ch in v.children:
             collect_host_files(ch)
 
@@ -417,15 +1461,10 @@ def _eval_task_inputs(
     container.add_files(host_files)
 
     # copy posix_inputs with all Files mapped to their in-container paths
-    def map_files(v: Value.Base) -> Value.Base:
-        if isinstance(v, Value.File):
-            v.value = container.input_file_map[v.value]
-        for ch in v.children:
-            map_files(ch)
-        return v
-
     container_inputs = posix_inputs.map(
-        lambda binding: Env.Binding(binding.name, map_files(copy.deepcopy(binding.value)))
+        lambda binding: Env.Binding(
+            binding.name, Value.rewrite_files(binding.value, container.input_file_map.__getitem__)
+        )
     )
 
     # initialize value environment with the inputs
@@ -476,11 +1515,27 @@ def _eval_task_inputs(
 
 
 def _eval_task_outputs(
-    logger: logging.Logger, task: Tree.Task, env: Env.Bindings[Value.Base], container: TaskContainer
+    logger: logging.Logger,
+    task: Tree.Task,
+    env: Env.Bindings[Value.Base],
+    container: TaskContainer,
+    hasher: "Optional[OutputHasher]" = None,
 ) -> Env.Bindings[Value.Base]:
 
     stdlib = OutputStdLib(container)
     outputs = Env.Bindings()
+    host_files: Dict[str, str] = {}
+
+    def collect_files(v: Value.Base, container_files: Set[str]) -> None:
+        if isinstance(v, Value.File):
+            container_files.add(v.value)
+        elif isinstance(v, Value.Array) and isinstance(v.value, Value.PackedItems):
+            if v.value.item_class is Value.File:
+                container_files.update(v.value.data)
+            return
+        for ch in v.children:
+            collect_files(ch, container_files)
+
     for decl in task.outputs:
         assert decl.expr
         try:
@@ -496,21 +1551,253 @@ def _eval_task_outputs(
         outputs = outputs.bind(decl.name, v)
         env = env.bind(decl.name, v)
 
+        # resolve the host paths of the output Files now, so that the hasher (if any) can start
+        # reading them while we evaluate the remaining outputs. First collect the distinct new
+        # in-container paths, so that each one is checked & resolved only once even if it recurs
+        # in several outputs (or array elements) -- the security checks in host_file() stat the
+        # filesystem.
+        container_files = set()
+        collect_files(v, container_files)
+        new_host_files = container.host_files(container_files - host_files.keys())
+        if hasher:
+            for host_file in new_host_files.values():
+                hasher.submit(host_file)
+        host_files.update(new_host_files)
+
     # map Files from in-container paths to host paths
-    def map_files(v: Value.Base) -> Value.Base:
-        if isinstance(v, Value.File):
-            host_file = container.host_file(v.value)
-            logger.debug("container output file %s -> host %s", v.value, host_file)
-            v.value = host_file
-        for ch in v.children:
-            map_files(ch)
-        return v
 
+    for container_file, host_file in host_files.items():
+        logger.debug("container output file %s -> host %s", container_file, host_file)
     return outputs.map(
-        lambda binding: Env.Binding(binding.name, map_files(copy.deepcopy(binding.value)))
+        lambda binding: Env.Binding(
+            binding.name, Value.rewrite_files(binding.value, host_files.__getitem__)
+        )
     )
 
 
+class OutputHasher:
+    """
+    Computes SHA-256 digests of task output files on a thread pool, starting as soon as each file
+    is submitted, for a per-call manifest of the output file checksums (for downstream validation,
+    caching, or deduplication). Usable as a context manager which shuts down the thread pool.
+    """
+
+    manifest_filename: str = "outputs.manifest.json"
+    buffer_size: int = 1048576
+
+    _executor: concurrent.futures.ThreadPoolExecutor
+    _futures: Dict[str, "concurrent.futures.Future[Tuple[int, str]]"]
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        # hashlib releases the GIL while digesting large buffers, so threads can hash in parallel
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=(max_workers or min(8, multiprocessing.cpu_count()))
+        )
+        self._futures = {}
+
+    def submit(self, host_file: str) -> None:
+        """
+        Start hashing the file (if it hasn't been already)
+        """
+        if host_file not in self._futures:
+            self._futures[host_file] = self._executor.submit(
+                self._hash, host_file, self.buffer_size
+            )
+
+    @staticmethod
+    def _hash(host_file: str, buffer_size: int) -> Tuple[int, str]:
+        digest = hashlib.sha256()
+        size = 0
+        buf = bytearray(buffer_size)
+        view = memoryview(buf)
+        with open(host_file, "rb", buffering=0) as infile:
+            while True:
+                n = infile.readinto(buf)
+                if not n:
+                    break
+                digest.update(view[:n])
+                size += n
+        return (size, digest.hexdigest())
+
+    @property
+    def manifest(self) -> Dict[str, Any]:
+        """
+        :type: Dict[str,Any]
+
+        ``{"algorithm": "sha256", "files": {host_path: {"size": bytes, "sha256": hex_digest}}}``
+        for the submitted files, waiting for any hashing in progress
+        """
+        files = {}
+        for host_file in sorted(self._futures.keys()):
+            size, digest = self._futures[host_file].result()
+            files[host_file] = {"size": size, "sha256": digest}
+        return {"algorithm": "sha256", "files": files}
+
+    def write(self, filename: str) -> None:
+        """
+        Write the manifest JSON file
+        """
+        with open(filename, "w") as outfile:
+            print(json.dumps(self.manifest, indent=2), file=outfile)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "OutputHasher":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class CommandTemplate:
+    """
+    A task command compiled for repeated interpolation (e.g. across the shards of a large
+    scatter), with its literal segments split into lines & stripped of their common leading
+    whitespace in advance. Rendering is then mostly a join of the literal segments with the
+    stringified placeholder values.
+
+    ``render()`` is equivalent to evaluating the command expression and then applying
+    ``_util.strip_leading_whitespace``; it falls back to that if the placeholder values would
+    change the common indentation (e.g. a value containing a newline).
+    """
+
+    command: Expr.String
+    placeholders: List[Expr.Placeholder]
+
+    # the command with its surrounding delimiter characters trimmed, as a list of lines, each a
+    # list of literal strings & placeholder indices
+    _lines: List[List[Any]]
+    # indentation to strip (determined by the lines starting with a literal), or None if the fast
+    # path isn't applicable
+    _indent: Optional[int]
+    # pre-stripped segments: literal strings, placeholder indices, and lines starting with a
+    # placeholder (whose indentation can only be determined upon rendering)
+    _segments: List[Any]
+
+    def __init__(self, command: Expr.String) -> None:
+        self.command = command
+        self.placeholders = []
+        items: List[Any] = []
+        for part in command.parts:
+            if isinstance(part, Expr.Placeholder):
+                items.append(len(self.placeholders))
+                self.placeholders.append(part)
+            else:
+                assert isinstance(part, str)
+                items.append(part)
+        self._indent = None
+        self._segments = []
+
+        # trim the delimiters, as Expr.String does
+        if not (items and isinstance(items[0], str) and isinstance(items[-1], str)):
+            self._lines = []
+            return
+        items[0] = items[0][1:]
+        items[-1] = items[-1][:-1]
+
+        # split into lines
+        lines: List[List[Any]] = [[]]
+        for item in items:
+            if isinstance(item, str):
+                first = True
+                for piece in item.split("\n"):
+                    if not first:
+                        lines.append([])
+                    first = False
+                    if piece:
+                        lines[-1].append(piece)
+            else:
+                lines[-1].append(item)
+        self._lines = lines
+
+        # determine the indentation of lines starting with a literal
+        dynamic = []
+        for line in lines:
+            if line and isinstance(line[0], str) and line[0].strip():
+                c = len(line[0]) - len(line[0].lstrip())
+                self._indent = c if self._indent is None else min(self._indent, c)
+                dynamic.append(False)
+            else:
+                dynamic.append(bool(line) and any(isinstance(item, int) for item in line))
+        if not self._indent:
+            # nothing to strip (or only lines starting with placeholders); the fallback is simpler
+            self._indent = None
+            return
+
+        # pre-strip
+        segments: List[Any] = []
+        for i, line in enumerate(lines):
+            if i:
+                segments.append("\n")
+            if dynamic[i]:
+                segments.append(line)
+            elif line and isinstance(line[0], str) and line[0].strip():
+                segments.append(line[0][self._indent :])
+                segments.extend(line[1:])
+            else:
+                # whitespace-only line, which strip_leading_whitespace leaves as-is
+                segments.extend(line)
+        # coalesce adjacent literals
+        for seg in segments:
+            if isinstance(seg, str) and self._segments and isinstance(self._segments[-1], str):
+                self._segments[-1] += seg
+            else:
+                self._segments.append(seg)
+
+    @staticmethod
+    def of(task: Tree.Task) -> "CommandTemplate":
+        """
+        Get the compiled template for the task's command (compiling it on first use)
+        """
+        ans = getattr(task, "_command_template", None)
+        if ans is None or ans.command is not task.command:
+            ans = CommandTemplate(task.command)
+            setattr(task, "_command_template", ans)
+        return ans
+
+    def render(self, env: Env.Bindings[Value.Base], stdlib: StdLib.Base) -> str:
+        """
+        Interpolate the command
+        """
+        if not self._lines:
+            return _util.strip_leading_whitespace(self.command.eval(env, stdlib=stdlib).value)[1]
+        # resolve the within-interpolation + operator once for all the placeholders
+        if not isinstance(getattr(stdlib, "_add", None), StdLib.InterpolationAddOperator):
+            setattr(stdlib, "_add", StdLib.InterpolationAddOperator())
+        # (placeholder.expr.eval wraps errors just as placeholder.eval would)
+        values = [
+            placeholder.format(placeholder.expr.eval(env, stdlib))
+            for placeholder in self.placeholders
+        ]
+
+        indent = self._indent
+        if indent is not None and not any("\n" in v for v in values):
+            ans = []
+            for seg in self._segments:
+                if seg.__class__ is str:
+                    ans.append(seg)
+                elif seg.__class__ is int:
+                    ans.append(values[seg])
+                else:
+                    line = "".join(item if isinstance(item, str) else values[item] for item in seg)
+                    lsl = len(line.lstrip())
+                    if lsl:
+                        if len(line) - lsl < indent:
+                            break  # this line would reduce the indentation; fall back
+                        line = line[indent:]
+                    ans.append(line)
+            else:
+                return "".join(ans)
+
+        # fallback: render in full, then strip
+        txt = "\n".join(
+            "".join(item if isinstance(item, str) else values[item] for item in line)
+            for line in self._lines
+        )
+        return _util.strip_leading_whitespace(txt)[1]
+
+
 class _StdLib(StdLib.Base):
     container: TaskContainer
     inputs_only: bool  # if True then only permit access to input files
@@ -538,8 +1825,11 @@ class InputStdLib(_StdLib):
 
 class OutputStdLib(_StdLib):
     # StdLib for evaluation of task outputs
+    _workdir: "_WorkDirListing"
+
     def __init__(self, container: TaskContainer) -> None:
         super().__init__(container, False)
+        self._workdir = _WorkDirListing(os.path.join(container.host_dir, "work"))
 
         setattr(
             self,
@@ -573,20 +1863,101 @@ class OutputStdLib(_StdLib):
                 raise OutputError("glob() pattern must not use .. uplevels")
             if pat.startswith("./"):
                 pat = pat[2:]
-            # glob the host directory
-            pat = os.path.join(lib.container.host_dir, "work", pat)
-            host_files = sorted(fn for fn in glob.glob(pat) if os.path.isfile(fn))
-            # convert the host filenames to in-container filenames
-            container_files = []
-            for hf in host_files:
-                dstrip = lib.container.host_dir
-                dstrip += "" if dstrip.endswith("/") else "/"
-                assert hf.startswith(dstrip)
-                container_files.append(os.path.join(lib.container.container_dir, hf[len(dstrip) :]))
-            return Value.Array(Type.File(), [Value.File(fn) for fn in container_files])
+            # glob the host working directory (listings cached across glob() calls), and convert
+            # the matching filenames to in-container filenames
+            container_workdir = os.path.join(lib.container.container_dir, "work")
+            container_files = [
+                os.path.join(container_workdir, fn) for fn in sorted(lib._workdir.glob(pat))
+            ]
+            return Value.packed_array(Type.File(), container_files)
 
         setattr(
             self,
             "glob",
             StdLib.StaticFunction("glob", [Type.String()], Type.Array(Type.File()), _glob),
         )
+
+
+class _WorkDirListing:
+    # Lazily-populated cache of the directory listings under a task's working directory, for
+    # glob() during output evaluation (when the directory no longer changes). Each directory is
+    # scanned at most once, however many patterns consult it.
+
+    root: str
+    _dirs: Dict[str, List[Tuple[str, bool, bool]]]  # relative dir -> [(name, is_file, is_dir)]
+    _regexes: Dict[str, Any]
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._dirs = {}
+        self._regexes = {}
+
+    def entries(self, reldir: str) -> List[Tuple[str, bool, bool]]:
+        ans = self._dirs.get(reldir, None)
+        if ans is None:
+            ans = []
+            try:
+                with os.scandir(os.path.join(self.root, reldir)) as it:
+                    for entry in it:
+                        # symlinks are followed for is_file(), like glob.glob & os.path.isfile; but
+                        # not for recursion into subdirectories by **, which could cycle
+                        try:
+                            is_file = entry.is_file()
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            is_file = is_dir = False
+                        ans.append((entry.name, is_file, is_dir))
+            except OSError:
+                pass
+            self._dirs[reldir] = ans
+        return ans
+
+    def _subdirs(self, reldir: str) -> Iterable[str]:
+        # reldir and all its (non-hidden) subdirectories, recursively
+        yield reldir
+        for (name, _, is_dir) in self.entries(reldir):
+            if is_dir and name[0] != ".":
+                yield from self._subdirs(os.path.join(reldir, name))
+
+    def glob(self, pattern: str) -> List[str]:
+        """
+        Paths (relative to root) of the files matching the relative glob pattern, with the
+        semantics of ``glob.glob(pattern, recursive=True)``: ``**`` matches any files and zero or
+        more subdirectories, and wildcards don't match names beginning with ``.`` (unless the
+        pattern component does too). A trailing ``/`` matches only directories, hence no files.
+        """
+        if pattern.endswith("/"):
+            return []
+        parts = [part for part in pattern.split("/") if part and part != "."]
+        # candidate relative paths matching the pattern components so far
+        candidates = [""]
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            matches: Dict[str, None] = {}  # ordered set
+            if part == "**":
+                for reldir in candidates:
+                    for subdir in self._subdirs(reldir):
+                        if not last:
+                            matches[subdir] = None
+                        else:
+                            for (name, is_file, _) in self.entries(subdir):
+                                if is_file and name[0] != ".":
+                                    matches[os.path.join(subdir, name)] = None
+            else:
+                regex = self._regexes.get(part, None)
+                if regex is None:
+                    regex = re.compile(fnmatch.translate(part))
+                    self._regexes[part] = regex
+                hidden_ok = part[0] == "."
+                for reldir in candidates:
+                    for (name, is_file, is_dir) in self.entries(reldir):
+                        if (
+                            (is_file if last else (is_dir or not is_file))
+                            and (hidden_ok or name[0] != ".")
+                            and regex.match(name)
+                        ):
+                            matches[os.path.join(reldir, name)] = None
+            candidates = list(matches.keys())
+            if not candidates:
+                break
+        return [fn for fn in candidates if fn] if parts else []
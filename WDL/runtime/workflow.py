@@ -27,6 +27,10 @@ body subgraph directly.
 Conditional sections are treated similarly, but only zero or one instance of its body subgraph will
 be launched. Scatter and Conditional sections may be nested, inducing a multi-level tree of Gather
 operations.
+
+Body Decls and Call inputs whose expressions depend neither on the scatter variable nor on other
+per-shard nodes are evaluated just once for all of a scatter's shards, by a job scheduled alongside
+them (see ``_scatter_invariants``).
 """
 
 import logging
@@ -37,10 +41,16 @@ import json
 import traceback
 import pickle
 from typing import Optional, List, Set, Tuple, NamedTuple, Dict, Union, Iterable, Callable, Any
-from .. import Env, Type, Value, Tree, StdLib
+from .. import Env, Type, Value, Expr, Tree, StdLib
 from ..Error import InputError
-from .._util import write_values_json, provision_run_dir, LOGGING_FORMAT, install_coloredlogs
-from .task import run_local_task
+from .._util import (
+    write_values_json,
+    provision_run_dir,
+    LOGGING_FORMAT,
+    install_coloredlogs,
+    ExprProfiling,
+)
+from .task import run_local_task, run_local_task_pack, ContainerPool, RetryPolicy
 from .error import TaskFailure
 
 
@@ -87,6 +97,31 @@ class WorkflowOutputs(Tree.WorkflowNode):
         return []
 
 
+class _CallInputs(Tree.WorkflowNode):
+    # A no-op workflow node standing for the scatter-invariant inputs of a Call in a scatter body,
+    # whose job evaluates them once for all the shards (see _scatter_invariants)
+
+    call: Tree.Call
+    names: List[str]
+
+    def __init__(self, call: Tree.Call, names: List[str]) -> None:
+        super().__init__(call.workflow_node_id, call.pos)
+        self.call = call
+        self.names = names
+
+    def _workflow_node_dependencies(self) -> Iterable[str]:
+        raise NotImplementedError()
+
+    def add_to_type_env(
+        self, struct_typedefs: Env.Bindings[Tree.StructTypeDef], type_env: Env.Bindings[Type.Base]
+    ) -> Env.Bindings[Type.Base]:
+        raise NotImplementedError()
+
+    @property
+    def children(self) -> Iterable[Tree.SourceNode]:
+        return []
+
+
 _Job = NamedTuple(
     "_Job",
     [
@@ -294,13 +329,25 @@ class StateMachine:
                 job.node, dict((dep_id, self.job_outputs[dep_id]) for dep_id in job.dependencies)
             )
 
+        # if this is a scatter shard of a body node whose scatter-invariant expressions were
+        # evaluated once for all the shards, take those values
+        hoisted_id = _hoisted_job_id(
+            job.node.workflow_node_id, [p[0] for p in job.scatter_stack[:-1]]
+        )
+        hoisted = Env.Bindings()
+        if job.scatter_stack and hoisted_id in job.dependencies:
+            hoisted = self.job_outputs[hoisted_id]
+            if isinstance(job.node, Tree.Decl):
+                return hoisted
+
         # for all non-Gather nodes, derive the environment by merging the outputs of all the
         # dependencies (+ any current scatter variable bindings)
         scatter_vars = Env.Bindings()
         for p in job.scatter_stack:
             scatter_vars = Env.Bindings(p[1], scatter_vars)
+        dependencies = [dep for dep in job.dependencies if dep != hoisted_id]
         # pyre-ignore
-        env = Env.merge(scatter_vars, *(self.job_outputs[dep] for dep in job.dependencies))
+        env = Env.merge(scatter_vars, *(self.job_outputs[dep] for dep in dependencies))
         envlog = json.dumps(self.values_to_json(env))
         self.logger.debug("env %s <- %s", job.id, envlog if len(envlog) < 4096 else "(large)")
 
@@ -331,11 +378,20 @@ class StateMachine:
         if isinstance(job.node, WorkflowOutputs):
             return env
 
+        if isinstance(job.node, _CallInputs):
+            call_inputs = Env.Bindings()
+            for name in job.node.names:
+                call_inputs = call_inputs.bind(
+                    name, job.node.call.inputs[name].eval(env, stdlib=stdlib)
+                )
+            return call_inputs
+
         if isinstance(job.node, Tree.Call):
             # evaluate input expressions
             call_inputs = Env.Bindings()
             for name, expr in job.node.inputs.items():
-                call_inputs = call_inputs.bind(name, expr.eval(env, stdlib=stdlib))
+                v = hoisted[name] if name in hoisted else expr.eval(env, stdlib=stdlib)
+                call_inputs = call_inputs.bind(name, v)
             # check workflow inputs for additional inputs supplied to this call
             for b in self.inputs.enter_namespace(job.node.name):
                 call_inputs = call_inputs.bind(b.name, b.value)
@@ -413,6 +469,43 @@ def _scatter(
             array = [None]
     digits = math.ceil(math.log10(len(array) + 1))
 
+    # schedule a job to evaluate each scatter-invariant expression once for all the shards; its
+    # dependencies are the section-level jobs of the nodes it references
+    scatter_indices = [p[0] for p in scatter_stack]
+    invariants: Dict[str, Optional[List[str]]] = {}
+    if isinstance(section, Tree.Scatter) and len(array) > 1:
+        invariants = _scatter_invariants(section)
+    for body_node in section.body:
+        if body_node.workflow_node_id in invariants:
+            names = invariants[body_node.workflow_node_id]
+            if isinstance(body_node, Tree.Decl):
+                hoisted_node = body_node
+                exprs = [body_node.expr]
+            else:
+                assert isinstance(body_node, Tree.Call) and names
+                hoisted_node = _CallInputs(body_node, names)
+                exprs = [body_node.inputs[name] for name in names]
+            dependencies = set()
+            for expr in exprs:
+                for referee in _expr_referees(expr):
+                    if isinstance(referee, Tree.WorkflowSection):
+                        # (outer) scatter variable, bound through scatter_stack
+                        continue
+                    if referee.workflow_node_id in invariants:
+                        dependencies.add(_hoisted_job_id(referee.workflow_node_id, scatter_indices))
+                    else:
+                        dependencies.add(
+                            _append_scatter_indices(
+                                referee.workflow_node_id, scatter_indices[: referee.scatter_depth]
+                            )
+                        )
+            yield _Job(
+                id=_hoisted_job_id(body_node.workflow_node_id, scatter_indices),
+                node=hoisted_node,
+                dependencies=dependencies,
+                scatter_stack=scatter_stack,
+            )
+
     # for each array element, schedule an instance of the body subgraph
     last_scatter_indices = None
     for i, array_i in enumerate(array):
@@ -447,6 +540,8 @@ def _scatter(
                 dependencies.add(
                     _append_scatter_indices(dep_id, scatter_indices_i[: dep.scatter_depth])
                 )
+            if body_node.workflow_node_id in invariants:
+                dependencies.add(_hoisted_job_id(body_node.workflow_node_id, scatter_indices))
 
             yield _Job(
                 id=body_job_id,
@@ -481,6 +576,72 @@ def _append_scatter_indices(node_id: str, scatter_indices: List[str]) -> str:
     return "-".join([node_id] + scatter_indices)
 
 
+def _hoisted_job_id(node_id: str, scatter_indices: List[str]) -> str:
+    # ID of the job evaluating the scatter-invariant expressions of a scatter body node, given the
+    # indices of the enclosing scatters (those of the section itself, not of the body)
+    return _append_scatter_indices("hoist-" + node_id, scatter_indices)
+
+
+def _scatter_invariants(section: Tree.Scatter) -> Dict[str, Optional[List[str]]]:
+    # Identify the body nodes of the scatter section with expressions referencing neither the
+    # scatter variable nor any per-shard node (other than scatter-invariant Decls): map the
+    # workflow node ID of each such Decl to None, and of each Call to the names of such inputs
+    # (except constants, which are evaluated just once anyway).
+    # Per-shard nodes are those in the body (or gathered from sections nested in it), at a
+    # greater scatter depth than the section itself; the dependencies on them are the same as in
+    # Tree.WorkflowNode.workflow_node_dependencies, plus scatter variable references.
+    depth = section.scatter_depth + 1
+    ans: Dict[str, Optional[List[str]]] = {}
+
+    def invariant(expr: Expr.Base) -> bool:
+        for referee in _expr_referees(expr):
+            if referee is section:
+                return False
+            if (
+                not isinstance(referee, Tree.WorkflowSection)
+                and referee.scatter_depth >= depth
+                and referee.workflow_node_id not in ans
+            ):
+                return False
+        return True
+
+    # Decls may depend on each other in any order, so iterate to a fixed point
+    changed = True
+    while changed:
+        changed = False
+        for node in section.body:
+            if (
+                isinstance(node, Tree.Decl)
+                and node.expr
+                and node.workflow_node_id not in ans
+                and invariant(node.expr)
+            ):
+                ans[node.workflow_node_id] = None
+                changed = True
+
+    for node in section.body:
+        if isinstance(node, Tree.Call):
+            names = [
+                name
+                for name, expr in node.inputs.items()
+                if expr.constant is None and invariant(expr)
+            ]
+            if names:
+                ans[node.workflow_node_id] = names
+    return ans
+
+
+def _expr_referees(expr: Expr.Base) -> Iterable[Tree.WorkflowNode]:
+    # the referee of each Ident in the expression (a Decl, Call, Gather, or the Scatter section
+    # whose variable it is)
+    if isinstance(expr, Expr.Ident):
+        assert isinstance(expr.referee, Tree.WorkflowNode)
+        yield expr.referee
+    for ch in expr.children:
+        assert isinstance(ch, Expr.Base)
+        yield from _expr_referees(ch)
+
+
 def _gather(
     gather: Tree.Gather, dependencies: Dict[str, Env.Bindings[Value.Base]]
 ) -> Env.Bindings[Value.Base]:
@@ -559,6 +720,10 @@ def _filenames(env: Env.Bindings[Value.Base]) -> Set[str]:
     def collector(v: Value.Base) -> None:
         if isinstance(v, Value.File):
             ans.add(v.value)
+        elif isinstance(v, Value.Array) and isinstance(v.value, Value.PackedItems):
+            if v.value.item_class is Value.File:
+                ans.update(v.value.data)
+            return
         for ch in v.children:
             collector(ch)
 
@@ -572,6 +737,11 @@ def run_local_workflow(
     posix_inputs: Env.Bindings[Value.Base],
     run_id: Optional[str] = None,
     run_dir: Optional[str] = None,
+    container_pool: Optional[ContainerPool] = None,
+    task_pack: int = 1,
+    task_pack_parallel: bool = False,
+    hash_outputs: bool = False,
+    retry_policy: Optional[RetryPolicy] = None,
     _test_pickle: bool = False,
 ) -> Tuple[str, Env.Bindings[Value.Base]]:
     """
@@ -584,6 +754,17 @@ def run_local_workflow(
     :param run_dir: outputs and scratch will be stored in this directory if it doesn't already
                     exist; if it does, a timestamp-based subdirectory is created and used (defaults
                     to current working directory)
+    :param container_pool: run task commands in warm containers from this pool (see
+                           :func:`WDL.runtime.run_local_task`)
+    :param task_pack: pack up to this many ready calls of the same task (e.g. scatter shards) into
+                      one container (see :func:`WDL.runtime.task.run_local_task_pack`), except
+                      calls of tasks specifying ``runtime.maxRetries``, which run separately
+    :param task_pack_parallel: run packed task commands concurrently within their container
+    :param hash_outputs: compute digests of each task's output files, recorded in per-call
+                         manifests (see :func:`WDL.runtime.run_local_task`)
+    :param retry_policy: policy for retrying failed task attempts (see
+                         :func:`WDL.runtime.run_local_task`); packed tasks aren't retried, nor
+                         run in ``container_pool``
     """
 
     run_id = run_id or workflow.name
@@ -604,43 +785,192 @@ def run_local_workflow(
     write_values_json(posix_inputs, os.path.join(run_dir, "inputs.json"), namespace=workflow.name)
 
     state = StateMachine(run_id, run_dir, workflow, posix_inputs)
-
-    try:
-        while state.outputs is None:
-            if _test_pickle:
-                state = pickle.loads(pickle.dumps(state))
-
-            next_call = state.step()
-            if next_call:
-                if isinstance(next_call.callee, Tree.Task):
-                    run_callee = run_local_task
-                elif isinstance(next_call.callee, Tree.Workflow):
-                    run_callee = run_local_workflow
-                else:
-                    assert False
-                _, outputs = run_callee(
-                    next_call.callee,  # pyre-fixme
-                    next_call.inputs,
-                    run_id=next_call.id,
-                    run_dir=os.path.join(run_dir, next_call.id),
-                )
-                state.call_finished(next_call.id, outputs)
-    except Exception as exn:
-        logger.debug(traceback.format_exc())
-        if isinstance(exn, TaskFailure):
-            logger.error("%s failed", getattr(exn, "run_id"))
-        else:
-            msg = ""
-            if hasattr(exn, "job_id"):
-                msg += getattr(exn, "job_id") + " "
-            msg += exn.__class__.__name__
-            if str(exn):
-                msg += ", " + str(exn)
-            logger.error(msg)
-            logger.info("run directory: %s", run_dir)
-        raise
+    resources = {}
+    timing = {}
+
+    with ExprProfiling(logger, run_dir):
+        try:
+            while state.outputs is None:
+                if _test_pickle:
+                    state = pickle.loads(pickle.dumps(state))
+
+                # take the next ready call, or (if packing tasks) all of them
+                calls = []
+                next_call = state.step()
+                while next_call:
+                    calls.append(next_call)
+                    next_call = state.step() if task_pack > 1 else None
+
+                for call_id, call_dir, outputs in _run_calls(
+                    calls,
+                    run_dir,
+                    container_pool,
+                    task_pack,
+                    task_pack_parallel,
+                    hash_outputs,
+                    retry_policy,
+                ):
+                    state.call_finished(call_id, outputs)
+                    for res_id, summary in _read_resources(call_id, call_dir).items():
+                        logger.info("resources %s: %s", res_id, json.dumps(summary))
+                        resources[res_id] = summary
+                    timing.update(_read_timing(call_id, call_dir))
+        except Exception as exn:
+            logger.debug(traceback.format_exc())
+            if isinstance(exn, TaskFailure):
+                logger.error("%s failed", getattr(exn, "run_id"))
+            else:
+                msg = ""
+                if hasattr(exn, "job_id"):
+                    msg += getattr(exn, "job_id") + " "
+                msg += exn.__class__.__name__
+                if str(exn):
+                    msg += ", " + str(exn)
+                logger.error(msg)
+                logger.info("run directory: %s", run_dir)
+            raise
 
     assert state.outputs is not None
     write_values_json(state.outputs, os.path.join(run_dir, "outputs.json"), namespace=workflow.name)
+    if resources:
+        total = _total_resources(resources)
+        logger.notice("resources: %s", json.dumps(total))  # pyre-fixme
+        with open(os.path.join(run_dir, "resources.json"), "w") as outfile:
+            print(json.dumps({"total": total, "calls": resources}, indent=2), file=outfile)
+    if timing:
+        _write_timing(logger, run_dir, timing)
     logger.notice("done")  # pyre-fixme
     return (run_dir, state.outputs)
+
+
+def _run_calls(
+    calls: List[StateMachine.CallInstructions],
+    run_dir: str,
+    container_pool: Optional[ContainerPool],
+    task_pack: int,
+    task_pack_parallel: bool,
+    hash_outputs: bool,
+    retry_policy: Optional[RetryPolicy],
+) -> Iterable[Tuple[str, str, Env.Bindings[Value.Base]]]:
+    # run the calls, packing up to task_pack calls of the same task together; generate
+    # (call_id, call_dir, outputs) as each finishes, or raise the first TaskFailure
+    batches: List[List[StateMachine.CallInstructions]] = []
+    task_batches: Dict[int, List[StateMachine.CallInstructions]] = {}
+    for call in calls:
+        batch = task_batches.get(id(call.callee), None) if task_pack > 1 else None
+        # (packed commands can't be retried individually, so don't pack tasks that ask for that)
+        packable = isinstance(call.callee, Tree.Task) and "maxRetries" not in call.callee.runtime
+        if not (batch and len(batch) < task_pack and packable):
+            batch = []
+            batches.append(batch)
+            task_batches[id(call.callee)] = batch
+        batch.append(call)
+
+    for batch in batches:
+        if len(batch) == 1:
+            call = batch[0]
+            if isinstance(call.callee, Tree.Task):
+                call_dir, outputs = run_local_task(
+                    call.callee,
+                    call.inputs,
+                    run_id=call.id,
+                    run_dir=os.path.join(run_dir, call.id),
+                    container_pool=container_pool,
+                    hash_outputs=hash_outputs,
+                    retry_policy=retry_policy,
+                )
+            elif isinstance(call.callee, Tree.Workflow):
+                call_dir, outputs = run_local_workflow(
+                    call.callee,
+                    call.inputs,
+                    run_id=call.id,
+                    run_dir=os.path.join(run_dir, call.id),
+                    container_pool=container_pool,
+                    task_pack=task_pack,
+                    task_pack_parallel=task_pack_parallel,
+                    hash_outputs=hash_outputs,
+                    retry_policy=retry_policy,
+                )
+            else:
+                assert False
+            yield (call.id, call_dir, outputs)
+        else:
+            assert isinstance(batch[0].callee, Tree.Task)
+            results = run_local_task_pack(
+                batch[0].callee,
+                [(call.inputs, call.id, os.path.join(run_dir, call.id)) for call in batch],
+                parallel=task_pack_parallel,
+                hash_outputs=hash_outputs,
+            )
+            for call, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    raise result
+                yield (call.id, result[0], result[1])
+
+
+def _read_resources(call_id: str, call_dir: str) -> Dict[str, Dict[str, Any]]:
+    # read the resources.json summary written in a task's run directory, or the per-call summaries
+    # from a subworkflow's
+    try:
+        with open(os.path.join(call_dir, "resources.json")) as infile:
+            j = json.load(infile)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if "calls" in j:
+        return dict((call_id + "." + k, v) for k, v in j["calls"].items())
+    return {call_id: j} if j.get("samples") else {}
+
+
+def _read_timing(call_id: str, call_dir: str) -> Dict[str, Dict[str, float]]:
+    # read the phase durations from the timing.json written in a task's run directory, or the
+    # per-call timings from a subworkflow's
+    try:
+        with open(os.path.join(call_dir, "timing.json")) as infile:
+            j = json.load(infile)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if "calls" in j:
+        return dict((call_id + "." + k, v) for k, v in j["calls"].items())
+    return {call_id: j.get("phases", {})}
+
+
+def _write_timing(
+    logger: logging.Logger, run_dir: str, timing: Dict[str, Dict[str, float]]
+) -> None:
+    # summarize the per-call phase durations in timing.json and a table timing.tsv, with totals
+    phases = []
+    for call_phases in timing.values():
+        for phase in call_phases:
+            if phase not in phases:
+                phases.append(phase)
+    total = dict(
+        (phase, round(sum(call_phases.get(phase, 0.0) for call_phases in timing.values()), 6))
+        for phase in phases
+    )
+    logger.notice("timing: %s", json.dumps(total))  # pyre-fixme
+    with open(os.path.join(run_dir, "timing.json"), "w") as outfile:
+        print(json.dumps({"total": total, "calls": timing}, indent=2), file=outfile)
+    with open(os.path.join(run_dir, "timing.tsv"), "w") as outfile:
+        print("\t".join(["call"] + phases), file=outfile)
+        for call_id, call_phases in list(timing.items()) + [("TOTAL", total)]:
+            row = [call_id] + ["%.3f" % call_phases[p] if p in call_phases else "" for p in phases]
+            print("\t".join(row), file=outfile)
+
+
+def _total_resources(resources: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    # aggregate the per-call resource usage summaries
+    ans = {
+        "calls": len(resources),
+        "cpu_seconds": 0.0,
+        "elapsed_seconds": 0.0,
+        "peak_mem_bytes": 0,
+        "io_read_bytes": 0,
+        "io_write_bytes": 0,
+    }
+    for summary in resources.values():
+        for key in ["cpu_seconds", "elapsed_seconds", "io_read_bytes", "io_write_bytes"]:
+            ans[key] += summary.get(key, 0)
+        ans["peak_mem_bytes"] = max(ans["peak_mem_bytes"], summary.get("peak_mem_bytes", 0))
+    ans["cpu_seconds"] = round(ans["cpu_seconds"], 3)
+    ans["elapsed_seconds"] = round(ans["elapsed_seconds"], 3)
+    return ans
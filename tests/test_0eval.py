@@ -1,4 +1,4 @@
-import unittest, inspect, json
+import unittest, inspect, json, pickle, io, os, tempfile, time
 from .context import WDL
 
 class TestEval(unittest.TestCase):
@@ -329,7 +329,9 @@ class TestEval(unittest.TestCase):
             ("{0: 1, 2: 3}['foo']", "", WDL.Error.EvalError),
             ("{'foo': 1, 'bar': 2}[3]", "", WDL.Error.OutOfBounds), # int coerces to string...
             ("{3: 1, false: 2}", "", WDL.Error.StaticTypeMismatch),
-            ("{'foo': true, 'bar': 0,}", "", WDL.Error.StaticTypeMismatch)
+            ("{'foo': true, 'bar': 0,}", "", WDL.Error.StaticTypeMismatch),
+            ("{'foo': 1, 'bar': 2, 'foo': 3}", "", WDL.Error.EvalError),
+            ("{2.5: 'b', 1: 'a'}[1]", '"a"'),
         )
 
     def test_errors(self):
@@ -345,12 +347,191 @@ class TestEval(unittest.TestCase):
             ("true || 1/0 == 1", "true"),
         )
 
+    def test_compile(self):
+        # compiled and interpreted evaluation agree, including the source positions of errors
+        env = cons_env(("x", WDL.Value.Int(3)), ("s", WDL.Value.String("a")), ("n", WDL.Value.Null()))
+        type_env = WDL.Env.Bindings().bind("x", WDL.Type.Int()).bind("s", WDL.Type.String()).bind("n", WDL.Type.Int(optional=True))
+        for src in [
+            '"~{s}.~{x + 1}.~{n}.~{s + n}.~{[x, x][0] > 1}\\t"',
+            "x * 2.5 + 1 - x / 2",
+            "[x, 1.5][x - 3]",
+            "[x, 1.5][x]",
+            '{"a": x, "b": 2}[s]',
+            '{"a": x, "a": 2}',
+            "if x > 2 && !defined(n) then x else 0 - x",
+            "x < 2 || x % 2 == 1",
+            "(x, [s]).right[0]",
+            'length(["a", s]) + x * (1 + 2)',
+            "select_first([n, x]) + 1",
+            'basename("/tmp/" + s + ".txt", ".txt")',
+            "1 + x / (x - 3)",
+            "range(x)[x - 1]",
+        ]:
+            expr = WDL.parse_expr(src, version="1.0").infer_type(type_env)
+            results = []
+            for compiled in (False, True):
+                WDL.Expr.compiled_eval = compiled
+                try:
+                    v = expr.eval(env)
+                    results.append((str(v.type), v.json, v.expr is expr))
+                except WDL.Error.RuntimeError as exn:
+                    results.append((exn.__class__, exn.pos))
+                finally:
+                    WDL.Expr.compiled_eval = True
+            self.assertEqual(results[0], results[1], src)
+
+        # the closure is memoized on the expression, which remains picklable
+        expr = WDL.parse_expr('"~{x + 1}"', version="1.0").infer_type(type_env)
+        self.assertIs(expr.compile(), expr.compile())
+        self.assertEqual(expr.compile()(env).value, "4")
+        expr2 = pickle.loads(pickle.dumps(expr))
+        self.assertEqual(expr2.eval(env).value, "4")
+
+        # stdlib functions are looked up on each evaluation, but compiled once per class
+        compiles = []
+
+        class Length(WDL.StdLib.StaticFunction):
+            def compile(self, expr, arguments):
+                compiles.append(self)
+                return super().compile(expr, arguments)
+
+        class StdLib(WDL.StdLib.Base):
+            def __init__(self, n):
+                super().__init__()
+                self.length = Length(
+                    "length", [WDL.Type.Array(WDL.Type.Any())], WDL.Type.Int(), lambda v: WDL.Value.Int(n)
+                )
+
+        expr = WDL.parse_expr("length([x, 2, 3])", version="1.0").infer_type(type_env)
+        self.assertEqual(expr.eval(env).value, 3)
+        self.assertEqual(expr.eval(env, StdLib(42)).value, 42)
+        self.assertEqual(expr.eval(env, StdLib(7)).value, 7)
+        self.assertEqual(expr.eval(env).value, 3)
+        self.assertEqual(len(compiles), 1)
+
+    def test_constant_folding(self):
+        env = cons_env(("x", WDL.Value.Int(3)))
+        type_env = WDL.Env.Bindings().bind("x", WDL.Type.Int())
+        for src, value in [
+            ('"~{1024 * 4}"', "4096"),
+            ("ceil(2.5)", 3),
+            ('"a" + "b" + 1', "ab1"),
+            ('[1, 2, 3][1] + length(["a"])', 3),
+            ('{"a": [1, 2], "b": [3]}', {"a": [1, 2], "b": [3]}),
+            ('(1, "b").right', "b"),
+            ("if 1 < 2 then floor(2.5) else 0", 2),
+            ('basename("/tmp/a.txt", ".txt")', "a"),
+        ]:
+            expr = WDL.parse_expr(src, version="1.0").infer_type(type_env)
+            self.assertIsNotNone(expr.constant, src)
+            self.assertEqual(expr.constant.json, value, src)
+            self.assertIs(expr.eval(env), expr.constant, src)
+            self.assertIs(expr.compile()(env), expr.constant, src)
+            self.assertIs(expr.constant.expr, expr, src)
+            self.assertEqual(str(expr), str(WDL.parse_expr(src, version="1.0")))
+
+        # expressions involving identifiers or impure functions are left alone, as are the
+        # constant subexpressions of them
+        for src in ['"~{x * 4}"', "[1, x]", 'read_int("/dev/null")', "length(range(x))"]:
+            expr = WDL.parse_expr(src, version="1.0").infer_type(type_env)
+            self.assertIsNone(expr.constant, src)
+        expr = WDL.parse_expr("x + (1 + 2)", version="1.0").infer_type(type_env)
+        self.assertIsNone(expr.constant)
+        self.assertEqual(expr.arguments[1].constant.value, 3)
+        self.assertEqual(expr.eval(env).value, 6)
+
+        # nor are large results, which are computed upon evaluation instead
+        for src, n in [("range(20000)", 20000), ("cross(range(200), range(200))", 40000), ("flatten([range(6000), range(6000)])", 12000)]:
+            expr = WDL.parse_expr(src, version="1.0").infer_type(type_env)
+            self.assertIsNone(expr.constant, src)
+            self.assertEqual(len(expr.eval(env).value), n, src)
+        expr = WDL.parse_expr("length(cross(range(1500), range(1500)))", version="1.0").infer_type(type_env)
+        self.assertIsNone(expr.constant)
+        self.assertIsNotNone(expr.arguments[0].arguments[0].constant)
+
+        # failures still occur upon evaluation, at the same position
+        for src, column in [("1 + 4 / (2 - 2)", 5), ("[1, 2][2]", 8), ('sub("a", "(", "b")', 1)]:
+            expr = WDL.parse_expr(src, version="1.0").infer_type(type_env)
+            self.assertIsNone(expr.constant, src)
+            with self.assertRaises(WDL.Error.RuntimeError, msg=src) as ctx:
+                expr.eval(env)
+            self.assertEqual(ctx.exception.pos.column, column, src)
+
+    def test_profiler(self):
+        env = cons_env(("x", WDL.Value.Int(3)), ("a", WDL.Value.Array(WDL.Type.Int(), [WDL.Value.Int(1), WDL.Value.Int(2)])))
+        type_env = WDL.Env.Bindings().bind("x", WDL.Type.Int()).bind("a", WDL.Type.Array(WDL.Type.Int()))
+        expr = WDL.parse_expr("length(range(x * 2)) + a[0]", version="1.0").infer_type(type_env)
+        expr2 = WDL.parse_expr("range(x)", version="1.0").infer_type(type_env)
+        const = WDL.parse_expr("[1, 2]", version="1.0").infer_type(type_env)
+        profiler = WDL.Expr.profiler = WDL.Expr.Profiler()
+        try:
+            for _ in range(3):
+                self.assertEqual(expr.eval(env).value, 7)
+            self.assertEqual(expr2.eval(env).value, [WDL.Value.Int(0), WDL.Value.Int(1), WDL.Value.Int(2)])
+            const.eval(env)
+        finally:
+            WDL.Expr.profiler = None
+        expr.eval(env)
+
+        entries = dict(((entry.label, entry.pos.column), entry) for entry in profiler.report)
+        # the expressions evaluated (not their subexpressions), & each function application within;
+        # but not constant expressions, whose values were computed during typechecking
+        self.assertEqual(
+            set(entries.keys()),
+            {(str(expr), 1), (str(expr2), 1),
+             ("_add()", 1), ("length()", 1), ("range()", 8), ("_mul()", 14), ("_at()", 24), ("range()", 1)}
+        )
+        self.assertEqual(entries[(str(expr), 1)].count, 3)
+        self.assertEqual(entries[(str(expr), 1)].size, 3)
+        self.assertEqual(entries[("range()", 8)].count, 3)
+        self.assertEqual(entries[("range()", 8)].size, 18)
+        self.assertEqual(entries[("range()", 1)].size, 3)
+        self.assertTrue(all(entry.seconds >= 0 for entry in profiler.report))
+        seconds = [entry.seconds for entry in profiler.report]
+        self.assertEqual(seconds, sorted(seconds, reverse=True))
+        self.assertEqual(entries[(str(expr), 1)].json["count"], 3)
+
+        total = WDL.Expr.Profiler()
+        total.merge(profiler)
+        total.merge(profiler)
+        self.assertEqual(len(total.entries), len(profiler.entries))
+        self.assertEqual(total.entries[(expr.pos, "_add")].count, 6)
+
+        # a function application's time excludes that of the applications in its arguments
+        class StdLib(WDL.StdLib.Base):
+            def __init__(self):
+                super().__init__()
+                self.range = WDL.StdLib.StaticFunction(
+                    "range", [WDL.Type.Int()], WDL.Type.Array(WDL.Type.Int()),
+                    lambda v: (time.sleep(0.2), WDL.Value.Array(WDL.Type.Int(), []))[1]
+                )
+
+        profiler = WDL.Expr.profiler = WDL.Expr.Profiler()
+        try:
+            self.assertEqual(expr.eval(env, StdLib()).value, 1)
+        finally:
+            WDL.Expr.profiler = None
+        entries = dict(((entry.label, entry.pos.column), entry) for entry in profiler.report)
+        self.assertGreaterEqual(entries[("range()", 8)].seconds, 0.2)
+        self.assertLess(entries[("length()", 1)].seconds, 0.1)
+        self.assertLess(entries[("_add()", 1)].seconds, 0.1)
+        self.assertGreaterEqual(entries[(str(expr), 1)].seconds, 0.2)
+
 def cons_env(*bindings):
     b = WDL.Env.Bindings()
     for (x,y) in bindings:
         b = WDL.Env.Bindings(WDL.Env.Binding(x,y), b)
     return b
 
+class TestEvalInterpreted(TestEval):
+    # rerun the TestEval cases with the interpreted (instead of compiled) evaluator
+
+    def setUp(self):
+        WDL.Expr.compiled_eval = False
+
+    def tearDown(self):
+        WDL.Expr.compiled_eval = True
+
 class TestEnv(unittest.TestCase):
     """
     Test the trickier recursive Env operations
@@ -403,6 +584,46 @@ class TestEnv(unittest.TestCase):
         self.assertEqual(e.resolve("fruit.orange"), "a")
         self.assertEqual(e.resolve("fruit.grape.green"), "f")
 
+    def test_index(self):
+        e = WDL.Env.Bindings()
+        self.assertFalse(e)
+        self.assertEqual(len(e), 0)
+        self.assertFalse("x" in e)
+        e = e.bind("x", 1).bind("y", 2)
+        self.assertEqual(len(e), 2)
+        self.assertTrue(e)
+        e2 = e.bind("x", 3).with_empty_namespace("fruit")
+        self.assertEqual(len(e2), 2)
+        self.assertEqual(e2["x"], 3)
+        self.assertEqual(e["x"], 1)
+        self.assertEqual([b.value for b in e2], [3, 2])
+        self.assertEqual(len(e2.bind("z", 4)), 3)
+        self.assertEqual(e2.bind("z", 4)["x"], 3)
+        self.assertFalse(e2.has_binding("z"))
+        self.assertFalse(1 in e2)
+
+        for i in range(1000):
+            e = e.bind("v" + str(i), i)
+            self.assertEqual(e["v" + str(i // 2)], i // 2)
+        self.assertEqual(len(e), 1002)
+        self.assertEqual(len(e.subtract(e2)), 1000)
+
+        # namespaces in a long environment, with shadowing
+        e = WDL.Env.Bindings()
+        for i in range(5000):
+            e = e.bind("fruit.apple." + str(i % 100), i).bind("veg." + str(i), i)
+        e = e.with_empty_namespace("fruit.orange")
+        self.assertEqual(len(e), 5100)
+        self.assertTrue(e.has_namespace("fruit.apple"))
+        self.assertTrue(e.has_namespace("fruit.orange"))
+        self.assertFalse(e.has_namespace("fruit.pear"))
+        self.assertEqual(len(e.namespaces), 4)
+        apple = e.enter_namespace("fruit.apple")
+        self.assertEqual([b.name for b in apple], [str(i) for i in range(99, -1, -1)])
+        self.assertEqual(apple["42"], 4942)
+        self.assertEqual(len(e.enter_namespace("fruit.orange")), 0)
+        self.assertEqual(len(e.enter_namespace("fruit")), 100)
+
     def test_namespaces(self):
         e = WDL.Env.Bindings().bind("fruit.apple.honeycrisp", 42)
         self.assertTrue(e.has_namespace("fruit.apple"))
@@ -426,7 +647,168 @@ class TestEnv(unittest.TestCase):
         self.assertTrue(e.has_namespace("fruit."))
 
 
+class TestType(unittest.TestCase):
+    def test_canonical(self):
+        T = WDL.Type
+        a = T.Map((T.String(), T.Array(T.Pair(T.Int(), T.File(optional=True)), nonempty=True)))
+        b = T.Map((T.String(), T.Array(T.Pair(T.Int(), T.File(optional=True)), nonempty=True)))
+        c = T.Map((T.String(), T.Array(T.Pair(T.Int(), T.File()), nonempty=True)))
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(len({a, b, c}), 2)
+        self.assertIs(a._canonical(), b._canonical())
+        self.assertEqual(a, b)
+        self.assertTrue(c.coerces(a))
+        self.assertFalse(a.coerces(c, check_quant=True))
+        self.assertTrue(T.Array(T.Int(), nonempty=True).coerces(T.Array(T.Int())))
+        self.assertNotEqual(T.Int(), "Int")
+
+        # copies
+        i = T.Int()
+        self.assertIs(i.copy(), i)
+        self.assertIs(i.copy(optional=False), i)
+        i2 = i.copy(optional=True)
+        self.assertTrue(i2.optional and not i.optional)
+        self.assertEqual(str(i2), "Int?")
+        arr = T.Array(T.Int())
+        self.assertEqual(arr._canonical(), "Array[Int]")
+        arr2 = arr.copy(nonempty=True)
+        self.assertEqual(str(arr2), "Array[Int]+")
+        self.assertEqual(str(arr), "Array[Int]")
+        self.assertNotEqual(arr, arr2)
+        arr3 = pickle.loads(pickle.dumps(arr2))
+        self.assertEqual(arr3, arr2)
+        self.assertIs(arr3._canonical(), arr2._canonical())
+
+        # struct types aren't canonicalized, since their members may be resolved later
+        s = T.StructInstance("Person")
+        arr = T.Array(s)
+        self.assertEqual(arr._canonical(), "")
+        s.members = {"name": T.String()}
+        self.assertTrue(T.Object({"name": T.String()}).coerces(arr.item_type))
+        s2 = T.StructInstance("Person")
+        s2.members = {"name": T.String()}
+        self.assertEqual(arr, T.Array(s2))
+        s2.members = {"name": T.String(), "age": T.Int()}
+        self.assertNotEqual(arr, T.Array(s2))
+
+
 class TestValue(unittest.TestCase):
+    def test_packed(self):
+        T, V = WDL.Type, WDL.Value
+        a = V.from_json(T.Array(T.Int()), [3, 1, 2])
+        self.assertIsInstance(a.value, V.PackedItems)
+        self.assertEqual(a.json, [3, 1, 2])
+        self.assertEqual(len(a.value), 3)
+        self.assertIsInstance(a.value[1], V.Int)
+        self.assertEqual(a.value[1].value, 1)
+        self.assertEqual([v.value for v in a.value], [3, 1, 2])
+        self.assertEqual(a.value[1:].json, [1, 2])
+        boxed = V.Array(T.Array(T.Int()), [V.Int(3), V.Int(1), V.Int(2)])
+        self.assertEqual(a, boxed)
+        self.assertEqual(boxed, a)
+        self.assertNotEqual(a, V.from_json(T.Array(T.Int()), [3, 1]))
+
+        self.assertEqual(a.coerce(T.Array(T.Float())).json, [3.0, 1.0, 2.0])
+        self.assertEqual(a.coerce(T.Array(T.String())).json, ["3", "1", "2"])
+        b = V.from_json(T.Array(T.Boolean()), [True, False])
+        self.assertEqual(b.coerce(T.Array(T.String())).json, ["true", "false"])
+        self.assertEqual(b.json, [True, False])
+        s = V.from_json(T.Array(T.String()), ["1", "2"])
+        self.assertEqual(s.coerce(T.Array(T.Int())).json, [1, 2])
+        files = s.coerce(T.Array(T.File()))
+        self.assertIsInstance(files.value[0], V.File)
+        with self.assertRaises(ValueError):
+            V.from_json(T.Array(T.String()), ["1", "x"]).coerce(T.Array(T.Int()))
+
+        # items not suitable for packing
+        self.assertIsInstance(V.from_json(T.Array(T.Int(optional=True)), [1, None]).value, list)
+        self.assertIsInstance(V.from_json(T.Array(T.File()), ["/tmp/x"]).value, list)
+        self.assertEqual(V.packed_array(T.Int(), [2 ** 70, 1]).json, [2 ** 70, 1])
+
+        concat = V.PackedItems.concat([a.value, V.packed_array(T.Int(), range(2)).value])
+        self.assertEqual(concat.json, [3, 1, 2, 0, 1])
+        self.assertIsNone(V.PackedItems.concat([a.value, s.value]))
+
+    def test_compact_file_arrays(self):
+        T, V = WDL.Type, WDL.Value
+        paths = [f"/data/run/{i % 3}/sample{i}.bam" for i in range(10)] + ["rel.txt", "/"]
+        V.compact_file_arrays = True
+        try:
+            a = V.from_json(T.Array(T.File()), paths)
+            s = V.from_json(T.Array(T.String()), paths).coerce(T.Array(T.File()))
+            g = V.packed_array(T.File(), paths)
+        finally:
+            V.compact_file_arrays = False
+        for files in (a, s, g):
+            self.assertIsInstance(files.value.data, V.PathList)
+            self.assertEqual(files.json, paths)
+            self.assertEqual(
+                files.value.data.dirs, ["/data/run/0/", "/data/run/1/", "/data/run/2/", "", "/"]
+            )
+            self.assertIsInstance(files.value[4], V.File)
+            self.assertEqual(files.value[4].value, "/data/run/1/sample4.bam")
+        self.assertEqual(a.value[9:].json, paths[9:])
+        self.assertEqual(a, V.Array(T.Array(T.File()), [V.File(p) for p in paths]))
+        self.assertIs(a.coerce(T.Array(T.File())).value, a.value)
+        self.assertEqual(a.coerce(T.Array(T.String())).json, paths)
+        self.assertEqual(pickle.loads(pickle.dumps(a)).json, paths)
+        self.assertEqual(V.PackedItems.concat([a.value, a.value]).json, paths + paths)
+        buf = io.StringIO()
+        V.write_json(a, buf.write)
+        self.assertEqual(json.loads(buf.getvalue()), paths)
+
+        self.assertIs(V.rewrite_files(a, lambda fn: fn), a)
+        b = V.rewrite_files(a, lambda fn: "/mnt" + fn)
+        self.assertIsInstance(b.value.data, V.PathList)
+        self.assertEqual(b.json, ["/mnt" + p for p in paths])
+        self.assertEqual(a.json, paths)
+
+        # not opted in
+        self.assertIsInstance(V.from_json(T.Array(T.File()), paths).value, list)
+
+    def test_map(self):
+        T, V = WDL.Type, WDL.Value
+        js = {f"k{i}": i for i in range(1000)}
+        m = V.from_json(T.Map((T.String(), T.Int())), js)
+        self.assertEqual(m.get(V.String("k42")), V.Int(42))
+        self.assertIsNone(m.get(V.String("k1000")))
+        self.assertEqual(list(m.index), list(js))
+        self.assertEqual(m.json, js)
+
+        # duplicate keys: last value wins, in the first key's position (as in JSON)
+        m = V.Map(
+            (T.String(), T.Int()),
+            [(V.String("a"), V.Int(1)), (V.String("b"), V.Int(2)), (V.String("a"), V.Int(3))],
+        )
+        self.assertEqual(len(m.index), 2)
+        self.assertEqual(m.get(V.String("a")), V.Int(3))
+        self.assertEqual(json.dumps(m.json), '{"a": 3, "b": 2}')
+
+        # unhashable keys fall back to scanning
+        def pair(x, y):
+            return V.Pair(T.Int(), T.Int(), (V.Int(x), V.Int(y)))
+
+        m = V.Map((T.Pair(T.Int(), T.Int()), T.String()), [(pair(1, 2), V.String("x"))])
+        self.assertIsNone(m.index)
+        self.assertEqual(m.get(pair(1, 2)), V.String("x"))
+        self.assertIsNone(m.get(pair(2, 1)))
+
+    def test_provenance(self):
+        # (not a constant expression, whose value is computed just once during typechecking)
+        env = WDL.Env.Bindings().bind("n", WDL.Value.Int(1))
+        type_env = WDL.Env.Bindings().bind("n", WDL.Type.Int())
+        expr = WDL.parse_expr('"x" + n', version="1.0").infer_type(type_env)
+        self.assertIs(expr.eval(env).expr, expr)
+        WDL.Expr.value_provenance = False
+        try:
+            self.assertIsNone(expr.eval(env).expr)
+        finally:
+            WDL.Expr.value_provenance = True
+        with self.assertRaises(AttributeError):
+            WDL.Value.Int(42).foo = "bar"
+
     def test_json(self):
         pty = WDL.Type.StructInstance("Person")
         pty.members = {
@@ -455,12 +837,32 @@ class TestValue(unittest.TestCase):
             (pty, {"name": "Alyssa", "age": 42, "pets": None, "address": "No 4, Privet Drive"}, WDL.Error.InputError),
         ]
 
+        cases += [
+            (WDL.Type.Array(WDL.Type.Array(pty)), [[{"name": "Alyssa", "age": 42, "pets": None}], []]),
+            (WDL.Type.Array(WDL.Type.File()), ["/tmp/a,b", "/tmp/\"c\""]),
+            (WDL.Type.Map((WDL.Type.String(), WDL.Type.Array(WDL.Type.Float()))), {"a": [1, 2.5]}),
+            (WDL.Type.Array(pty), [{"name": "Alyssa", "age": 42}], WDL.Error.InputError),
+            (WDL.Type.Array(WDL.Type.Int()), [1, "2"], WDL.Error.InputError),
+        ]
+
+        def stream(ty, j, chunk_size):
+            s = WDL._util.JSONStream(io.StringIO(json.dumps(j, indent=1)), chunk_size=chunk_size)
+            ans = WDL.Value.from_json_stream(ty, s)
+            s.end()
+            return ans
+
         for t in cases:
             if len(t) >= 3 and inspect.isclass(t[2]):
                 with self.assertRaises(t[2]):
                     WDL.Value.from_json(t[0],t[1])
+                with self.assertRaises(t[2]):
+                    stream(t[0], t[1], 3)
             else:
                 self.assertEqual(t[1], WDL.Value.from_json(t[0],t[1]).json)
+                for chunk_size in (1, 3, 1048576):
+                    v = stream(t[0], t[1], chunk_size)
+                    self.assertEqual(v.json, t[1])
+                    self.assertEqual(v, WDL.Value.from_json(t[0], t[1]))
 
         self.assertEqual(
             WDL.parse_expr('object {"name": "Alyssa", "age": 42, "address": "No 4, Privet Drive"}',
@@ -468,6 +870,48 @@ class TestValue(unittest.TestCase):
             {"name": "Alyssa", "age": 42, "address": "No 4, Privet Drive"}
         )
 
+    def test_write_json(self):
+        T, V = WDL.Type, WDL.Value
+        pty = T.StructInstance("P")
+        pty.members = {"name": T.String(), "xs": T.Array(T.Float()), "m": T.Map((T.String(), T.Int()), optional=True)}
+        values = [
+            V.from_json(T.Array(T.Int()), list(range(5000))),
+            V.from_json(T.Array(T.Float()), [1.5, float("inf"), -0.0, 1e300]),
+            V.from_json(T.Array(T.String()), ["a", "\u00e9\n\"", ""]),
+            V.from_json(T.Array(T.Array(T.File())), [[], ["/x"], ["/y", "/z"]]),
+            V.from_json(T.Array(pty), [{"name": "n", "xs": [], "m": None}, {"name": "o", "xs": [1.0], "m": {"a": 1}}]),
+            V.Map((T.String(), T.Int()), [(V.String("a"), V.Int(1)), (V.String("b"), V.Int(2)), (V.String("a"), V.Int(3))]),
+            V.Pair(T.Int(), T.String(), (V.Int(1), V.String("x"))),
+            V.Null(), V.Boolean(True), V.Array(T.Int(), []), V.Struct(T.Object({}), {}),
+        ]
+        for v in values:
+            for indent in (None, 2, 4):
+                chunks = []
+                V.write_json(v, chunks.append, indent)
+                separators = (",", ":") if indent is None else None
+                self.assertEqual("".join(chunks), json.dumps(v.json, indent=indent, separators=separators))
+
+        env = WDL.Env.Bindings()
+        for i, v in enumerate(values):
+            env = env.bind(f"v{i}", v)
+        fn = os.path.join(tempfile.mkdtemp(prefix="miniwdl_test_write_json_"), "outputs.json")
+        extra = {"_manifest": "outputs.manifest.json"}
+        WDL._util.write_values_json(env, fn, namespace="w", extra=extra)
+        expected = WDL.values_to_json(env, namespace="w")
+        expected.update(extra)
+        with open(fn) as infile:
+            self.assertEqual(infile.read(), json.dumps(expected, indent=2) + "\n")
+        WDL._util.write_values_json(env, fn, namespace="w", extra=extra, compact=True)
+        with open(fn) as infile:
+            self.assertEqual(infile.read(), json.dumps(expected, separators=(",", ":")) + "\n")
+
+        # non-String map keys are stringified as json.dumps() would; compound ones are an error
+        chunks = []
+        V.write_json(V.Map((T.Int(), T.Boolean()), [(V.Int(1), V.Boolean(True)), (V.Int(-2), V.Boolean(False))]), chunks.append)
+        self.assertEqual("".join(chunks), json.dumps({1: True, -2: False}, separators=(",", ":")))
+        with self.assertRaises(ValueError):
+            V.write_json(V.Map((T.Pair(T.Int(), T.Int()), T.Int()), [(V.Pair(T.Int(), T.Int(), (V.Int(1), V.Int(2))), V.Int(3))]), chunks.append)
+
     def test_env_json(self):
         doc = WDL.parse_document(R"""
         version 1.0
@@ -494,6 +938,8 @@ class TestValue(unittest.TestCase):
             if isinstance(exe, WDL.Workflow):
                 namespace = exe.name
             self.assertEqual(WDL.values_to_json(WDL.values_from_json(d, exe.available_inputs, exe.required_inputs, namespace=namespace), namespace=namespace), d)
+            env = WDL.values_from_json_file(io.StringIO(json.dumps(d)), exe.available_inputs, exe.required_inputs, namespace=namespace)
+            self.assertEqual(WDL.values_to_json(env, namespace=namespace), d)
 
         rt(doc.tasks[0], {"who": "Alyssa"})
         rt(doc.tasks[0], {"who": "Alyssa", "age": 24})
@@ -510,6 +956,9 @@ class TestValue(unittest.TestCase):
             rt(doc.workflow, {".who": "a"})
         with self.assertRaises(WDL.Error.InputError):
             rt(doc.workflow, {"w.s..who": "b"})
+        for bad in ('{"w.s.who": "Alyssa",}', '{"w.s.who": "Alyssa"} {}', '["w.s.who"]'):
+            with self.assertRaises(json.JSONDecodeError):
+                WDL.values_from_json_file(io.StringIO(bad), doc.workflow.available_inputs, namespace="w")
 
         # misc functionality
         self.assertEqual(WDL.values_to_json(doc.workflow.required_inputs, "w"), {"w.s.who": "String"})
@@ -5,6 +5,8 @@ import os
 import docker
 import signal
 import time
+import json
+import glob
 from .context import WDL
 from testfixtures import log_capture
 
@@ -14,7 +16,7 @@ class TestTaskRunner(unittest.TestCase):
         logging.basicConfig(level=logging.DEBUG, format='%(name)s %(levelname)s %(message)s')
         self._dir = tempfile.mkdtemp(prefix="miniwdl_test_taskrun_")
 
-    def _test_task(self, wdl:str, inputs = None, expected_exception: Exception = None):
+    def _test_task(self, wdl:str, inputs = None, expected_exception: Exception = None, **kwargs):
         WDL._util.ensure_swarm(logging.getLogger("test_task"))
         try:
             doc = WDL.parse_document(wdl)
@@ -22,7 +24,7 @@ class TestTaskRunner(unittest.TestCase):
             doc.typecheck()
             if isinstance(inputs, dict):
                 inputs = WDL.values_from_json(inputs, doc.tasks[0].available_inputs, doc.tasks[0].required_inputs)
-            rundir, outputs = WDL.runtime.run_local_task(doc.tasks[0], (inputs or WDL.Env.Bindings()), run_dir=self._dir)
+            rundir, outputs = WDL.runtime.run_local_task(doc.tasks[0], (inputs or WDL.Env.Bindings()), run_dir=self._dir, **kwargs)
         except WDL.runtime.TaskFailure as exn:
             if expected_exception:
                 self.assertIsInstance(exn.__context__, expected_exception)
@@ -702,3 +704,311 @@ class TestTaskRunner(unittest.TestCase):
         # check task with overkill number of CPUs gets scheduled
         outputs = self._test_task(txt, {"n": 8, "cpu": 9999})
         self.assertLessEqual(outputs["wall_seconds"], 6)
+
+    def test_resource_sampler(self):
+        # fake cgroup v1 & v2 filesystems
+        cid = "f00"
+        v1 = os.path.join(self._dir, "cgroup_v1")
+        for controller, files in [
+            ("cpuacct", {"cpuacct.usage": "2500000000\n"}),
+            ("memory", {"memory.usage_in_bytes": "1000\n", "memory.max_usage_in_bytes": "4096\n"}),
+            ("blkio", {"blkio.throttle.io_service_bytes": "8:0 Read 100\n8:0 Write 200\n8:0 Total 300\nTotal 300\n"}),
+        ]:
+            dn = os.path.join(v1, controller, "docker", cid)
+            os.makedirs(dn)
+            for fn, content in files.items():
+                with open(os.path.join(dn, fn), "w") as outfile:
+                    outfile.write(content)
+        v2 = os.path.join(self._dir, "cgroup_v2")
+        dn = os.path.join(v2, "system.slice", "docker-" + cid + ".scope")
+        os.makedirs(dn)
+        for fn, content in {
+            "cpu.stat": "usage_usec 1500000\nuser_usec 1000000\n",
+            "memory.current": "2048\n",
+            "io.stat": "8:0 rbytes=10 wbytes=20 rios=1 wios=2\n8:16 rbytes=1 wbytes=2\n",
+        }.items():
+            with open(os.path.join(dn, fn), "w") as outfile:
+                outfile.write(content)
+        with open(os.path.join(v2, "cgroup.controllers"), "w") as outfile:
+            outfile.write("cpu io memory\n")
+
+        logger = logging.getLogger("test_resource_sampler")
+        sampler = WDL.runtime.task.ContainerResourceSampler(cid, cgroup_root=v1)
+        sampler.sample(logger)
+        sampler.sample(logger)
+        summary = sampler.summary
+        self.assertEqual(summary["samples"], 2)
+        self.assertEqual(summary["cpu_seconds"], 2.5)
+        self.assertEqual(summary["peak_mem_bytes"], 4096)
+        self.assertEqual(summary["io_read_bytes"], 100)
+        self.assertEqual(summary["io_write_bytes"], 200)
+
+        sampler = WDL.runtime.task.ContainerResourceSampler(cid, cgroup_root=v2)
+        sampler.sample(logger)
+        summary = sampler.summary
+        self.assertEqual(summary["cpu_seconds"], 1.5)
+        self.assertEqual(summary["peak_mem_bytes"], 2048)
+        self.assertEqual(summary["io_read_bytes"], 11)
+        self.assertEqual(summary["io_write_bytes"], 22)
+        sampler.write(self._dir)
+        with open(os.path.join(self._dir, "resources.tsv")) as infile:
+            lines = infile.read().strip().split("\n")
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(lines[0].split("\t"), sampler.columns)
+        with open(os.path.join(self._dir, "resources.json")) as infile:
+            self.assertEqual(json.load(infile)["cpu_seconds"], 1.5)
+
+        # nonexistent cgroup: sampling quietly disabled
+        sampler = WDL.runtime.task.ContainerResourceSampler("bogus", cgroup_root=v2)
+        sampler.sample(logger)
+        self.assertEqual(sampler.summary, {"samples": 0})
+
+    def test_output_hasher(self):
+        import hashlib
+        files = {}
+        for name, size in [("empty", 0), ("small", 123), ("big", 3 * 1048576 + 17)]:
+            fn = os.path.join(self._dir, name)
+            data = os.urandom(size)
+            with open(fn, "wb") as outfile:
+                outfile.write(data)
+            files[fn] = {"size": size, "sha256": hashlib.sha256(data).hexdigest()}
+        with WDL.runtime.task.OutputHasher(max_workers=2) as hasher:
+            for fn in list(files.keys()) * 2:
+                hasher.submit(fn)
+            manifest = hasher.manifest
+        self.assertEqual(manifest, {"algorithm": "sha256", "files": files})
+
+        with WDL.runtime.task.OutputHasher() as hasher:
+            hasher.submit(os.path.join(self._dir, "nonexistent"))
+            with self.assertRaises(FileNotFoundError):
+                hasher.manifest
+
+    def test_hash_outputs(self):
+        outputs = self._test_task(R"""
+        version 1.0
+        task hashes {
+            command <<<
+                echo foo > foo.txt
+                echo bar > bar.txt
+            >>>
+            output {
+                File foo = "foo.txt"
+                Array[File] both = ["foo.txt", "bar.txt"]
+            }
+        }
+        """, hash_outputs=True)
+        rundir = os.path.dirname(os.path.dirname(outputs["foo"]))
+        with open(os.path.join(rundir, "outputs.json")) as infile:
+            outputs_json = json.load(infile)
+        self.assertEqual(outputs_json["_manifest"], "outputs.manifest.json")
+        with open(os.path.join(rundir, outputs_json["_manifest"])) as infile:
+            manifest = json.load(infile)
+        self.assertEqual(manifest["algorithm"], "sha256")
+        self.assertEqual(sorted(manifest["files"].keys()), sorted(outputs["both"]))
+        self.assertEqual(manifest["files"][outputs["foo"]], {
+            "size": 4, "sha256": "b5bb9d8014a0f9b1d61e21e796d78dccdf1352f23cd32812f4850b878ae4944c"
+        })
+
+    def test_task_timer(self):
+        timer = WDL.runtime.task.TaskTimer()
+        for phase in ["input_eval", "command", "command", "output_eval"]:
+            time.sleep(0.01)
+            timer.mark(phase)
+        self.assertEqual(list(timer.timeline.keys()), ["input_eval", "command", "output_eval"])
+        self.assertEqual(list(timer.phases.keys()), ["input_eval", "command", "output_eval"])
+        self.assertTrue(all(t >= 0.01 for t in timer.phases.values()))
+        self.assertAlmostEqual(sum(timer.phases.values()), timer.timeline["output_eval"], places=5)
+        timer.write(self._dir)
+        with open(os.path.join(self._dir, "timing.json")) as infile:
+            j = json.load(infile)
+        self.assertEqual(j["phases"], timer.phases)
+        self.assertEqual(j["total_seconds"], timer.timeline["output_eval"])
+
+        # retry keeps the given phases & the overall start, recording the rest as one phase
+        timer2 = timer.retry("attempt-1", ["input_eval"])
+        time.sleep(0.01)
+        timer2.mark("command")
+        self.assertEqual(list(timer2.timeline.keys()), ["input_eval", "attempt-1", "command"])
+        self.assertEqual(timer2.start_time, timer.start_time)
+        self.assertGreaterEqual(timer2.timeline["attempt-1"], timer.timeline["output_eval"])
+        self.assertGreater(timer2.timeline["command"], timer2.timeline["attempt-1"])
+
+    def test_task_timing(self):
+        outputs = self._test_task(R"""
+        version 1.0
+        task hello {
+            command <<<
+                echo hello > hello.txt
+            >>>
+            output {
+                File hello = "hello.txt"
+            }
+        }
+        """)
+        rundir = os.path.dirname(os.path.dirname(outputs["hello"]))
+        with open(os.path.join(rundir, "timing.json")) as infile:
+            phases = json.load(infile)["phases"]
+        self.assertEqual(
+            list(phases.keys()),
+            ["provision", "input_eval", "runtime_eval", "command_interpolation", "service_create",
+             "scheduling", "container_start", "command", "output_eval", "json_write"]
+        )
+
+    def test_retry_policy(self):
+        policy = WDL.runtime.task.RetryPolicy(backoff_base=2.0, backoff_max=10.0)
+        for retry, delay in [(1, 2.0), (2, 4.0), (3, 8.0), (4, 10.0), (10, 10.0)]:
+            for _ in range(10):
+                self.assertTrue(0.75 * delay <= policy.backoff(retry) <= 1.25 * delay)
+        self.assertTrue(issubclass(WDL.runtime.ContainerFailure, RuntimeError))
+        self.assertFalse(issubclass(WDL.runtime.ContainerFailure, WDL.runtime.CommandFailure))
+
+    def test_max_retries(self):
+        wdl = R"""
+        version 1.0
+        task flaky {
+            input {
+                Int retries = 2
+            }
+            command <<<
+                echo attempt
+                exit 42
+            >>>
+            runtime {
+                maxRetries: retries
+            }
+        }
+        """
+        policy = WDL.runtime.task.RetryPolicy(backoff_base=0.01)
+        exn = self._test_task(wdl, expected_exception=WDL.runtime.CommandFailure, retry_policy=policy)
+        self.assertEqual(exn.exit_status, 42)
+        rundir = os.path.dirname(exn.stderr_file)
+        self.assertEqual(sorted(fn for fn in os.listdir(rundir) if fn.startswith("attempt-")),
+                         ["attempt-1", "attempt-2"])
+        for attempt in ["attempt-1", "attempt-2"]:
+            with open(os.path.join(rundir, attempt, "stdout.txt")) as infile:
+                self.assertEqual(infile.read(), "attempt\n")
+            self.assertTrue(os.path.isfile(os.path.join(rundir, attempt, "timing.json")))
+        self.assertFalse(os.path.exists(os.path.join(rundir, "attempt-3")))
+        with open(os.path.join(rundir, "timing.json")) as infile:
+            phases = list(json.load(infile)["phases"].keys())
+        self.assertEqual(phases[:4], ["provision", "attempt-1", "attempt-2", "input_eval"])
+
+        # runtime.maxRetries overrides the policy default
+        self._dir = tempfile.mkdtemp(prefix="miniwdl_test_taskrun_")
+        policy = WDL.runtime.task.RetryPolicy(max_retries=5, backoff_base=0.01)
+        exn = self._test_task(wdl, {"retries": 0}, expected_exception=WDL.runtime.CommandFailure,
+                              retry_policy=policy)
+        self.assertEqual([fn for fn in os.listdir(os.path.dirname(exn.stderr_file)) if fn.startswith("attempt-")], [])
+
+    def test_parse_byte_size(self):
+        for s, n in [("4 GiB", 4 * 1024 ** 3), ("500M", 500 * 1000 ** 2), ("1.5G", 1500000000),
+                     ("2048", 2048), ("100 MiB", 100 * 1024 ** 2), ("8gb", 8 * 1000 ** 3), ("1 KB", 1000)]:
+            self.assertEqual(WDL._util.parse_byte_size(s), n)
+        for s in ["", "GiB", "4 GB GB", "-1G", "4 XB"]:
+            with self.assertRaises(ValueError):
+                WDL._util.parse_byte_size(s)
+
+    def test_memory_limit(self):
+        txt = R"""
+        version 1.0
+        task eat {
+            input {
+                String memory
+                Int mb
+            }
+            command <<<
+                head -c ~{mb}m /dev/zero | tail > /dev/null
+            >>>
+            runtime {
+                memory: memory
+            }
+        }
+        """
+        self._test_task(txt, {"memory": "100 MiB", "mb": 10})
+        # (not retried, since it would fail the same way)
+        exn = self._test_task(txt, {"memory": "100 MiB", "mb": 400}, expected_exception=WDL.runtime.OutOfMemory,
+                              retry_policy=WDL.runtime.task.RetryPolicy(max_retries=2, backoff_base=0.01))
+        self.assertEqual([fn for fn in os.listdir(os.path.dirname(exn.stderr_file)) if fn.startswith("attempt-")], [])
+        self._test_task(txt, {"memory": "lots", "mb": 10}, expected_exception=WDL.Error.EvalError)
+
+    @log_capture()
+    def test_tail_logger(self, capture):
+        # exercise TailLogger without docker: append lines to two files concurrently
+        logger = logging.getLogger("test_tail_logger")
+        fns = [os.path.join(self._dir, "a.txt"), os.path.join(self._dir, "b.txt")]
+        for fn in fns:
+            with open(fn, "w"):
+                pass
+        with WDL._util.TailLogger(logger, fns[0], prefix="a| "), WDL._util.TailLogger(logger, fns[1], prefix="b| "):
+            with open(fns[0], "a") as a, open(fns[1], "a") as b:
+                for i in range(3):
+                    a.write(f"{i}={time.time()}\n")
+                    a.flush()
+                    b.write("part ")
+                    b.flush()
+                    time.sleep(0.5)
+                    b.write(f"{i}\n")
+                    b.flush()
+                    time.sleep(1)
+                a.write("incomplete")
+        msgs = [record for record in capture.records if record.name == "test_tail_logger"]
+        a_msgs = [record for record in msgs if record.msg.startswith("a| ")]
+        b_msgs = [record.msg for record in msgs if record.msg.startswith("b| ")]
+        self.assertEqual(len(a_msgs), 4)
+        for record in a_msgs[:3]:
+            # check line logged within 3 seconds of being written
+            self.assertLess(record.created, float(record.msg.split("=")[1]) + 3)
+        self.assertEqual(a_msgs[3].msg, "a| incomplete")
+        self.assertEqual(b_msgs, ["b| part 0", "b| part 1", "b| part 2"])
+        self.assertFalse([fn for fn in os.listdir(self._dir) if fn.endswith(".offset")])
+
+    @log_capture()
+    def test_tail_logger_sweep(self, capture):
+        # a file whose modification events are missed is still read periodically, even while
+        # events for other files keep arriving
+        logger = logging.getLogger("test_tail_logger_sweep")
+        fns = [os.path.join(self._dir, "a.txt"), os.path.join(self._dir, "b.txt")]
+        for fn in fns:
+            with open(fn, "w"):
+                pass
+        tailer = WDL._util._Tailer.get()
+        tail = WDL._util._TailFile(logger, fns[1], "b| ")
+        tailer.register(tail)
+        wd, tail.wd = tail.wd, -2  # ignore its events
+        try:
+            with WDL._util.TailLogger(logger, fns[0], prefix="a| "), open(fns[0], "a") as a:
+                with open(fns[1], "a") as b:
+                    b.write(f"{time.time()}\n")
+                for i in range(25):
+                    a.write(f"{i}\n")
+                    a.flush()
+                    time.sleep(0.2)
+                b_msgs = [record for record in capture.records if record.msg.startswith("b| ")]
+        finally:
+            tail.wd = wd
+            tailer.unregister(tail)
+        self.assertEqual(len(b_msgs), 1)
+        self.assertLess(b_msgs[0].created, float(b_msgs[0].msg[3:]) + 3)
+
+    def test_workdir_listing(self):
+        # _WorkDirListing.glob agrees with glob.glob (filtered to files)
+        workdir = os.path.join(self._dir, "work")
+        for fn in ["a.txt", "b.csv", ".hidden.txt", "sub/c.txt", "sub/.d.txt", "sub/deep/e.txt", ".hiddendir/f.txt"]:
+            os.makedirs(os.path.dirname(os.path.join(workdir, fn)), exist_ok=True)
+            with open(os.path.join(workdir, fn), "w"):
+                pass
+        os.symlink("a.txt", os.path.join(workdir, "link.txt"))
+        os.symlink("nonexistent", os.path.join(workdir, "broken.txt"))
+        listing = WDL.runtime.task._WorkDirListing(workdir)
+        for pat in [
+            "*.txt", "*", "**", "**/*.txt", "sub/**", "sub/**/e.txt", "**/deep/*", ".*", ".hiddendir/*",
+            "sub*/c.txt", "sub/*", "a.txt", "nonexistent/*", "[ab].*", "sub/", "a.txt/", "**/", "sub/*/",
+            "sub/./deep/*", "././a.txt", "./sub/*.txt", "./**/e.txt",
+        ]:
+            expected = sorted(
+                os.path.relpath(fn, workdir)
+                for fn in glob.glob(os.path.join(workdir, pat), recursive=True)
+                if os.path.isfile(fn)
+            )
+            self.assertEqual(sorted(listing.glob(pat)), expected, pat)
+        self.assertEqual(listing.glob("sub/"), [])
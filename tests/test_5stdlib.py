@@ -611,3 +611,14 @@ class TestStdLib(unittest.TestCase):
             }
         }
         """, expected_exception=WDL.Error.EvalError)
+
+
+class TestStdLibInterpreted(TestStdLib):
+    # rerun the TestStdLib cases with the interpreted (instead of compiled) expression evaluator
+
+    def setUp(self):
+        super().setUp()
+        WDL.Expr.compiled_eval = False
+
+    def tearDown(self):
+        WDL.Expr.compiled_eval = True
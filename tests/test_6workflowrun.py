@@ -2,6 +2,8 @@ import unittest
 import logging
 import tempfile
 import os
+import glob
+import json
 import docker
 import signal
 import time
@@ -13,7 +15,7 @@ class TestWorkflowRunner(unittest.TestCase):
         logging.basicConfig(level=logging.DEBUG, format='%(name)s %(levelname)s %(message)s')
         self._dir = tempfile.mkdtemp(prefix="miniwdl_test_workflowrun_")
 
-    def _test_workflow(self, wdl:str, inputs = None, expected_exception: Exception = None):
+    def _test_workflow(self, wdl:str, inputs = None, expected_exception: Exception = None, **kwargs):
         WDL._util.ensure_swarm(logging.getLogger("test_workflow"))
         try:
             with tempfile.NamedTemporaryFile(dir=self._dir, suffix=".wdl", delete=False) as outfile:
@@ -22,7 +24,7 @@ class TestWorkflowRunner(unittest.TestCase):
             doc = WDL.load(wdlfn)
             if isinstance(inputs, dict):
                 inputs = WDL.values_from_json(inputs, doc.workflow.available_inputs, doc.workflow.required_inputs)
-            rundir, outputs = WDL.runtime.run_local_workflow(doc.workflow, (inputs or WDL.Env.Bindings()), run_dir=self._dir, _test_pickle=True)
+            rundir, outputs = WDL.runtime.run_local_workflow(doc.workflow, (inputs or WDL.Env.Bindings()), run_dir=self._dir, _test_pickle=True, **kwargs)
         except WDL.runtime.TaskFailure as exn:
             if expected_exception:
                 self.assertIsInstance(exn.__context__, expected_exception)
@@ -194,6 +196,249 @@ class TestWorkflowRunner(unittest.TestCase):
         """, {"m": 4, "n": 2})
         self.assertEqual(outputs["pairs"], [[0, 0], [0, 1], [1, 0], [1, 1], [2, 0], [2, 1], [3, 0], [3, 1]])
 
+    def test_scatter_invariants(self):
+        # decls & call inputs not depending on the scatter variable are evaluated once for all
+        # the shards (so for example write_lines() writes just one file)
+        outputs = self._test_workflow("""
+        version 1.0
+
+        workflow invariants {
+            input {
+                Int n
+                String ref = "/data/ref.fa"
+            }
+            scatter (i in range(n)) {
+                String refname = basename(ref, ".fa")
+                File names = write_lines([refname, ref])
+                String tag = refname + "." + i
+                Int k = length(read_lines(names))
+                scatter (j in range(2)) {
+                    Int ik = i + k
+                    call add {
+                        input:
+                            a = ik,
+                            b = j,
+                            s = refname + i
+                    }
+                }
+            }
+            output {
+                Array[String] tags = tag
+                Array[File] names_files = names
+                Array[Array[Int]] sums = add.sum
+                Array[Array[String]] ss = add.s_out
+            }
+        }
+
+        task add {
+            input {
+                Int a
+                Int b
+                String s
+            }
+            command {}
+            output {
+                Int sum = a + b
+                String s_out = s
+            }
+        }
+        """, {"n": 3})
+        self.assertEqual(outputs["tags"], ["ref.0", "ref.1", "ref.2"])
+        self.assertEqual(len(set(outputs["names_files"])), 1)
+        self.assertEqual(outputs["sums"], [[2, 3], [3, 4], [4, 5]])
+        self.assertEqual(outputs["ss"], [["ref0", "ref0"], ["ref1", "ref1"], ["ref2", "ref2"]])
+        with open(glob.glob(os.path.join(self._dir, "*_invariants", "workflow.log"))[0]) as infile:
+            log = infile.read()
+        self.assertIn("visit hoist-decl-refname ", log)
+        self.assertIn("visit hoist-decl-k ", log)
+        self.assertNotIn("visit hoist-decl-tag", log)
+        self.assertIn("visit hoist-decl-ik-2 ", log)
+        self.assertIn("visit hoist-call-add-1 ", log)
+
+    def test_profile_expressions(self):
+        profiler = WDL.Expr.profiler = WDL.Expr.Profiler()
+        try:
+            outputs = self._test_workflow("""
+            version 1.0
+
+            workflow profiled {
+                input {
+                    Int n
+                }
+                scatter (i in range(n)) {
+                    Array[Int] r = range(i)
+                }
+                call sum {
+                    input:
+                        a = flatten(r)
+                }
+                output {
+                    Int total = sum.total + length(r)
+                }
+            }
+
+            task sum {
+                input {
+                    Array[Int] a
+                }
+                command {}
+                output {
+                    Int total = length(a) + 0
+                }
+            }
+            """, {"n": 5})
+        finally:
+            WDL.Expr.profiler = None
+        self.assertEqual(outputs["total"], 15)
+
+        # the workflow's profile.json includes the task's
+        with open(glob.glob(os.path.join(self._dir, "*_profiled", "profile.json"))[0]) as infile:
+            report = json.load(infile)
+        entries = dict(((entry["label"], entry["line"]), entry) for entry in report)
+        self.assertEqual(entries[("range()", 9)]["count"], 5)
+        self.assertEqual(entries[("range()", 9)]["size"], 10)
+        self.assertEqual(entries[("flatten()", 13)]["size"], 10)
+        self.assertEqual(entries[("length()", 26)]["count"], 1)
+        seconds = [entry["seconds"] for entry in report]
+        self.assertEqual(seconds, sorted(seconds, reverse=True))
+        with open(glob.glob(os.path.join(self._dir, "*_profiled", "call-sum", "profile.json"))[0]) as infile:
+            task_report = json.load(infile)
+        labels = [entry["label"] for entry in task_report if entry["line"] == 26]
+        self.assertEqual(labels[0], "length(a) + 0")
+        self.assertEqual(sorted(labels[1:]), ["_add()", "length()"])
+        # ...and the global profiler has all the statistics
+        self.assertEqual(len(profiler.entries), len(report))
+
+    def test_task_pack(self):
+        wdl = """
+        version 1.0
+        workflow packed {
+            input {
+                Int n
+                Int fail = -1
+            }
+            scatter (i in range(n)) {
+                call sq { input: i = i, fail = fail }
+            }
+            output {
+                Array[Int] squares = sq.out
+                Array[String] errs = sq.err
+                Array[File] files = sq.file
+            }
+        }
+        task sq {
+            input {
+                Int i
+                Int fail
+            }
+            command <<<
+                if [ ~{i} -eq ~{fail} ]; then exit 42; fi
+                echo $(( ~{i} * ~{i} )) | tee square.txt
+                >&2 echo "shard ~{i}"
+            >>>
+            output {
+                Int out = read_int(stdout())
+                String err = read_string(stderr())
+                File file = "square.txt"
+            }
+        }
+        """
+        for parallel in [False, True]:
+            outputs = self._test_workflow(wdl, {"n": 7}, task_pack=3, task_pack_parallel=parallel)
+            self.assertEqual(outputs["squares"], [i*i for i in range(7)])
+            self.assertEqual(outputs["errs"], [f"shard {i}" for i in range(7)])
+            self.assertEqual(len(set(os.path.dirname(fn) for fn in outputs["files"])), 7)
+            for i, fn in enumerate(outputs["files"]):
+                with open(fn) as infile:
+                    self.assertEqual(infile.read(), f"{i*i}\n")
+
+        # timing summary
+        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(outputs["files"][0]))), "timing.tsv")) as infile:
+            rows = [line.rstrip("\n").split("\t") for line in infile]
+        self.assertEqual(rows[0][:3], ["call", "provision", "input_eval"])
+        self.assertEqual(len(rows), 7 + 2)
+        self.assertEqual(rows[-1][0], "TOTAL")
+
+        exn = self._test_workflow(wdl, {"n": 7, "fail": 4}, WDL.runtime.CommandFailure, task_pack=3)
+        self.assertEqual(exn.exit_status, 42)
+
+        # tasks specifying runtime.maxRetries run unpacked, so that they can be retried
+        wdl = wdl.replace("File file = \"square.txt\"\n            }", "File file = \"square.txt\"\n            }\n            runtime {\n                maxRetries: 1\n            }")
+        self.assertIn("maxRetries", wdl)
+        exn = self._test_workflow(wdl, {"n": 7, "fail": 4}, WDL.runtime.CommandFailure, task_pack=3,
+                                  retry_policy=WDL.runtime.task.RetryPolicy(backoff_base=0.01))
+        self.assertEqual(exn.exit_status, 42)
+        self.assertTrue(os.path.isdir(os.path.join(os.path.dirname(exn.stderr_file), "attempt-1")))
+
+    def test_warm_container_pool(self):
+        wdl = """
+        version 1.0
+        workflow tiny {
+            input {
+                Int n
+                File ro
+            }
+            scatter (i in range(n)) {
+                call count { input: i = i, ro = ro }
+            }
+            output {
+                Array[Int] counts = count.n
+                Array[File] files = count.file
+                Array[Boolean] writable = count.writable
+            }
+        }
+        task count {
+            input {
+                Int i
+                File ro
+            }
+            command <<<
+                echo ~{i} > number.txt
+                >&2 echo "counting ~{i}"
+                (echo clobbered > "~{ro}") 2>/dev/null && echo true > writable.txt || echo false > writable.txt
+                wc -c number.txt | cut -f1 -d ' '
+            >>>
+            output {
+                Int n = read_int(stdout())
+                File file = "number.txt"
+                Boolean writable = read_boolean("writable.txt")
+            }
+        }
+        """
+        ro = os.path.join(self._dir, "ro.txt")
+        with open(ro, "w") as outfile:
+            outfile.write("original\n")
+        with WDL.runtime.task.ContainerPool(2, 4, scratch_dir=os.path.join(self._dir, "pool")) as pool:
+            outputs = self._test_workflow(wdl, {"n": 10, "ro": ro}, container_pool=pool)
+        self.assertEqual(outputs["counts"], [2] * 10)
+        for i, fn in enumerate(outputs["files"]):
+            self.assertTrue(fn.startswith(self._dir + "/"))
+            with open(fn) as infile:
+                self.assertEqual(infile.read(), f"{i}\n")
+        # input files are mounted read-only
+        self.assertEqual(outputs["writable"], [False] * 10)
+        with open(ro) as infile:
+            self.assertEqual(infile.read(), "original\n")
+        self.assertFalse(os.path.exists(os.path.join(self._dir, "pool")))
+
+        # per-task stderr capture & exit status
+        with WDL.runtime.task.ContainerPool(1, 1) as pool:
+            exn = self._test_workflow("""
+            version 1.0
+            workflow w {
+                call fail
+            }
+            task fail {
+                command <<<
+                    >&2 echo "oops"
+                    exit 42
+                >>>
+            }
+            """, expected_exception=WDL.runtime.CommandFailure, container_pool=pool)
+        self.assertEqual(exn.exit_status, 42)
+        with open(exn.stderr_file) as infile:
+            self.assertEqual(infile.read(), "oops\n")
+
     def test_ifs(self):
         outputs = self._test_workflow("""
         version 1.0
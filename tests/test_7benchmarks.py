@@ -0,0 +1,830 @@
+import unittest
+import logging
+import tempfile
+import os
+import time
+import json
+import copy
+import tracemalloc
+import glob
+from .context import WDL
+
+# The benchmarks run at full size only if MINIWDL_BENCHMARKS is set in the environment; otherwise
+# the slowest ones are scaled down by this factor, which still checks their results.
+_SCALE = 1 if os.environ.get("MINIWDL_BENCHMARKS", "") else 10
+
+
+class _NoopContainer(WDL.runtime.task.TaskContainer):
+    # TaskContainer that never actually runs anything, for exercising the host/container file
+    # mapping logic without docker
+    def _run(self, logger, terminating, command, cpu, memory):
+        return 0
+
+
+class TestBenchmarks(unittest.TestCase):
+    """
+    Scaled-down benchmarks of runtime hot paths, which don't need docker. Each logs its timings
+    and checks the results for correctness (but avoids asserting wall-clock expectations, which
+    would be flaky on shared CI hosts). Set MINIWDL_BENCHMARKS=1 to run them at full size.
+    """
+
+    def setUp(self):
+        logging.basicConfig(level=logging.DEBUG, format="%(name)s %(levelname)s %(message)s")
+        self._logger = logging.getLogger("test_benchmarks")
+        self._dir = tempfile.mkdtemp(prefix="miniwdl_test_benchmarks_")
+
+    def _timed(self, label, f, *args, **kwargs):
+        t0 = time.perf_counter()
+        ans = f(*args, **kwargs)
+        self._logger.info("%s: %.3fs", label, time.perf_counter() - t0)
+        return ans
+
+    def test_host_file_10k(self):
+        N = 10000
+        container = _NoopContainer("bench", self._dir)
+        os.makedirs(os.path.join(self._dir, "inputs"))
+        os.makedirs(os.path.join(self._dir, "work", "out"))
+        host_inputs = []
+        for i in range(N):
+            fn = os.path.join(self._dir, "inputs", str(i % 10), f"in{i}.txt")
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+            host_inputs.append(fn)
+        container.add_files(host_inputs)
+        container_outputs = []
+        for i in range(N):
+            with open(os.path.join(self._dir, "work", "out", f"out{i}.txt"), "w"):
+                pass
+            container_outputs.append(
+                os.path.join(container.container_dir, "work", "out", f"out{i}.txt")
+            )
+
+        # output of input files
+        container_inputs = [container.input_file_map[fn] for fn in host_inputs]
+        ans = self._timed(
+            f"host_file() x {N} input files",
+            lambda: [container.host_file(fn) for fn in container_inputs],
+        )
+        self.assertEqual(ans, host_inputs)
+
+        # output of files written in the working directory, individually & batched
+        ans = self._timed(
+            f"host_file() x {N} output files",
+            lambda: [container.host_file(fn) for fn in container_outputs],
+        )
+        ans2 = self._timed(
+            f"host_files() x {N} output files",
+            container.host_files,
+            container_outputs + container_inputs,
+        )
+        self.assertEqual(len(ans2), 2 * N)
+        for fn, hfn in zip(container_outputs, ans):
+            self.assertEqual(ans2[fn], hfn)
+            self.assertTrue(hfn.startswith(os.path.join(self._dir, "work", "out") + "/"))
+        for fn, hfn in zip(container_inputs, host_inputs):
+            self.assertEqual(ans2[fn], hfn)
+
+        # security checks still apply in the batch
+        os.symlink("/etc/passwd", os.path.join(self._dir, "work", "out", "passwd"))
+        with self.assertRaises(WDL.runtime.OutputError):
+            container.host_files(
+                container_outputs[:10]
+                + [os.path.join(container.container_dir, "work", "out", "passwd")]
+            )
+        with self.assertRaises(WDL.runtime.OutputError):
+            container.host_files(
+                [os.path.join(container.container_dir, "work", "out", "..", "..", "command")]
+            )
+        with self.assertRaises(WDL.runtime.OutputError):
+            container.host_files(
+                [os.path.join(container.container_dir, "work", "out", "nonexistent")]
+            )
+
+    def test_rewrite_files_100k(self):
+        # mapping the File paths in a large nested input: deep copy & mutate in place (the former
+        # approach) vs. Value.rewrite_files
+        N, M = 100, 1000 // _SCALE
+        ty = WDL.Type.Array(WDL.Type.Array(WDL.Type.File()))
+        posix = WDL.Value.from_json(
+            ty, [[f"/data/{i}/{j}.bam" for j in range(M)] for i in range(N)]
+        )
+        mapping = dict(
+            (f"/data/{i}/{j}.bam", f"/mnt/inputs/{i}/{j}.bam") for i in range(N) for j in range(M)
+        )
+
+        def deepcopy_map(v):
+            def map_files(v):
+                if isinstance(v, WDL.Value.File):
+                    v.value = mapping[v.value]
+                for ch in v.children:
+                    map_files(ch)
+                return v
+
+            return map_files(copy.deepcopy(v))
+
+        def rewrite_files(v):
+            return WDL.Value.rewrite_files(v, mapping.__getitem__)
+
+        ans1 = self._timed(f"deepcopy & map {N*M} Files", deepcopy_map, posix)
+        ans2 = self._timed(f"rewrite_files {N*M} Files", rewrite_files, posix)
+        # peak memory (on a tenth of the input, as tracemalloc slows everything down)
+        posix_part = WDL.Value.Array(ty.item_type, posix.value[: N // 10])
+        for f in (deepcopy_map, rewrite_files):
+            tracemalloc.start()
+            try:
+                f(posix_part)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self._logger.info(
+                "%s %d Files peak memory: %d KiB", f.__name__, N * M // 10, peak >> 10
+            )
+        self.assertEqual(ans1.json, ans2.json)
+        self.assertEqual(ans2.json[N - 1][M - 1], f"/mnt/inputs/{N-1}/{M-1}.bam")
+        # original is intact, and types are shared
+        self.assertEqual(posix.json[N - 1][M - 1], f"/data/{N-1}/{M-1}.bam")
+        self.assertIs(ans2.type, posix.type)
+        self.assertIs(ans2.value[0].type, posix.value[0].type)
+        # unchanged subtrees are shared
+        self.assertIs(WDL.Value.rewrite_files(posix, lambda fn: fn), posix)
+        pair = WDL.Value.Pair(
+            WDL.Type.Array(WDL.Type.Int()), ty, (WDL.Value.from_json(ty.item_type, []), posix)
+        )
+        pair = WDL.Value.Pair(WDL.Type.Int(), pair.type, (WDL.Value.Int(42), pair))
+        ans3 = WDL.Value.rewrite_files(pair, mapping.__getitem__)
+        self.assertIs(ans3.value[0], pair.value[0])
+        self.assertIs(ans3.value[1].value[0], pair.value[1].value[0])
+        self.assertEqual(ans3.value[1].value[1].json, ans2.json)
+
+        # in _eval_task_inputs
+        doc = WDL.parse_document(R"""
+        version 1.0
+        task t {
+            input {
+                Array[Array[File]] files
+            }
+            command {}
+        }
+        """)
+        doc.typecheck()
+        container = _NoopContainer("bench", self._dir)
+        container_env = self._timed(
+            f"_eval_task_inputs {N*M} Files",
+            WDL.runtime.task._eval_task_inputs,
+            self._logger,
+            doc.tasks[0],
+            WDL.Env.Bindings(WDL.Env.Binding("files", posix)),
+            container,
+        )
+        files = container_env["files"].json
+        self.assertTrue(files[N - 1][M - 1].startswith(container.container_dir + "/inputs/"))
+        self.assertEqual(posix.json[N - 1][M - 1], f"/data/{N-1}/{M-1}.bam")
+
+    def test_value_memory(self):
+        # memory footprint of a large array of Int values
+        N, M = 100, 1000
+        ty = WDL.Type.Array(WDL.Type.Array(WDL.Type.Int()))
+        # (offset so that each Python int is a distinct object, as in real data)
+        js = [[i * M + j + 1000000 for j in range(M)] for i in range(N)]
+        tracemalloc.start()
+        try:
+            v = WDL.Value.from_json(ty, js)
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        per_value = size / (N * M)
+        self._logger.info("Array[Array[Int]] of %d values: %.1f bytes per Int", N * M, per_value)
+        self.assertEqual(v.json, js)
+        # slotted values sharing type objects (previously ~185 bytes)
+        self.assertLess(per_value, 100)
+        self.assertFalse(hasattr(v.value[0].value[0], "__dict__"))
+        self.assertIs(v.value[0].value[0].type, v.value[1].value[1].type)
+        self.assertIs(v.value[0].type, v.value[1].type)
+
+        # evaluation with & without recording value provenance
+        expr = WDL.parse_expr("[x, x + 1, x * 2]", version="1.0")
+        expr.infer_type(WDL.Env.Bindings().bind("x", WDL.Type.Int()))
+        env = WDL.Env.Bindings().bind("x", WDL.Value.Int(3))
+        for provenance in (True, False):
+            WDL.Expr.value_provenance = provenance
+            try:
+                ans = self._timed(
+                    f"eval x 20000, value_provenance={provenance}",
+                    lambda: [expr.eval(env) for _ in range(20000)],
+                )
+            finally:
+                WDL.Expr.value_provenance = True
+            self.assertEqual(ans[-1].json, [3, 4, 6])
+            self.assertEqual(ans[-1].expr is expr, provenance)
+
+    def test_packed_arrays(self):
+        # large primitive arrays: boxed Value list (the former representation) vs. packed items
+        N = 1000000 // _SCALE
+        boxed = self._timed(
+            f"range({N}) boxed",
+            lambda: WDL.Value.Array(WDL.Type.Int(), [WDL.Value.Int(x) for x in range(N)]),
+        )
+        expr = WDL.parse_expr(f"range({N})", version="1.0").infer_type([])
+        packed = self._timed(f"range({N}) packed", lambda: expr.eval([]))
+        self.assertIsInstance(packed.value, WDL.Value.PackedItems)
+        self.assertEqual(self._timed("json boxed", lambda: boxed.json), list(range(N)))
+        self.assertEqual(self._timed("json packed", lambda: packed.json), list(range(N)))
+        self.assertEqual(packed, boxed)
+
+        lines = "".join(f"line{i}\n" for i in range(N))
+        old = self._timed(
+            f"read_lines {N} boxed",
+            lambda: WDL.Value.Array(
+                WDL.Type.String(), [WDL.Value.String(line) for line in lines[:-1].split("\n")]
+            ),
+        )
+        new = self._timed(f"read_lines {N} packed", WDL.StdLib._parse_lines, lines)
+        self.assertEqual(new, old)
+        prefixed = self._timed(
+            f"prefix {N} packed",
+            WDL.StdLib._Prefix()._call_eager,
+            None,
+            [WDL.Value.String("/data/"), new],
+        )
+        self.assertEqual(prefixed.value[N - 1].value, f"/data/line{N-1}")
+
+        # memory (on a tenth)
+        ints = range(N, N + N // 10)
+        for label, f in (
+            ("boxed", lambda: [WDL.Value.Int(x) for x in ints]),
+            ("packed", lambda: WDL.Value.packed_array(WDL.Type.Int(), ints)),
+        ):
+            tracemalloc.start()
+            try:
+                ans = f()
+                size = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            self._logger.info("%d Ints %s: %d KiB", N // 10, label, size >> 10)
+            del ans
+
+    def test_file_arrays(self):
+        # large Array[File] input sharing long directory prefixes: boxed File values vs. compact
+        # PathList storage, in memory and for the operations on the task input path
+        N = 100000
+        paths = [
+            f"/mnt/shared/projects/cohort-2020/sequencing/batch{i % 50:02d}/aligned/S{i:06d}.bam"
+            for i in range(N)
+        ]
+        text = json.dumps(paths)
+        ty = WDL.Type.Array(WDL.Type.File())
+        env = WDL.Env.Bindings()
+        for label, compact in (("boxed", False), ("compact", True)):
+            WDL.Value.compact_file_arrays = compact
+            try:
+                tracemalloc.start()
+                try:
+                    files = WDL.Value.from_json(ty, json.loads(text))
+                    size = tracemalloc.get_traced_memory()[0]
+                finally:
+                    tracemalloc.stop()
+                self._logger.info("%d Files %s: %d KiB", N, label, size >> 10)
+                self.assertEqual(isinstance(files.value, WDL.Value.PackedItems), compact)
+                env = env.bind(label, files)
+                self._timed(
+                    f"{N} Files {label} from_json",
+                    WDL.Value.from_json,
+                    ty,
+                    json.loads(text),
+                )
+            finally:
+                WDL.Value.compact_file_arrays = False
+            self.assertEqual(self._timed(f"{N} Files {label} json", lambda: files.json), paths)
+            filenames = self._timed(
+                f"{N} Files {label} _filenames",
+                WDL.runtime.workflow._filenames,
+                WDL.Env.Bindings().bind("files", files),
+            )
+            self.assertEqual(len(filenames), N)
+            rewritten = self._timed(
+                f"{N} Files {label} rewrite_files",
+                WDL.Value.rewrite_files,
+                files,
+                lambda fn: "/mnt/miniwdl_task_container/work/_miniwdl_inputs/0/" + fn[-11:],
+            )
+            self.assertEqual(rewritten.value[N - 1].value[-11:], paths[N - 1][-11:])
+        self.assertEqual(env["boxed"], env["compact"])
+
+    def test_input_json(self):
+        # loading a large input JSON file: parsing it whole then instantiating values, vs. streaming
+        N = 200000 // _SCALE
+        doc = WDL.parse_document(
+            """
+            version 1.0
+            struct Sample {
+                String name
+                File bam
+                Int reads
+            }
+            workflow w {
+                input {
+                    Array[File] files
+                    Array[Sample] samples
+                    Array[Int] counts
+                }
+            }
+            """
+        )
+        doc.typecheck()
+        fn = os.path.join(self._dir, "inputs.json")
+        with open(fn, "w") as outfile:
+            json.dump(
+                {
+                    "w.files": [f"/data/batch{i % 100}/sample{i}.cram" for i in range(N)],
+                    "w.samples": [
+                        {"name": f"sample{i}", "bam": f"/data/sample{i}.bam", "reads": i}
+                        for i in range(N // 4)
+                    ],
+                    "w.counts": list(range(N)),
+                },
+                outfile,
+            )
+        self._logger.info("input JSON: %d MiB", os.path.getsize(fn) >> 20)
+        available = doc.workflow.available_inputs
+
+        def load():
+            with open(fn) as infile:
+                return WDL.values_from_json(json.loads(infile.read()), available, namespace="w")
+
+        def load_stream():
+            with open(fn) as infile:
+                return WDL.values_from_json_file(infile, available, namespace="w")
+
+        results = []
+        for label, f in (
+            ("json.loads & values_from_json", load),
+            ("values_from_json_file", load_stream),
+        ):
+            results.append(self._timed(label, f))
+            tracemalloc.start()
+            try:
+                f()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self._logger.info("%s peak memory: %d MiB", label, peak >> 20)
+        self.assertEqual(WDL.values_to_json(results[0]), WDL.values_to_json(results[1]))
+        self.assertEqual(len(results[1]["samples"].value), N // 4)
+        self.assertIsInstance(results[1]["counts"].value, WDL.Value.PackedItems)
+
+    def test_write_values_json(self):
+        # writing inputs.json/outputs.json: one with large arrays, and many small ones (as for the
+        # calls of a large scatter); values_to_json & json.dumps (the former method) vs. streaming
+        N, calls = 200000 // _SCALE, 2000 // _SCALE
+        big = WDL.Env.Bindings().bind(
+            "files",
+            WDL.Value.Array(
+                WDL.Type.File(),
+                [WDL.Value.File(f"/data/batch{i % 100}/sample{i}.cram") for i in range(N)],
+            ),
+        )
+        big = big.bind("counts", WDL.Value.packed_array(WDL.Type.Int(), range(N)))
+        small = (
+            WDL.Env.Bindings()
+            .bind("name", WDL.Value.String("sample"))
+            .bind("bam", WDL.Value.File("/data/sample.bam"))
+            .bind("reads", WDL.Value.Int(42))
+        )
+        fn = os.path.join(self._dir, "outputs.json")
+
+        def old(env):
+            j = WDL.values_to_json(env, namespace="w")
+            with open(fn, "w") as outfile:
+                print(json.dumps(j, indent=2), file=outfile)
+
+        def new(env, compact=False):
+            WDL._util.write_values_json(env, fn, "w", compact=compact)
+
+        results = {}
+        for label, f in (
+            ("values_to_json & json.dumps", old),
+            ("write_values_json", new),
+            ("write_values_json compact", lambda env: new(env, compact=True)),
+        ):
+            self._timed(f"{label}: {N} items", f, big)
+            with open(fn) as infile:
+                results[label] = infile.read()
+            tracemalloc.start()
+            try:
+                f(big)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self._logger.info("%s: %d items, peak memory %d MiB", label, N, peak >> 20)
+            self._timed(f"{label}: {calls} small files", lambda: [f(small) for _ in range(calls)])
+        self.assertEqual(results["values_to_json & json.dumps"], results["write_values_json"])
+        compact = json.loads(results["write_values_json compact"])
+        self.assertEqual(compact, json.loads(results["write_values_json"]))
+
+    def test_map_lookup(self):
+        # indexing into a large map from read_map(), as each scatter shard might
+        N, M = 50000, 10000
+        tsv = "".join(f"sample{i}\t/data/sample{i}.bam\n" for i in range(N))
+        m = self._timed(f"read_map {N}", WDL.StdLib._parse_map, tsv)
+        expr = WDL.parse_expr("m[k]", version="1.0")
+        expr.infer_type(
+            WDL.Env.Bindings()
+            .bind("m", WDL.Type.Map((WDL.Type.String(), WDL.Type.String())))
+            .bind("k", WDL.Type.String())
+        )
+        envs = [
+            WDL.Env.Bindings().bind("m", m).bind("k", WDL.Value.String(f"sample{i * 7919 % N}"))
+            for i in range(M)
+        ]
+        ans = self._timed(f"m[k] x {M}", lambda: [expr.eval(env).value for env in envs])
+        self.assertEqual(ans[-1], f"/data/sample{(M - 1) * 7919 % N}.bam")
+
+        # the former linear scan, on a hundredth of the lookups
+        def scan(key):
+            for k, v in m.value:
+                if k == key:
+                    return v.value
+
+        ans = self._timed(
+            f"linear scan x {M // 100}",
+            lambda: [scan(env["k"]) for env in envs[: M // 100]],
+        )
+        self.assertEqual(ans[-1], f"/data/sample{(M // 100 - 1) * 7919 % N}.bam")
+        self.assertEqual(len(m.index), N)
+        self.assertEqual(list(m.json), [f"sample{i}" for i in range(N)])
+
+    def test_glob_100k(self):
+        # glob() output patterns over a working directory with many files: glob.glob (the former
+        # approach) vs. the cached directory listings
+        N = 100000 // _SCALE
+        workdir = os.path.join(self._dir, "work")
+        for i in range(N):
+            fn = os.path.join(workdir, "shards", str(i % 100), f"shard{i}.txt")
+            if i < 100:
+                os.makedirs(os.path.dirname(fn))
+            with open(fn, "w"):
+                pass
+        for fn in ["a.txt", "b.csv", ".hidden.txt", "sub/c.txt", "sub/.d.txt", "sub/deep/e.txt"]:
+            os.makedirs(os.path.dirname(os.path.join(workdir, fn)), exist_ok=True)
+            with open(os.path.join(workdir, fn), "w"):
+                pass
+        os.makedirs(os.path.join(workdir, ".hiddendir"))
+        with open(os.path.join(workdir, ".hiddendir", "f.txt"), "w"):
+            pass
+        os.symlink("a.txt", os.path.join(workdir, "link.txt"))
+        os.symlink("sub", os.path.join(workdir, "sublink"))
+        os.symlink("nonexistent", os.path.join(workdir, "broken.txt"))
+
+        patterns = [
+            "shards/*/shard1*.txt",
+            "shards/**/*.txt",
+            "*.txt",
+            "*",
+            "**",
+            "**/*.txt",
+            "sub/**",
+            "sub/**/e.txt",
+            "**/deep/*",
+            ".*",
+            ".hiddendir/*",
+            "sub*/c.txt",
+            "sub/*",
+            "a.txt",
+            "nonexistent/*",
+            "[ab].*",
+        ]
+
+        def glob_glob():
+            ans = []
+            for pat in patterns:
+                pat = os.path.join(workdir, pat)
+                host_files = sorted(
+                    fn for fn in glob.glob(pat, recursive=True) if os.path.isfile(fn)
+                )
+                ans.append([os.path.relpath(fn, workdir) for fn in host_files])
+            return ans
+
+        def listing_glob():
+            listing = WDL.runtime.task._WorkDirListing(workdir)
+            return [sorted(listing.glob(pat)) for pat in patterns]
+
+        expected = self._timed(f"glob.glob {len(patterns)} patterns, {N} files", glob_glob)
+        ans = self._timed(f"_WorkDirListing {len(patterns)} patterns, {N} files", listing_glob)
+        for pat, expected_files, files in zip(patterns, expected, ans):
+            if pat.startswith("**"):
+                # unlike glob.glob, ** doesn't descend through symlinks to directories
+                expected_files = [fn for fn in expected_files if not fn.startswith("sublink/")]
+            self.assertEqual(files, expected_files, pat)
+        self.assertEqual(len(ans[0]), len([i for i in range(N) if str(i).startswith("1")]))
+        self.assertEqual(len(ans[1]), N)
+
+    def test_expr_eval(self):
+        # typical declaration & call input expressions, evaluated once per scatter shard (each with
+        # its own stdlib, as the runtime does): the interpreter vs. the compiled closures
+        shards = 5000 // _SCALE
+        T, V = WDL.Type, WDL.Value
+        exprs = [
+            WDL.parse_expr(src, version="1.0").infer_type(
+                WDL.Env.Bindings()
+                .bind("sample", T.String())
+                .bind("i", T.Int())
+                .bind("gb", T.Float())
+                .bind("reads", T.Array(T.String()))
+                .bind("p", T.Pair(T.String(), T.Int()))
+            )
+            for src in [
+                '"~{sample}.~{i}.bam"',
+                "ceil(gb * 2.0) + 4",
+                "if i % 2 == 0 then i * 2 else i + 1",
+                "[sample + '.r1', sample + '.r2']",
+                "p.right + length(reads)",
+                "reads[i % length(reads)]",
+                "i > 1 && i < 100 || defined(p)",
+                'basename(reads[0], ".fq")',
+            ]
+        ]
+        envs = [
+            WDL.Env.Bindings()
+            .bind("sample", V.String(f"sample{i}"))
+            .bind("i", V.Int(i))
+            .bind("gb", V.Float(i / 1000.0))
+            .bind("reads", V.packed_array(T.String(), [f"/data/{i}_1.fq", f"/data/{i}_2.fq"]))
+            .bind("p", V.Pair(T.String(), T.Int(), (V.String("x"), V.Int(i))))
+            for i in range(shards)
+        ]
+
+        def eval_all():
+            ans = []
+            for env in envs:
+                stdlib = WDL.StdLib.Base()
+                ans.append([expr.eval(env, stdlib).json for expr in exprs])
+            return ans
+
+        results = {}
+        for label, compiled, profiler in (
+            ("interpreted", False, None),
+            ("compiled", True, None),
+            ("compiled & profiled", True, WDL.Expr.Profiler()),
+        ):
+            WDL.Expr.compiled_eval = compiled
+            WDL.Expr.profiler = profiler
+            try:
+                results[label] = self._timed(
+                    f"eval {len(exprs)} expressions x {shards} shards, {label}", eval_all
+                )
+            finally:
+                WDL.Expr.compiled_eval = True
+                WDL.Expr.profiler = None
+        self.assertEqual(results["interpreted"], results["compiled"])
+        self.assertEqual(results["compiled"], results["compiled & profiled"])
+        self.assertEqual(profiler.entries[(exprs[0].pos, "")].count, shards)
+
+    def test_constant_folding(self):
+        # constant runtime & call input expressions, evaluated once per scatter shard: typechecked
+        # without vs. with constant folding
+        shards = 5000
+        srcs = [
+            '"~{1024 * 4}M"',
+            "ceil(2.5 * 3) + 1",
+            '"ubuntu" + ":" + "18.04"',
+            '["-x", "-y", "--threads=" + 4]',
+            '{"a": 1, "b": 2}',
+            "if 2 > 1 then 100 else 200",
+            'basename("/ref/hg38.fa", ".fa")',
+            "length(range(16)) * 2",
+        ]
+
+        results = {}
+        for label, folding in (("unfolded", False), ("folded", True)):
+            WDL.Expr.constant_folding = folding
+            try:
+                exprs = [
+                    WDL.parse_expr(src, version="1.0").infer_type(WDL.Env.Bindings())
+                    for src in srcs
+                ]
+            finally:
+                WDL.Expr.constant_folding = True
+            self.assertEqual(all(expr.constant is not None for expr in exprs), folding)
+            env = WDL.Env.Bindings()
+            results[label] = self._timed(
+                f"eval {len(exprs)} constant expressions x {shards} shards, {label}",
+                lambda: [[expr.eval(env).json for expr in exprs] for _ in range(shards)],
+            )
+        self.assertEqual(results["unfolded"], results["folded"])
+
+    def test_scatter_invariants(self):
+        # a scatter body decl reading a file: evaluated in each shard (as it references the scatter
+        # variable) vs. once for all the shards
+        shards, lines = 500, 10000
+        fn = os.path.join(self._dir, "lines.txt")
+        with open(fn, "w") as outfile:
+            for i in range(lines):
+                print(f"line {i}", file=outfile)
+        wdl = """
+        version 1.0
+        workflow w {
+            input {
+                Int n
+                File lines
+            }
+            scatter (i in range(n)) {
+                Int count = length(read_lines(lines))COUNT_SUFFIX
+                Int shard = count + i
+            }
+            output {
+                Array[Int] shards = shard
+            }
+        }
+        """
+        results = {}
+        for label, suffix in (("per shard", " + 0 * i"), ("hoisted", "")):
+            doc = WDL.parse_document(wdl.replace("COUNT_SUFFIX", suffix))
+            doc.typecheck()
+            inputs = WDL.values_from_json(
+                {"n": shards, "lines": fn}, doc.workflow.available_inputs
+            )
+            _, outputs = self._timed(
+                f"scatter {shards} shards reading {lines} lines, {label}",
+                WDL.runtime.run_local_workflow,
+                doc.workflow,
+                inputs,
+                run_dir=os.path.join(self._dir, label.replace(" ", "_")),
+            )
+            results[label] = WDL.values_to_json(outputs)
+        self.assertEqual(results["per shard"], results["hoisted"])
+        self.assertEqual(results["hoisted"]["shards"], list(range(lines, lines + shards)))
+
+    def test_command_template(self):
+        # compiled command templates vs. evaluating & stripping the command expression
+        commands = [
+            "command <<<\n    echo ~{s}\n      indented ~{i}\n\n    ~{s} leading\n  >>>",
+            "command {\n    echo ${s}\n    ${sep=' ' a}\n  }",
+            "command <<<\n\t\tprintf '%s\\n' ~{s} \\\n\t\t  | wc -c\n>>>",
+            "command <<<\n    ~{s}\n    ~{empty}\n    ~{true='yes' false='no' b}\n    ~{default='d' n}\n  >>>",
+            "command <<<~{s} on the first line\n    and ~{i}>>>",
+            "command <<<\n      deep\n    ~{multi}\n    shallow\n  >>>",
+            "command <<<\n    ~{ws}x\n    y\n  >>>",
+            "command <<<>>>",
+            "command {}",
+            "command <<<\n    ~{'a' + n}~{s + '.txt'}\n    z\n  >>>",
+        ]
+        inputs = {
+            "s": "hello",
+            "i": 42,
+            "a": ["x", "y", "z"],
+            "empty": "",
+            "b": True,
+            "multi": "line1\nline2",
+            "ws": "  ",
+        }
+        for command in commands:
+            doc = WDL.parse_document(f"""
+            version 1.0
+            task t {{
+                input {{
+                    String s
+                    Int i
+                    Array[String] a
+                    String empty
+                    Boolean b
+                    String? n
+                    String multi
+                    String ws
+                }}
+                {command}
+            }}
+            """)
+            doc.typecheck()
+            task = doc.tasks[0]
+            env = WDL.values_from_json(inputs, task.available_inputs)
+            env = env.bind("n", WDL.Value.Null())
+            expected = WDL._util.strip_leading_whitespace(
+                task.command.eval(env, stdlib=WDL.StdLib.Base()).value
+            )[1]
+            template = WDL.runtime.task.CommandTemplate.of(task)
+            self.assertIs(WDL.runtime.task.CommandTemplate.of(task), template)
+            self.assertEqual(template.render(env, WDL.StdLib.Base()), expected, command)
+
+        # throughput
+        N = 10000
+        stdlib = WDL.StdLib.Base()
+        doc = WDL.parse_document(R"""
+        version 1.0
+        task t {
+            input {
+                String s
+                Int i
+                Array[String] a
+            }
+            command <<<
+                set -euxo pipefail
+                echo ~{s} > shard_~{i}.txt
+                tool --input ~{s} --shard ~{i} \
+                    ~{sep=' ' a} \
+                    --output out_~{i}.txt
+                wc -c out_~{i}.txt
+            >>>
+        }
+        """)
+        doc.typecheck()
+        task = doc.tasks[0]
+        envs = [
+            WDL.values_from_json(
+                {"s": f"file{i}.bam", "i": i, "a": ["x", "y"]}, task.available_inputs
+            )
+            for i in range(N)
+        ]
+        expected = self._timed(
+            f"eval & strip command x {N}",
+            lambda: [
+                WDL._util.strip_leading_whitespace(task.command.eval(env, stdlib=stdlib).value)[1]
+                for env in envs
+            ],
+        )
+        template = WDL.runtime.task.CommandTemplate.of(task)
+        ans = self._timed(
+            f"CommandTemplate.render x {N}", lambda: [template.render(env, stdlib) for env in envs]
+        )
+        self.assertEqual(ans, expected)
+
+    def test_env(self):
+        # Env.Bindings operations on a workflow-like environment: many call namespaces, each with
+        # several outputs
+        calls, outputs = 500, 20
+
+        def build():
+            env = WDL.Env.Bindings()
+            for i in range(calls):
+                call_env = WDL.Env.Bindings()
+                for j in range(outputs):
+                    call_env = call_env.bind(f"out{j}", i * outputs + j)
+                env = WDL.Env.merge(call_env.wrap_namespace(f"call{i}"), env)
+                # look up an earlier call's output, as a downstream call's inputs would
+                self.assertEqual(env[f"call{i // 2}.out{j}"], (i // 2) * outputs + j)
+            return env
+
+        env = self._timed(f"bind, wrap & merge {calls} x {outputs} bindings", build)
+        self.assertEqual(len(env), calls * outputs)
+        names = [f"call{i}.out{j}" for i in range(calls) for j in range(outputs)]
+        ans = self._timed(f"resolve x {len(names)}", lambda: [env[name] for name in names])
+        self.assertEqual(ans, list(range(calls * outputs)))
+        ans = self._timed(
+            f"has_namespace & enter_namespace x {calls}",
+            lambda: [
+                len(env.enter_namespace(f"call{i}"))
+                for i in range(calls)
+                if env.has_namespace(f"call{i}")
+            ],
+        )
+        self.assertEqual(ans, [outputs] * calls)
+        half = env.filter(lambda b: b.value % 2 == 0)
+        ans = self._timed("subtract", lambda: env.subtract(half))
+        self.assertEqual(len(ans), calls * outputs // 2)
+        self.assertTrue(all(b.value % 2 for b in ans))
+
+    def test_types(self):
+        # type equality & coercion checks, as performed repeatedly during typechecking
+        T, N = WDL.Type, 100000
+
+        def mk(file_type):
+            return T.Map((T.String(), T.Array(T.Pair(T.Int(), T.Array(file_type)))))
+
+        a, b, c = mk(T.File(optional=True)), mk(T.File(optional=True)), mk(T.String())
+        ans = self._timed(
+            f"fresh type == x {N}", lambda: all(mk(T.Int()) == mk(T.Int()) for _ in range(N))
+        )
+        self.assertTrue(ans)
+        ans = self._timed(f"coerces x {N}", lambda: all(a.coerces(c) for _ in range(N)))
+        self.assertTrue(ans)
+        # (hashing canonicalizes the types, after which == compares interned strings)
+        self.assertEqual(len({a, b, c}), 2)
+        self.assertTrue(self._timed(f"== x {N}", lambda: all(a == b for _ in range(N))))
+        self.assertFalse(self._timed(f"!= x {N}", lambda: any(a == c for _ in range(N))))
+
+        # typecheck a document with many calls
+        tasks, calls = 20, 200
+        src = ["version 1.0"]
+        for t in range(tasks):
+            src.append(
+                f"""
+                task t{t} {{
+                    input {{
+                        Array[File] files
+                        Map[String, Array[Int]] m
+                        Int n = 1
+                    }}
+                    command <<< echo ~{{sep=' ' files}} ~{{n}} >>>
+                    output {{
+                        Array[File] out = files
+                        Map[String, Array[Int]] m2 = m
+                        Array[Array[String]] aa = [prefix("x", files)]
+                    }}
+                }}"""
+            )
+        src.append("workflow w { input { Array[File] files \n Map[String, Array[Int]] m }")
+        for i in range(calls):
+            files = f"c{i - tasks}.out" if i >= tasks else "files"
+            src.append(f"call t{i % tasks} as c{i} {{ input: files = {files}, m = m, n = {i} }}")
+        src.append("}")
+        doc = WDL.parse_document("\n".join(src))
+        self._timed(f"typecheck {calls} calls", doc.typecheck)
+        self.assertEqual(len(doc.workflow.body), calls)